@@ -0,0 +1,65 @@
+"""Benchmarks the data each live chart sends to the browser, handing Altair
+every recording against downsampling them first. Altair embeds chart data as
+JSON records, so the payload is measured as those records.
+Usage: python3 benchmark_charts.py [plant counts...]"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from downsampling import downsample
+
+PLANT_COUNTS = [1, 10, 50]
+MINUTES = 24 * 60
+
+
+def make_plant_data(plant_count: int) -> pd.DataFrame:
+    """Creates a day of one-minute recordings for each plant, with the chart's plant details"""
+    taken = pd.date_range("2024-11-25", periods=MINUTES, freq="1min")
+    rows = plant_count * MINUTES
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "recording_id": np.arange(rows),
+        "recording_taken": np.tile(taken, plant_count),
+        "last_watered": np.tile(taken[::360].repeat(360), plant_count),
+        "soil_moisture": rng.uniform(0, 100, rows),
+        "temperature": rng.uniform(10, 30, rows),
+        "plant_id": np.repeat(np.arange(plant_count), MINUTES),
+        "plant_name": "Epipremnum Aureum",
+        "country_name": "Brazil",
+        "botanist_first_name": "Carl",
+        "botanist_last_name": "Linnaeus",
+    })
+
+
+def prepare_raw(plant_data: pd.DataFrame) -> str:
+    """The original chart data, every recording with every column"""
+    return plant_data.to_json(orient="records", date_format="iso")
+
+
+def prepare_downsampled(plant_data: pd.DataFrame) -> str:
+    """The chart data after downsampling"""
+    return downsample(plant_data, "soil_moisture").to_json(orient="records", date_format="iso")
+
+
+def measure(prepare, plant_data: pd.DataFrame) -> tuple:
+    """Returns the payload size in KiB and the time taken to prepare it in seconds"""
+    started = time.perf_counter()
+    payload = prepare(plant_data)
+    return len(payload) / 2 ** 10, time.perf_counter() - started
+
+
+def main(plant_counts: list) -> None:
+    """Prints the payload size and preparation time of one chart for each plant count"""
+    print(f"{'plants':>7} {'rows':>7} {'raw KiB':>9} {'raw prep':>9} "
+          f"{'points':>7} {'downsampled KiB':>16} {'downsampled prep':>17}")
+    for plant_count in plant_counts:
+        plant_data = make_plant_data(plant_count)
+        raw_size, raw_time = measure(prepare_raw, plant_data)
+        downsampled_size, downsampled_time = measure(prepare_downsampled, plant_data)
+        points = len(downsample(plant_data, "soil_moisture"))
+        print(f"{plant_count:>7} {len(plant_data):>7} {raw_size:>9.0f} {raw_time:>8.3f}s "
+              f"{points:>7} {downsampled_size:>16.0f} {downsampled_time:>16.3f}s")
+
+
+if __name__ == "__main__":
+    main([int(count) for count in sys.argv[1:]] or PLANT_COUNTS)
@@ -6,8 +6,9 @@ see live plant status data ad access historical data
 # pylint: disable=E1101
 # pylint: disable=R0801
 
+import io
 import os
-from datetime import datetime, time, date
+from datetime import datetime, time, date, timedelta
 import pymssql
 from dotenv import load_dotenv
 import boto3
@@ -16,8 +17,19 @@ import altair as alt
 import streamlit as st
 import pandas as pd
 
+from data_access import (RecordingRepository, LiveRecordings, RECORDING_COLUMNS,
+                         ROLLUP_COLUMNS, split_window)
+from downsampling import combine_points
+from enrichment import PlantDimensions
+from history import ArchiveQuery, DiskCache, HistoryFetcher, merge_csv_files
+
 load_dotenv()
 
+CHART_DIMENSIONS = ["plant_name", "country_name", "botanist_first_name", "botanist_last_name"]
+REFRESH_INTERVALS = {"Off": None, "Every 10 seconds": 10,
+                     "Every 30 seconds": 30, "Every minute": 60}
+RAW_DETAIL = timedelta(hours=2)
+
 
 def get_connection() -> None:
     """Gets connection to Microsoft SQL server"""
@@ -27,112 +39,140 @@ def get_connection() -> None:
                            password=os.getenv("DB_PASSWORD"))
 
 
+@st.cache_data(ttl=3600)
+def get_plant_ids() -> list[int]:
+    """Gets the IDs of every plant in the plant table"""
+    try:
+        conn = get_connection()
+    except pymssql.Error as e:
+        print(f"Error connecting to database: {e}")
+        return []
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT plant_id FROM {os.getenv('SCHEMA_NAME')}.plant ORDER BY plant_id")
+        return [row[0] for row in cursor.fetchall()]
+    except pymssql.Error as e:
+        print(f"Error executing query: {e}")
+        return []
+    finally:
+        conn.close()
+
+
+@st.cache_data(ttl=3600)
+def get_plant_dimensions() -> PlantDimensions:
+    """Gets the species, country and botanist of every plant"""
+    conn = get_connection()
+    try:
+        return PlantDimensions.load(conn.cursor(), os.getenv("SCHEMA_NAME"))
+    finally:
+        conn.close()
+
+
+def enrich_recordings(recordings: pd.DataFrame) -> pd.DataFrame:
+    """Joins the chart's plant details onto the recordings,
+    reloading the cached dimensions once if a plant is missing from them"""
+    dimensions = get_plant_dimensions()
+    if not set(recordings["plant_id"]) <= dimensions.lookup.keys():
+        get_plant_dimensions.clear()
+        dimensions = get_plant_dimensions()
+    return dimensions.enrich_frame(recordings, CHART_DIMENSIONS)
+
+
 def setup_filters() -> None:
     """Creates the time and plant filters and displays them to the dashboard"""
     start_time = st.time_input("Start Time", value=None)
     end_time = st.time_input("End Time", value=None)
 
-    plant_ids = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15,
-                 16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31,
-                 32, 33, 34, 35, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46, 47, 48, 49, 50]
+    plant_ids = get_plant_ids()
     selected_plants = st.multiselect(
-        "Selected Plant IDs", plant_ids, default=0)
+        "Selected Plant IDs", plant_ids, default=plant_ids[:1])
+    refresh = st.selectbox("Auto-refresh", list(REFRESH_INTERVALS))
+
+    return start_time, end_time, selected_plants, REFRESH_INTERVALS[refresh]
+
 
-    return start_time, end_time, selected_plants
+@st.cache_resource
+def get_repository() -> RecordingRepository:
+    """Gets the data-access layer shared by every rerun and session"""
+    return RecordingRepository(get_connection, os.getenv("SCHEMA_NAME"))
 
 
-def load_filtered_data(start_time: time, end_time: time, selected: list[int]) -> pd.DataFrame:
+def load_filtered_data(start_time: time, end_time: time, selected: list[int]) -> tuple:
     """
-    Filter the live data according to the time range and
-    plant choices made by the user
+    Filter today's live data according to the time range and
+    plant choices made by the user. Whole hours that ended more than
+    RAW_DETAIL ago are read from the hourly rollups, and only the rest
+    as recordings. Each session keeps the recent recordings it has
+    already loaded and only fetches the ones added since
     """
-    schema = os.getenv("SCHEMA_NAME")
-
     if start_time is None:
         start_time = time(0, 0, 0)
     if end_time is None:
         end_time = time(23, 59, 59)
-    if len(selected) == 1:
-        selected = (selected[0], selected[0])
-    if len(selected) == 0:
-        selected = (-1, -1)
-
-    query = f"""
-    SELECT
-        recording.recording_id,
-        recording.recording_taken,
-        recording.last_watered,
-        recording.soil_moisture,
-        recording.temperature,
-        plant.plant_id,
-        species.plant_name,
-        country.country_name,
-        botanist.botanist_first_name,
-        botanist.botanist_last_name
-    FROM {schema}.recording
-    JOIN {schema}.plant ON recording.plant_id = plant.plant_id
-    JOIN {schema}.species ON plant.species_id = species.species_id
-    JOIN {schema}.country ON plant.country_id = country.country_id
-    JOIN {schema}.botanist ON plant.botanist_id = botanist.botanist_id
-    WHERE CONVERT(TIME, recording.recording_taken) > '{start_time}'
-    AND CONVERT(TIME, recording.recording_taken) < '{end_time}'
-    AND plant.plant_id IN {tuple(selected)};
-    """
-
-    conn = get_connection()
-    if not conn:
-        return None
+    today = date.today()
+    start, end = datetime.combine(today, start_time), datetime.combine(today, end_time)
+    rollup_start, rollup_end = split_window(start, end, datetime.now(), RAW_DETAIL)
+    if "live_recordings" not in st.session_state:
+        st.session_state.live_recordings = LiveRecordings()
+
+    repository = get_repository()
+    frames = []
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
+        rollups = repository.load_rollups(selected, rollup_start, rollup_end)
+        if rollup_start < rollup_end:
+            if start < rollup_start:
+                frames.append(repository.load_recordings(selected, start, rollup_start))
+            start = rollup_end
+        frames.append(st.session_state.live_recordings.refresh(
+            repository, selected, start, end))
+    except pymssql.Error as e:
+        print(f"Error executing query: {e}")
+        return pd.DataFrame(columns=ROLLUP_COLUMNS), pd.DataFrame(columns=RECORDING_COLUMNS)
 
-        cursor.execute(query)
-        result = cursor.fetchall()
-        filtered_data = pd.DataFrame(result)
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return rollups, pd.DataFrame(columns=RECORDING_COLUMNS + CHART_DIMENSIONS)
+    return rollups, enrich_recordings(pd.concat(frames, ignore_index=True))
 
-        column_titles = [description[0]
-                         for description in cursor.description]
 
-        if not filtered_data.empty:
-            filtered_data.columns = column_titles
-            filtered_data['recording_taken'] = pd.to_datetime(
-                filtered_data['recording_taken'])
-        else:
-            filtered_data = pd.DataFrame(column_titles)
+def display_cache_stats() -> None:
+    """Displays how many live data queries were served from the cache"""
+    stats = get_repository().stats()
+    st.caption(f"Live data cache: {stats['hits']} hits, {stats['misses']} misses, "
+               f"{stats['entries']} cached results")
 
-        return filtered_data
 
-    except pymssql.Error as e:
-        print(f"Error executing query: {e}")
-        return None
-    finally:
-        conn.close()
-
-
-def generate_soil_moisture_time_chart(plant_data: pd.DataFrame) -> alt.Chart:
-    """Generates a soil moisture over time line graph"""
-    soil_moisture_plot = alt.Chart(plant_data).mark_line().encode(
+def generate_time_chart(rollups: pd.DataFrame, plant_data: pd.DataFrame, column: str,
+                        axis_title: str, title: str) -> alt.Chart:
+    """Generates a line graph of the mean of the column over time for each plant,
+    with a band from the min to the max, from the rollups and the downsampled recordings"""
+    points = combine_points(rollups, plant_data, column)
+    base = alt.Chart(points).encode(
         x=alt.X('recording_taken:T', axis=alt.Axis(title='Time of Recording')),
-        y=alt.Y('soil_moisture:Q', axis=alt.Axis(title='Soil Moisture (%)')),
         color=alt.Color('plant_id:N', legend=alt.Legend(title='Plant ID'))
-    ).properties(
-        title="Soil Moisture Over Time"
     )
+    band = base.mark_area(opacity=0.25).encode(
+        y=alt.Y('min:Q', axis=alt.Axis(title=axis_title)),
+        y2='max:Q'
+    )
+    line = base.mark_line().encode(y='mean:Q')
 
-    return soil_moisture_plot
+    return (band + line).properties(title=title)
 
 
-def generate_temperature_time_chart(plant_data: pd.DataFrame) -> alt.Chart:
-    """Generates a temperature over time line graph"""
-    temperature_plot = alt.Chart(plant_data).mark_line().encode(
-        x=alt.X('recording_taken:T', axis=alt.Axis(title='Time of Recording')),
-        y=alt.Y('temperature:Q', axis=alt.Axis(title='Temperature (°C)')),
-        color=alt.Color('plant_id:N', legend=alt.Legend(title='Plant ID'))
-    ).properties(
-        title="Temperature Over Time"
-    )
+def generate_soil_moisture_time_chart(rollups: pd.DataFrame,
+                                      plant_data: pd.DataFrame) -> alt.Chart:
+    """Generates a soil moisture over time line graph"""
+    return generate_time_chart(rollups, plant_data, 'soil_moisture',
+                               'Soil Moisture (%)', "Soil Moisture Over Time")
 
-    return temperature_plot
+
+def generate_temperature_time_chart(rollups: pd.DataFrame,
+                                    plant_data: pd.DataFrame) -> alt.Chart:
+    """Generates a temperature over time line graph"""
+    return generate_time_chart(rollups, plant_data, 'temperature',
+                               'Temperature (°C)', "Temperature Over Time")
 
 
 def display_title(title) -> None:
@@ -146,19 +186,69 @@ def display_plots(chart1: alt.Chart, chart2: alt.Chart) -> None:
     st.altair_chart(chart2, use_container_width=True)
 
 
-def download_from_s3(file_name):
-    """Download the given file from the long term S3 storage"""
-    access_key_id = os.getenv("ACCESS_KEY_ID")
-    secret_access_key = os.getenv("SECRET_ACCESS_KEY")
-    s3 = boto3.client('s3', aws_access_key_id=access_key_id, aws_secret_access_key=secret_access_key
-                      )
+@st.cache_resource
+def get_s3_client():
+    """Gets the S3 client shared by every rerun and session"""
+    return boto3.client('s3', aws_access_key_id=os.getenv("ACCESS_KEY_ID"),
+                        aws_secret_access_key=os.getenv("SECRET_ACCESS_KEY"))
+
+
+@st.cache_resource
+def get_history_fetcher() -> HistoryFetcher:
+    """Gets the historical data fetcher shared by every rerun and session"""
+    return HistoryFetcher(get_s3_client(), os.getenv("BUCKET_NAME"), DiskCache())
+
+
+@st.cache_resource
+def get_archive_query() -> ArchiveQuery:
+    """Gets the archive query engine shared by every rerun and session"""
+    return ArchiveQuery(get_s3_client(), os.getenv("BUCKET_NAME"))
+
+
+@st.cache_data(ttl=3600, max_entries=16)
+def load_historic_data(date_range: tuple[date, ...], selected: tuple[int, ...]) -> pd.DataFrame:
+    """Queries the archives for the selected plants' recordings over the days,
+    from midnight on the first up to midnight after the last"""
+    start = datetime.combine(date_range[0], time(0, 0, 0))
+    end = datetime.combine(date_range[-1] + timedelta(days=1), time(0, 0, 0))
     try:
-        s3.download_file(os.getenv("BUCKET_NAME"),
-                         file_name, file_name)
-        return file_name
+        return get_archive_query().query(list(selected), start, end)
     except (botocore.exceptions.NoCredentialsError, botocore.exceptions.ClientError) as e:
         print("boto3 error: ", e)
-        return None
+        return pd.DataFrame(columns=RECORDING_COLUMNS)
+
+
+def display_historic_charts(date_range: list[date], selected_plants: list[int]) -> None:
+    """Charts the archived data of the selected plants over the date range,
+    the same way as the live data"""
+    if not date_range or not st.button("Chart Historic Data"):
+        return
+    plant_data = load_historic_data(tuple(date_range), tuple(sorted(selected_plants)))
+    empty_rollups = pd.DataFrame(columns=ROLLUP_COLUMNS)
+    display_plots(generate_soil_moisture_time_chart(empty_rollups, plant_data),
+                  generate_temperature_time_chart(empty_rollups, plant_data))
+    stats = get_archive_query().stats()
+    st.caption(f"Archive queries: {stats['requests']} requests, "
+               f"{stats['bytes_read'] / 1024:.0f} KiB read")
+
+
+def download_from_s3(date_list: list[date]) -> dict:
+    """Downloads the given days from the long term S3 storage, in parallel,
+    returning the local files of each day that has an archive"""
+    try:
+        return get_history_fetcher().fetch(date_list)
+    except (botocore.exceptions.NoCredentialsError, botocore.exceptions.ClientError) as e:
+        print("boto3 error: ", e)
+        return {}
+
+
+@st.cache_data(max_entries=4)
+def get_merged_csv(paths: list[str]) -> bytes:
+    """Joins CSV files into one, keeping a single header row. The cached
+    file names include each object's ETag, so the result never goes stale"""
+    output = io.BytesIO()
+    merge_csv_files(paths, output)
+    return output.getvalue()
 
 
 def display_historic_download_title() -> None:
@@ -178,28 +268,36 @@ def create_download_button(date_range: list[date]) -> None:
     else:
         return None
 
-    formatted_dates = [date.strftime(
-        '%Y-%m-%d') + '_plant_monitor_data.csv' for date in date_list]
-
     if 'date_files' not in st.session_state:
-        st.session_state.date_files = []
+        st.session_state.date_files = {}
 
+    merge = st.checkbox("One file for the whole range", value=True)
     if st.button("Prepare Download"):
-        st.session_state.date_files = formatted_dates
-
-    if st.session_state.date_files:
         with st.spinner("Preparing file(s) for download..."):
-            for file_formatted in st.session_state.date_files:
-                file_name = os.path.basename(file_formatted)
-                result = download_from_s3(file_name)
-                if result is not None:
-                    with open(file_name, "rb") as file:
-                        st.download_button(
-                            label=f"Click to Download {file_name}",
-                            data=file,
-                            file_name=file_name,
-                            mime="text/csv"
-                        )
+            st.session_state.date_files = download_from_s3(list(date_list))
+
+    date_files = st.session_state.date_files
+    if not date_files:
+        return None
+    if merge:
+        days = sorted(date_files)
+        file_name = (f"{days[0].strftime('%Y-%m-%d')}_to_{days[-1].strftime('%Y-%m-%d')}"
+                     "_plant_monitor_data.csv")
+        downloads = {file_name: [path for day in days for path in date_files[day]]}
+    else:
+        downloads = {f"{day.strftime('%Y-%m-%d')}_plant_monitor_data.csv": paths
+                     for day, paths in sorted(date_files.items())}
+    try:
+        for file_name, paths in downloads.items():
+            st.download_button(
+                label=f"Click to Download {file_name}",
+                data=get_merged_csv(paths),
+                file_name=file_name,
+                mime="text/csv"
+            )
+    except FileNotFoundError:
+        st.session_state.date_files = {}
+        st.warning("The prepared files have left the local cache, please prepare them again.")
     return None
 
 
@@ -222,17 +320,24 @@ def create_date_range_selector() -> list[date]:
     return date_range
 
 
+def display_live_data(start: time, end: time, selected_plants: list[int]) -> None:
+    """Loads the live data and displays its charts"""
+    rollups, plant_data = load_filtered_data(start, end, selected_plants)
+    plot1 = generate_soil_moisture_time_chart(rollups, plant_data)
+    plot2 = generate_temperature_time_chart(rollups, plant_data)
+    display_plots(plot1, plot2)
+    display_cache_stats()
+
+
 def main():
     """The main logic of the dashboard"""
     display_title("LHNH PLant Monitoring Dashboard")
-    start, end, selected_plants = setup_filters()
-    plant_data = load_filtered_data(start, end, selected_plants)
-    plot1 = generate_soil_moisture_time_chart(plant_data)
-    plot2 = generate_temperature_time_chart(plant_data)
-    display_plots(plot1, plot2)
+    start, end, selected_plants, refresh_interval = setup_filters()
+    st.fragment(display_live_data, run_every=refresh_interval)(start, end, selected_plants)
     display_historic_download_title()
     dates_range = create_date_range_selector()
     create_download_button(dates_range)
+    display_historic_charts(dates_range, selected_plants)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,331 @@
+"""
+Data-access layer for the dashboard's live data. Keeps one database
+connection open between reruns and caches query results by plant set
+and time window, so switching filters back and forth is served from memory
+"""
+
+# pylint: disable=R0801
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Tuple
+
+import pandas as pd
+import pymssql
+
+CACHE_TTL = 60
+NEW_RECORDINGS_TTL = 5
+CACHE_SIZE = 32
+
+RECORDING_COLUMNS = ["recording_id", "recording_taken", "last_watered",
+                     "soil_moisture", "temperature", "plant_id"]
+ROLLUP_COLUMNS = ["plant_id", "recording_taken",
+                  "soil_moisture_count", "soil_moisture_sum",
+                  "soil_moisture_min", "soil_moisture_max",
+                  "temperature_count", "temperature_sum",
+                  "temperature_min", "temperature_max"]
+ROLLUP_INTERVAL = timedelta(hours=1)
+
+
+def build_recording_query(schema: str, plant_count: int) -> str:
+    """Returns a parameterised query for the recordings of plant_count plants
+    taken from one datetime up to but not including another, which can seek the
+    (plant_id, recording_taken) index"""
+    placeholders = ", ".join(["%s"] * plant_count)
+    return f"""
+    SELECT
+        recording.recording_id,
+        recording.recording_taken,
+        recording.last_watered,
+        recording.soil_moisture,
+        recording.temperature,
+        recording.plant_id
+    FROM {schema}.recording
+    WHERE recording.plant_id IN ({placeholders})
+    AND recording.recording_taken >= %s
+    AND recording.recording_taken < %s;
+    """
+
+
+def build_new_recordings_query(schema: str, plant_count: int) -> str:
+    """Returns a parameterised query for the recordings of plant_count plants
+    added after a recording_id and taken from one datetime up to but not including
+    another, which only reads the tail of the recording_id primary key"""
+    placeholders = ", ".join(["%s"] * plant_count)
+    return f"""
+    SELECT
+        recording.recording_id,
+        recording.recording_taken,
+        recording.last_watered,
+        recording.soil_moisture,
+        recording.temperature,
+        recording.plant_id
+    FROM {schema}.recording
+    WHERE recording.recording_id > %s
+    AND recording.plant_id IN ({placeholders})
+    AND recording.recording_taken >= %s
+    AND recording.recording_taken < %s;
+    """
+
+
+def build_rollup_query(schema: str, plant_count: int) -> str:
+    """Returns a parameterised query for the hourly rollups of plant_count plants
+    whose hour starts in a half-open range, which seeks the rollup primary key"""
+    placeholders = ", ".join(["%s"] * plant_count)
+    return f"""
+    SELECT
+        plant_id,
+        bucket_start AS recording_taken,
+        soil_moisture_count,
+        soil_moisture_sum,
+        soil_moisture_min,
+        soil_moisture_max,
+        temperature_count,
+        temperature_sum,
+        temperature_min,
+        temperature_max
+    FROM {schema}.recording_rollup_hour
+    WHERE plant_id IN ({placeholders})
+    AND bucket_start >= %s
+    AND bucket_start < %s;
+    """
+
+
+def build_max_id_query(schema: str) -> str:
+    """Returns the query for the highest recording_id, which reads one end of the primary key"""
+    return f"SELECT MAX(recording_id) FROM {schema}.recording;"
+
+
+def floor_hour(moment: datetime) -> datetime:
+    """Returns the start of the hour the moment is in"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def split_window(start: datetime, end: datetime, now: datetime, detail: timedelta) -> tuple:
+    """Returns the range of whole hours in the window that ended at least detail
+    before now, which are read from the hourly rollups. The range is empty
+    (its start is not before its end) when the window has no such hours"""
+    rollup_start = floor_hour(start)
+    if rollup_start < start:
+        rollup_start += ROLLUP_INTERVAL
+    rollup_end = min(floor_hour(now - detail), floor_hour(end))
+    return rollup_start, max(rollup_start, rollup_end)
+
+
+class RecordingRepository:  # pylint: disable=too-many-instance-attributes
+    """Loads recordings over a shared connection, reconnecting if it has gone stale.
+    Results are cached for ttl seconds, keeping the max_entries most recently used.
+    Streamlit serves each session on its own thread, so queries are serialised
+    with a lock"""
+
+    def __init__(self, connect, schema: str, ttl: float = CACHE_TTL,
+                 max_entries: int = CACHE_SIZE):
+        self.connect = connect
+        self.schema = schema
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.connection = None
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def is_alive(self) -> bool:
+        """Checks the connection still works with a cheap query"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            return True
+        except pymssql.Error:
+            return False
+
+    def get_connection(self):
+        """Returns the open connection, reconnecting if there is none or it is stale"""
+        if self.connection is not None and not self.is_alive():
+            print("Database connection is stale, reconnecting.")
+            self.close()
+        if self.connection is None:
+            self.connection = self.connect()
+        return self.connection
+
+    def close(self) -> None:
+        """Closes the connection, ignoring errors from one that is already broken"""
+        try:
+            self.connection.close()
+        except pymssql.Error:
+            pass
+        self.connection = None
+
+    def get_cached(self, key: tuple, ttl: float):
+        """Returns a cached result younger than ttl seconds, or None"""
+        entry = self.cache.get(key)
+        if entry is None or time.monotonic() - entry[0] > ttl:
+            return None
+        self.cache.move_to_end(key)
+        return entry[1]
+
+    def store(self, key: tuple, result) -> None:
+        """Caches a result, evicting the least recently used beyond max_entries"""
+        self.cache[key] = (time.monotonic(), result)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+
+    def query(self, query: str, params: tuple, columns=None) -> pd.DataFrame:
+        """Runs a recording or rollup query, dropping the connection if it fails"""
+        try:
+            cursor = self.get_connection().cursor()
+            cursor.execute(query, params)
+            recordings = pd.DataFrame(cursor.fetchall(), columns=columns or RECORDING_COLUMNS)
+        except pymssql.Error:
+            self.close()
+            raise
+        recordings["recording_taken"] = pd.to_datetime(recordings["recording_taken"])
+        return recordings
+
+    def cached_query(self, key: tuple, ttl: float, query: str, params: tuple,
+                     columns=None) -> pd.DataFrame:
+        """Returns the cached result for the key, running the query on a miss"""
+        with self.lock:
+            recordings = self.get_cached(key, ttl)
+            if recordings is not None:
+                self.hits += 1
+                return recordings
+            self.misses += 1
+            recordings = self.query(query, params, columns)
+            self.store(key, recordings)
+            return recordings
+
+    def load_recordings(self, plant_ids: list, start: datetime, end: datetime) -> pd.DataFrame:
+        """Returns the recordings of the plants taken from start up to but not including end,
+        from the cache when the same plants and window were asked for recently"""
+        plant_ids = sorted(set(plant_ids))
+        if not plant_ids:
+            return pd.DataFrame(columns=RECORDING_COLUMNS)
+        return self.cached_query(("window", tuple(plant_ids), start, end), self.ttl,
+                                 build_recording_query(self.schema, len(plant_ids)),
+                                 (*plant_ids, start, end))
+
+    def load_new_recordings(self, plant_ids: list, after_id: int,
+                            start: datetime, end: datetime) -> pd.DataFrame:
+        """Returns the recordings of the plants added after after_id and taken from start
+        up to but not including end. Results are only cached for NEW_RECORDINGS_TTL seconds,
+        which lets viewers refreshing the same plants share one query"""
+        plant_ids = sorted(set(plant_ids))
+        if not plant_ids:
+            return pd.DataFrame(columns=RECORDING_COLUMNS)
+        return self.cached_query(("new", tuple(plant_ids), after_id, start, end),
+                                 NEW_RECORDINGS_TTL,
+                                 build_new_recordings_query(self.schema, len(plant_ids)),
+                                 (after_id, *plant_ids, start, end))
+
+    def load_rollups(self, plant_ids: list, start: datetime, end: datetime) -> pd.DataFrame:
+        """Returns the hourly rollups of the plants for the hours starting
+        from start and before end, cached like the recordings"""
+        plant_ids = sorted(set(plant_ids))
+        if not plant_ids or start >= end:
+            return pd.DataFrame(columns=ROLLUP_COLUMNS)
+        return self.cached_query(("rollup", tuple(plant_ids), start, end), self.ttl,
+                                 build_rollup_query(self.schema, len(plant_ids)),
+                                 (*plant_ids, start, end), ROLLUP_COLUMNS)
+
+    def query_max_recording_id(self) -> int:
+        """Returns the highest recording_id in the table, or 0 if it is empty"""
+        try:
+            cursor = self.get_connection().cursor()
+            cursor.execute(build_max_id_query(self.schema))
+            return cursor.fetchone()[0] or 0
+        except pymssql.Error:
+            self.close()
+            raise
+
+    def load_window(self, plant_ids: list, start: datetime,
+                    end: datetime) -> Tuple[pd.DataFrame, int]:
+        """Returns the recordings of the plants taken from start up to but not including
+        end, and the table's highest recording_id read just before them. The two are
+        cached together, so however old the entry, the id never runs ahead of the
+        recordings and every later recording_id is still to be fetched"""
+        plant_ids = sorted(set(plant_ids))
+        if not plant_ids:
+            return pd.DataFrame(columns=RECORDING_COLUMNS), 0
+        key = ("live_window", tuple(plant_ids), start, end)
+        with self.lock:
+            entry = self.get_cached(key, self.ttl)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            max_id = self.query_max_recording_id()
+            entry = (self.query(build_recording_query(self.schema, len(plant_ids)),
+                                (*plant_ids, start, end)), max_id)
+            self.store(key, entry)
+            return entry
+
+    def stats(self) -> dict:
+        """Returns the cache hit and miss counts and the number of cached results"""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.cache)}
+
+
+class LiveRecordings:
+    """One viewer's live data, kept as a frame per plant along with the window it
+    covers and the recording_id it is complete up to. Refreshing only fetches
+    recordings added after that, and the whole window is only loaded for plants
+    that are new to the viewer or whose window has grown"""
+
+    def __init__(self):
+        self.frames = {}
+        self.windows = {}
+        self.last_ids = {}
+
+    def trim(self, plant_id: int, start: datetime, end: datetime) -> None:
+        """Drops a plant's recordings that are outside the window"""
+        frame = self.frames[plant_id]
+        self.frames[plant_id] = frame[(frame["recording_taken"] >= start)
+                                      & (frame["recording_taken"] < end)]
+
+    def store(self, plant_ids: list, recordings: pd.DataFrame, replace: bool,
+              floor_id: int = 0) -> None:
+        """Adds or replaces the plants' recordings from one query. Every plant
+        in the query is complete up to the highest recording_id it returned,
+        or up to floor_id, the table's highest recording_id before the query ran"""
+        last_id = int(recordings["recording_id"].max()) if not recordings.empty else 0
+        last_id = max(last_id, floor_id)
+        for plant_id in plant_ids:
+            new = recordings[(recordings["plant_id"] == plant_id)
+                             & (recordings["recording_id"] > self.last_ids.get(plant_id, 0))]
+            if replace:
+                self.frames[plant_id] = recordings[recordings["plant_id"] == plant_id]
+                self.last_ids[plant_id] = last_id
+            elif not new.empty:
+                self.frames[plant_id] = pd.concat([self.frames[plant_id], new])
+            self.last_ids[plant_id] = max(self.last_ids.get(plant_id, 0), last_id)
+
+    def refresh(self, repository: RecordingRepository, plant_ids: list,
+                start: datetime, end: datetime) -> pd.DataFrame:
+        """Brings the selected plants up to date and returns their recordings"""
+        plant_ids = sorted(set(plant_ids))
+        reload_ids, current_ids = [], []
+        for plant_id in plant_ids:
+            window = self.windows.get(plant_id)
+            if window is None or start < window[0] or end > window[1]:
+                reload_ids.append(plant_id)
+            else:
+                self.trim(plant_id, start, end)
+                current_ids.append(plant_id)
+            self.windows[plant_id] = (start, end)
+
+        if current_ids:
+            after_id = min(self.last_ids[plant_id] for plant_id in current_ids)
+            self.store(current_ids, repository.load_new_recordings(
+                current_ids, after_id, start, end), replace=False)
+        if reload_ids:
+            recordings, floor_id = repository.load_window(reload_ids, start, end)
+            self.store(reload_ids, recordings, replace=True, floor_id=floor_id)
+
+        frames = [self.frames[plant_id] for plant_id in plant_ids]
+        if not frames:
+            return pd.DataFrame(columns=RECORDING_COLUMNS)
+        return pd.concat(frames).sort_values("recording_id", ignore_index=True)
@@ -0,0 +1,66 @@
+"""
+Downsamples recordings before they are charted, so each chart gets a bounded
+number of points however many plants and hours are selected
+"""
+
+import pandas as pd
+
+CHART_POINTS = 2000
+MIN_POINTS_PER_PLANT = 24
+BUCKET_SIZES = [pd.Timedelta(size) for size in
+                ["1min", "2min", "5min", "10min", "15min", "30min", "1h", "2h", "6h", "1D"]]
+AGGREGATES = ["min", "mean", "max"]
+
+
+def choose_bucket(span: pd.Timedelta, points: int) -> pd.Timedelta:
+    """Returns the smallest bucket size that splits the span into no more than points buckets"""
+    for bucket in BUCKET_SIZES:
+        if span / bucket + 1 < points:
+            return bucket
+    return BUCKET_SIZES[-1]
+
+
+def downsample(recordings: pd.DataFrame, column: str,
+               chart_points: int = CHART_POINTS) -> pd.DataFrame:
+    """Buckets each plant's recordings of the column into the min, mean and max
+    per interval, sharing chart_points between the plants. The bucket size adapts
+    to the time the recordings span, which is at most the selected window.
+    Empty buckets are left out"""
+    if recordings.empty:
+        return pd.DataFrame(columns=["plant_id", "recording_taken"] + AGGREGATES)
+    taken = recordings["recording_taken"]
+    points = max(chart_points // recordings["plant_id"].nunique(), MIN_POINTS_PER_PLANT)
+    bucket = choose_bucket(taken.max() - taken.min(), points)
+    grouped = recordings.groupby([recordings["plant_id"], taken.dt.floor(bucket)])[column]
+    return grouped.agg(AGGREGATES).reset_index()
+
+
+def downsample_rollups(rollups: pd.DataFrame, column: str,
+                       chart_points: int = CHART_POINTS) -> pd.DataFrame:
+    """Combines each plant's hourly rollups of the column into the min, mean and max
+    per interval like downsample, in buckets of at least an hour. Means are
+    weighted by each hour's count, and hours without a reading are left out"""
+    if rollups.empty:
+        return pd.DataFrame(columns=["plant_id", "recording_taken"] + AGGREGATES)
+    taken = rollups["recording_taken"]
+    points = max(chart_points // rollups["plant_id"].nunique(), MIN_POINTS_PER_PLANT)
+    bucket = max(choose_bucket(taken.max() - taken.min(), points), pd.Timedelta("1h"))
+    values = rollups[[f"{column}_{name}" for name in ["count", "sum", "min", "max"]]]
+    grouped = values.astype(float).groupby([rollups["plant_id"], taken.dt.floor(bucket)])
+    combined = pd.DataFrame({"min": grouped[f"{column}_min"].min(),
+                             "count": grouped[f"{column}_count"].sum(),
+                             "sum": grouped[f"{column}_sum"].sum(),
+                             "max": grouped[f"{column}_max"].max()})
+    combined = combined[combined["count"] > 0]
+    combined["mean"] = combined["sum"] / combined["count"]
+    return combined[AGGREGATES].reset_index()
+
+
+def combine_points(rollups: pd.DataFrame, recordings: pd.DataFrame, column: str) -> pd.DataFrame:
+    """Returns the points for a chart of older hours read from the rollups
+    followed by recent recordings, each downsampled separately"""
+    points = [frame for frame in [downsample_rollups(rollups, column),
+                                  downsample(recordings, column)] if not frame.empty]
+    if not points:
+        return pd.DataFrame(columns=["plant_id", "recording_taken"] + AGGREGATES)
+    return pd.concat(points, ignore_index=True)
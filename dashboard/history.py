@@ -0,0 +1,268 @@
+"""
+Fetches the archived plant data for a range of days from S3. Days are
+downloaded in parallel over one shared client and kept in a local on-disk
+cache, so reruns and repeated ranges are served without going back to S3.
+Charts of past days are queried in place instead, reading only the byte
+ranges of the selected plants that the backup's manifest points to
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+HISTORY_WORKERS = int(os.getenv("HISTORY_WORKERS", "8"))
+HISTORY_CACHE_DIR = os.getenv("HISTORY_CACHE_DIR", "/tmp/plant_history")
+HISTORY_CACHE_BYTES = int(os.getenv("HISTORY_CACHE_BYTES", str(512 * 1024 * 1024)))
+HISTORY_COLUMNS = ["recording_id", "recording_taken", "last_watered",
+                   "soil_moisture", "temperature", "plant_id"]
+ARCHIVE_LAG = timedelta(days=1)
+MANIFEST_VERSION = 1
+
+
+def get_day_prefix(day: date) -> str:
+    """Returns the start of every backup key for the day"""
+    return f"{day.strftime('%Y-%m-%d')}_plant_monitor_data."
+
+
+def list_day_files(s3_client, bucket: str, day: date, backup_format: str = "csv") -> list:
+    """Returns the key, ETag and size of each of the day's archive files in the format,
+    which is either a single file or one file per partition of the backup"""
+    files = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=get_day_prefix(day)):
+        for item in page.get("Contents", []):
+            if item["Key"].endswith(f".{backup_format}"):
+                files.append((item["Key"], item["ETag"], item["Size"]))
+    return sorted(files)
+
+
+class DiskCache:
+    """Archive files on local disk, keyed by S3 key and ETag so a replaced object
+    is never served stale. Each read refreshes a file's modification time, and
+    the least recently used files are deleted once the total exceeds max_bytes"""
+
+    def __init__(self, directory: str = HISTORY_CACHE_DIR,
+                 max_bytes: int = HISTORY_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def get_path(self, key: str, etag: str) -> str:
+        """Returns where the version of the object with the ETag is cached"""
+        digest = hashlib.sha256(f"{key}\0{etag}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.cache")
+
+    def get(self, key: str, etag: str):
+        """Returns the path of the cached file, or None if it is not cached"""
+        path = self.get_path(key, etag)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, etag: str, download) -> str:
+        """Caches the file that download writes to the path it is given,
+        then evicts the least recently used files beyond max_bytes"""
+        path = self.get_path(key, etag)
+        partial = f"{path}.{threading.get_ident()}.partial"
+        try:
+            download(partial)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep: str = None) -> None:
+        """Deletes the least recently used files until the cache fits in max_bytes"""
+        with self.lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".cache"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    return
+                if path != keep:
+                    os.remove(path)
+                    total -= size
+
+
+class HistoryFetcher:
+    """Downloads the archive files for a range of days with up to workers
+    downloads in flight, sharing one S3 client, which is thread-safe"""
+
+    def __init__(self, s3_client, bucket: str, cache: DiskCache,
+                 workers: int = HISTORY_WORKERS):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.cache = cache
+        self.workers = workers
+
+    def fetch_file(self, key: str, etag: str) -> str:
+        """Returns the local path of an archive file, downloading it on a cache miss"""
+        path = self.cache.get(key, etag)
+        if path is not None:
+            return path
+        return self.cache.put(key, etag, lambda partial: self.s3_client.download_file(
+            self.bucket, key, partial))
+
+    def fetch(self, days: list) -> dict:
+        """Returns the local paths of each day's archive files, in key order.
+        Days without an archive are left out"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            listings = dict(zip(days, executor.map(
+                lambda day: list_day_files(self.s3_client, self.bucket, day), days)))
+            futures = {day: [executor.submit(self.fetch_file, key, etag)
+                             for key, etag, _ in files]
+                       for day, files in listings.items() if files}
+            return {day: [future.result() for future in day_futures]
+                    for day, day_futures in futures.items()}
+
+
+def merge_csv_files(paths: list, output) -> None:
+    """Writes the CSV files one after another to the binary output,
+    keeping only the first file's header row"""
+    for index, path in enumerate(paths):
+        with open(path, "rb") as csv_file:
+            header = csv_file.readline()
+            if index == 0:
+                output.write(header)
+            shutil.copyfileobj(csv_file, output)
+
+
+def get_manifest(s3_client, bucket: str, day: date):
+    """Returns the manifest of the day's backup, or None if it has none"""
+    try:
+        body = s3_client.get_object(Bucket=bucket,
+                                    Key=f"{get_day_prefix(day)}manifest.json")["Body"].read()
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(body)
+
+
+def manifest_matches(manifest: dict, plant_ids: set, start: datetime, end: datetime) -> bool:
+    """Uses the plant ids and recording_taken range of a whole archive
+    to decide whether it can hold matching rows"""
+    if "plant_ids" in manifest and not plant_ids & set(manifest["plant_ids"]):
+        return False
+    if manifest.get("min_recording_taken") and manifest.get("max_recording_taken"):
+        return (pd.Timestamp(manifest["max_recording_taken"]) >= start
+                and pd.Timestamp(manifest["min_recording_taken"]) < end)
+    return True
+
+
+def get_byte_ranges(entry: dict, plant_ids: set, start: datetime, end: datetime) -> list:
+    """Returns the byte ranges of the file that hold the plants' rows
+    in the time range, joining ranges that follow straight on from each other"""
+    byte_ranges = []
+    for plant_range in entry["plant_ranges"]:
+        if (plant_range["plant_id"] not in plant_ids
+                or pd.Timestamp(plant_range["max_recording_taken"]) < start
+                or pd.Timestamp(plant_range["min_recording_taken"]) >= end):
+            continue
+        if byte_ranges and byte_ranges[-1][1] == plant_range["start"]:
+            byte_ranges[-1] = (byte_ranges[-1][0], plant_range["end"])
+        else:
+            byte_ranges.append((plant_range["start"], plant_range["end"]))
+    return byte_ranges
+
+
+class ArchiveQuery:
+    """Queries the archived recordings of a set of plants over a time range
+    without downloading whole files. Each day's manifest says which byte ranges
+    of which files hold each plant's rows and when they were taken, so only
+    the ranges that can match are read, with up to workers range GETs in flight.
+    Archives whose manifest has no index, or a newer version than this
+    reader understands, are read whole"""
+
+    def __init__(self, s3_client, bucket: str, workers: int = HISTORY_WORKERS):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.workers = workers
+        self.requests = 0
+        self.bytes_read = 0
+        self.lock = threading.Lock()
+
+    def read(self, key: str, byte_range=None) -> bytes:
+        """Reads an object, or only the [start, end) byte range of it"""
+        if byte_range is None:
+            body = self.s3_client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        else:
+            body = self.s3_client.get_object(
+                Bucket=self.bucket, Key=key,
+                Range=f"bytes={byte_range[0]}-{byte_range[1] - 1}")["Body"].read()
+        with self.lock:
+            self.requests += 1
+            self.bytes_read += len(body)
+        return body
+
+    def plan_day(self, day: date, plant_ids: set, start: datetime, end: datetime) -> list:
+        """Returns the reads needed for one day's archive, as tuples of the key,
+        the byte range (None for the whole file) and the CSV columns if the
+        range has no header"""
+        manifest = get_manifest(self.s3_client, self.bucket, day)
+        if manifest is None or manifest.get("manifest_version", 0) > MANIFEST_VERSION:
+            return [(key, None, None) for key, _, _ in
+                    list_day_files(self.s3_client, self.bucket, day)]
+        if not manifest_matches(manifest, plant_ids, start, end):
+            return []
+        reads = []
+        for entry in manifest["files"]:
+            if entry["format"] != "csv":
+                continue
+            if "plant_ranges" not in entry:
+                reads.append((entry["key"], None, None))
+                continue
+            reads += [(entry["key"], byte_range, entry["columns"])
+                      for byte_range in get_byte_ranges(entry, plant_ids, start, end)]
+        return reads
+
+    def read_frame(self, key: str, byte_range, columns) -> pd.DataFrame:
+        """Reads one planned range into a DataFrame of the history columns"""
+        body = io.BytesIO(self.read(key, byte_range))
+        if columns is None:
+            return pd.read_csv(body, usecols=HISTORY_COLUMNS)
+        return pd.read_csv(body, header=None, names=columns, usecols=HISTORY_COLUMNS)
+
+    def query(self, plant_ids: list, start: datetime, end: datetime) -> pd.DataFrame:
+        """Returns the archived recordings of the plants taken from start up to but
+        not including end, in the same columns as the dashboard's live data. Each
+        backup is named after the day it ran, which can be the day after its
+        recordings were taken, so the archives up to ARCHIVE_LAG later are read"""
+        plant_ids = set(plant_ids)
+        if not plant_ids or start >= end:
+            return pd.DataFrame(columns=HISTORY_COLUMNS)
+        last_taken = end - timedelta(microseconds=1)
+        days = [day.date() for day in pd.date_range(start.date(),
+                                                    (last_taken + ARCHIVE_LAG).date())]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            reads = [read for day_reads in executor.map(
+                lambda day: self.plan_day(day, plant_ids, start, end), days)
+                     for read in day_reads]
+            frames = [frame for frame in executor.map(lambda read: self.read_frame(*read), reads)
+                      if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=HISTORY_COLUMNS)
+        recordings = pd.concat(frames, ignore_index=True)
+        recordings["recording_taken"] = pd.to_datetime(recordings["recording_taken"])
+        recordings = recordings[recordings["plant_id"].isin(plant_ids)
+                                & (recordings["recording_taken"] >= start)
+                                & (recordings["recording_taken"] < end)]
+        return recordings.sort_values(["plant_id", "recording_taken"], ignore_index=True)
+
+    def stats(self) -> dict:
+        """Returns how many requests were made and how many bytes they read"""
+        return {"requests": self.requests, "bytes_read": self.bytes_read}
@@ -0,0 +1,334 @@
+# pylint: skip-file
+from datetime import datetime, timedelta
+import pymssql
+import pytest
+import pandas as pd
+from data_access import RecordingRepository, LiveRecordings, RECORDING_COLUMNS, build_recording_query
+from data_access import ROLLUP_COLUMNS, split_window
+
+START = datetime(2024, 11, 25, 9)
+END = datetime(2024, 11, 25, 17)
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = []
+
+    def execute(self, query, params=()):
+        if self.connection.broken:
+            raise pymssql.OperationalError("connection lost")
+        if query == "SELECT 1":
+            self.result = [(1,)]
+            return
+        self.connection.queries.append((query, params))
+        if "MAX(recording_id)" in query:
+            self.result = [(42,)]
+            return
+        plant_ids = params[:-2]
+        if "recording_rollup_hour" in query:
+            self.result = [(plant_id, "2024-11-25 10:00:00", 60, 3000.0, 40.0, 60.0,
+                            60, 1200.0, 19.0, 21.0) for plant_id in plant_ids]
+            return
+        self.result = [(index, "2024-11-25 10:00:00", None, 50.0, 20.0, plant_id)
+                       for index, plant_id in enumerate(plant_ids)]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self):
+        self.queries = []
+        self.broken = False
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections():
+    return []
+
+
+@pytest.fixture
+def repository(connections):
+    def connect():
+        connections.append(FakeConnection())
+        return connections[-1]
+    return RecordingRepository(connect, "beta")
+
+
+def test_query_is_parameterised_with_a_range_predicate():
+    query = build_recording_query("beta", 3)
+
+    assert "recording.plant_id IN (%s, %s, %s)" in query
+    assert "recording.recording_taken >= %s" in query
+    assert "CONVERT" not in query
+
+
+def test_repeated_filters_are_served_from_the_cache(repository, connections):
+    first = repository.load_recordings([2, 1], START, END)
+    repository.load_recordings([3], START, END)
+    second = repository.load_recordings([1, 2, 1], START, END)
+
+    assert second is first
+    assert list(first["plant_id"]) == [1, 2]
+    assert str(first["recording_taken"].dtype).startswith("datetime64")
+    assert repository.stats() == {"hits": 1, "misses": 2, "entries": 2}
+    assert len(connections) == 1
+    assert connections[0].queries[0][1] == (1, 2, START, END)
+
+
+def test_results_expire_after_the_ttl(repository, connections):
+    repository.ttl = 0
+    repository.load_recordings([1], START, END)
+    repository.load_recordings([1], START, END)
+
+    assert repository.stats()["misses"] == 2
+    assert len(connections[0].queries) == 2
+
+
+def test_least_recently_used_result_is_evicted(repository):
+    repository.max_entries = 2
+    repository.load_recordings([1], START, END)
+    repository.load_recordings([2], START, END)
+    repository.load_recordings([1], START, END)
+    repository.load_recordings([3], START, END)
+
+    assert list(repository.cache) == [("window", (1,), START, END), ("window", (3,), START, END)]
+
+
+def test_no_plants_does_not_query(repository, connections):
+    assert repository.load_recordings([], START, END).empty
+    assert connections == []
+
+
+def test_stale_connection_is_replaced(repository, connections):
+    repository.load_recordings([1], START, END)
+    connections[0].broken = True
+
+    repository.load_recordings([2], START, END)
+
+    assert connections[0].closed
+    assert len(connections) == 2
+
+
+def test_failed_query_drops_the_connection(repository, connections):
+    repository.load_recordings([1], START, END)
+    repository.is_alive = lambda: True
+    connections[0].broken = True
+
+    with pytest.raises(pymssql.Error):
+        repository.load_recordings([2], START, END)
+
+    assert repository.connection is None
+    assert repository.stats()["entries"] == 1
+
+
+class FakeRepository:
+    def __init__(self):
+        self.table = pd.DataFrame(columns=RECORDING_COLUMNS)
+        self.calls = []
+
+    def add(self, plant_id, minute):
+        row = {"recording_id": len(self.table) + 1,
+               "recording_taken": pd.Timestamp(2024, 11, 25, 9) + pd.Timedelta(minutes=minute),
+               "last_watered": None, "soil_moisture": 50.0, "temperature": 20.0,
+               "plant_id": plant_id}
+        self.table = pd.concat([self.table, pd.DataFrame([row])], ignore_index=True)
+        self.table["recording_taken"] = pd.to_datetime(self.table["recording_taken"])
+
+    def select(self, plant_ids, start, end, after_id=0):
+        table = self.table
+        return table[table["plant_id"].isin(plant_ids) & (table["recording_id"] > after_id)
+                     & (table["recording_taken"] >= start) & (table["recording_taken"] < end)]
+
+    def load_recordings(self, plant_ids, start, end):
+        self.calls.append(("window", plant_ids))
+        return self.select(plant_ids, start, end)
+
+    def load_new_recordings(self, plant_ids, after_id, start, end):
+        self.calls.append(("new", plant_ids, after_id))
+        return self.select(plant_ids, start, end, after_id)
+
+    def load_window(self, plant_ids, start, end):
+        self.calls.append(("window", plant_ids))
+        return self.select(plant_ids, start, end), len(self.table)
+
+
+class TableCursor:
+    """Answers the repository's queries from a FakeRepository's table"""
+    def __init__(self, fake):
+        self.fake = fake
+        self.result = []
+
+    def execute(self, query, params=()):
+        if query == "SELECT 1" or "MAX(recording_id)" in query:
+            self.result = [(len(self.fake.table),)]
+            return
+        after_id = params[0] if "recording_id > %s" in query else 0
+        *plant_ids, start, end = params[1:] if after_id else params
+        recordings = self.fake.select(plant_ids, start, end, after_id)
+        self.result = list(recordings[RECORDING_COLUMNS].itertuples(index=False, name=None))
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+
+@pytest.fixture
+def fake_repository():
+    fake = FakeRepository()
+    for minute in range(1, 11):
+        fake.add(1, minute)
+        fake.add(2, minute)
+    return fake
+
+
+def test_refresh_only_fetches_new_recordings(fake_repository):
+    live = LiveRecordings()
+    live.refresh(fake_repository, [1, 2], START, END)
+    fake_repository.add(1, 30)
+    fake_repository.add(2, 31)
+
+    recordings = live.refresh(fake_repository, [1, 2], START, END)
+
+    assert fake_repository.calls == [("window", [1, 2]), ("new", [1, 2], 20)]
+    assert list(recordings["recording_id"]) == list(range(1, 23))
+
+
+def test_new_plant_is_loaded_while_others_are_refreshed(fake_repository):
+    fake_repository.add(3, 5)
+    live = LiveRecordings()
+    live.refresh(fake_repository, [1], START, END)
+
+    recordings = live.refresh(fake_repository, [1, 3], START, END)
+
+    assert fake_repository.calls[1:] == [("new", [1], 21), ("window", [3])]
+    assert set(recordings["plant_id"]) == {1, 3}
+    assert len(recordings) == 11
+
+
+def test_narrower_window_trims_without_reloading(fake_repository):
+    live = LiveRecordings()
+    live.refresh(fake_repository, [1], START, END)
+
+    recordings = live.refresh(fake_repository, [1], datetime(2024, 11, 25, 9, 4), END)
+
+    assert fake_repository.calls[1][0] == "new"
+    assert list(recordings["recording_taken"].dt.minute) == list(range(4, 11))
+
+
+def test_wider_window_reloads(fake_repository):
+    live = LiveRecordings()
+    live.refresh(fake_repository, [1], datetime(2024, 11, 25, 9, 4), END)
+
+    recordings = live.refresh(fake_repository, [1], START, END)
+
+    assert fake_repository.calls[1] == ("window", [1])
+    assert len(recordings) == 10
+
+
+def test_plant_without_recordings_gets_later_ones(fake_repository):
+    live = LiveRecordings()
+    assert live.refresh(fake_repository, [4], START, END).empty
+    fake_repository.add(4, 40)
+
+    recordings = live.refresh(fake_repository, [4], START, END)
+
+    assert list(recordings["plant_id"]) == [4]
+
+
+def test_plant_without_recordings_is_polled_incrementally(fake_repository):
+    live = LiveRecordings()
+    live.refresh(fake_repository, [4], START, END)
+    fake_repository.add(4, 40)
+
+    recordings = live.refresh(fake_repository, [4], START, END)
+
+    assert fake_repository.calls == [("window", [4]), ("new", [4], 20)]
+    assert list(recordings["recording_id"]) == [21]
+
+
+def test_window_is_cached_with_the_max_id_read_before_it(repository, connections):
+    first = repository.load_window([1], START, END)
+    second = repository.load_window([1], START, END)
+
+    assert second is first
+    assert first[1] == 42
+    assert [query for query, _ in connections[0].queries][0] == (
+        "SELECT MAX(recording_id) FROM beta.recording;")
+    assert len(connections[0].queries) == 2
+
+
+def test_stale_window_cache_does_not_skip_recordings(fake_repository):
+    connection = FakeConnection()
+    connection.cursor = lambda: TableCursor(fake_repository)
+    repository = RecordingRepository(lambda: connection, "beta")
+    LiveRecordings().refresh(repository, [1], START, END)
+    fake_repository.add(1, 30)
+
+    live = LiveRecordings()
+    live.refresh(repository, [1], START, END)
+    recordings = live.refresh(repository, [1], START, END)
+
+    assert list(recordings["recording_id"]) == [*range(1, 20, 2), 21]
+
+
+def test_split_window_reads_older_whole_hours_from_rollups():
+    now = datetime(2024, 11, 25, 15, 20)
+
+    assert split_window(datetime(2024, 11, 25, 9, 30), END, now, timedelta(hours=2)) == (
+        datetime(2024, 11, 25, 10), datetime(2024, 11, 25, 13))
+    assert split_window(START, datetime(2024, 11, 25, 11, 45), now, timedelta(hours=2)) == (
+        START, datetime(2024, 11, 25, 11))
+
+
+def test_split_window_is_empty_for_recent_windows():
+    now = datetime(2024, 11, 25, 15, 20)
+
+    rollup_start, rollup_end = split_window(datetime(2024, 11, 25, 12, 30), END, now,
+                                            timedelta(hours=2))
+
+    assert rollup_start == rollup_end
+
+
+def test_recording_on_the_rollup_seam_is_read_once(fake_repository):
+    fake_repository.add(3, 60)
+    fake_repository.add(3, 120)
+    start, now = datetime(2024, 11, 25, 9, 30), datetime(2024, 11, 25, 13)
+    rollup_start, rollup_end = split_window(start, END, now, timedelta(hours=2))
+
+    before = fake_repository.load_recordings([3], start, rollup_start)
+    after = LiveRecordings().refresh(fake_repository, [3], rollup_end, END)
+
+    assert (rollup_start, rollup_end) == (datetime(2024, 11, 25, 10), datetime(2024, 11, 25, 11))
+    assert before.empty
+    assert list(after["recording_taken"]) == [pd.Timestamp(2024, 11, 25, 11)]
+
+
+def test_rollups_are_queried_and_cached(repository, connections):
+    rollups = repository.load_rollups([2, 1], START, END)
+    repository.load_rollups([1, 2], START, END)
+
+    assert list(rollups.columns) == ROLLUP_COLUMNS
+    assert rollups["recording_taken"].dtype.kind == "M"
+    query, params = connections[0].queries[0]
+    assert "recording_rollup_hour" in query
+    assert params == (1, 2, START, END)
+    assert len(connections[0].queries) == 1
+
+
+def test_empty_rollup_range_does_not_query(repository, connections):
+    assert repository.load_rollups([1], START, START).empty
+    assert connections == []
@@ -0,0 +1,98 @@
+# pylint: skip-file
+import numpy as np
+import pandas as pd
+from downsampling import choose_bucket, downsample, MIN_POINTS_PER_PLANT
+from downsampling import downsample_rollups, combine_points
+
+
+def make_recordings(plant_count, minutes):
+    taken = pd.date_range("2024-11-25", periods=minutes, freq="1min")
+    return pd.DataFrame({
+        "plant_id": np.repeat(np.arange(plant_count), minutes),
+        "recording_taken": np.tile(taken, plant_count),
+        "soil_moisture": np.random.default_rng(0).uniform(0, 100, plant_count * minutes),
+    })
+
+
+def test_bucket_grows_with_the_span():
+    assert choose_bucket(pd.Timedelta("1h"), 120) == pd.Timedelta("1min")
+    assert choose_bucket(pd.Timedelta("1D"), 120) == pd.Timedelta("15min")
+    assert choose_bucket(pd.Timedelta("30D"), 120) == pd.Timedelta("1D")
+
+
+def test_each_chart_gets_a_bounded_number_of_points():
+    for plant_count in [1, 5, 50]:
+        points = downsample(make_recordings(plant_count, 1440), "soil_moisture", 2000)
+        per_plant = max(2000 // plant_count, MIN_POINTS_PER_PLANT)
+        assert points.groupby("plant_id").size().max() <= per_plant
+        assert len(points) <= max(2000, MIN_POINTS_PER_PLANT * plant_count)
+
+
+def test_buckets_keep_the_extremes_and_mean():
+    recordings = make_recordings(2, 1440)
+
+    points = downsample(recordings, "soil_moisture", 48)
+
+    for plant_id, plant in recordings.groupby("plant_id"):
+        plant_points = points[points["plant_id"] == plant_id]
+        assert plant_points["min"].min() == plant["soil_moisture"].min()
+        assert plant_points["max"].max() == plant["soil_moisture"].max()
+        assert np.isclose(plant_points["mean"].mean(), plant["soil_moisture"].mean())
+
+
+def test_short_window_is_not_downsampled():
+    recordings = make_recordings(3, 30)
+
+    points = downsample(recordings, "soil_moisture")
+
+    assert len(points) == 90
+    assert (points["min"] == points["max"]).all()
+
+
+def test_empty_recordings():
+    assert downsample(pd.DataFrame(columns=["plant_id", "recording_taken"]), "temperature").empty
+
+
+def make_rollups(recordings):
+    grouped = recordings.groupby([recordings["plant_id"],
+                                  recordings["recording_taken"].dt.floor("1h")])
+    rollups = grouped["soil_moisture"].agg(["count", "sum", "min", "max"])
+    rollups.columns = [f"soil_moisture_{name}" for name in rollups.columns]
+    return rollups.reset_index()
+
+
+def test_rollups_match_downsampled_recordings():
+    recordings = make_recordings(2, 1440)
+
+    from_rollups = downsample_rollups(make_rollups(recordings), "soil_moisture", 24)
+    from_recordings = downsample(recordings, "soil_moisture", 24)
+
+    assert len(from_rollups) == len(from_recordings)
+    for column in ["min", "mean", "max"]:
+        assert np.allclose(from_rollups[column], from_recordings[column])
+
+
+def test_hours_without_readings_are_left_out():
+    rollups = make_rollups(make_recordings(1, 120))
+    rollups.loc[0, ["soil_moisture_count", "soil_moisture_sum"]] = 0
+    rollups.loc[0, ["soil_moisture_min", "soil_moisture_max"]] = None
+
+    points = downsample_rollups(rollups, "soil_moisture")
+
+    assert len(points) == 1
+
+
+def test_combine_points_follow_rollups_with_recordings():
+    recordings = make_recordings(1, 240)
+    older = recordings["recording_taken"] < pd.Timestamp("2024-11-25 02:00")
+
+    points = combine_points(make_rollups(recordings[older]), recordings[~older], "soil_moisture")
+
+    assert len(points) == 2 + 120
+    assert points["recording_taken"].is_monotonic_increasing
+
+
+def test_combine_points_without_data():
+    empty = pd.DataFrame(columns=["plant_id", "recording_taken"])
+
+    assert combine_points(empty, empty, "soil_moisture").empty
@@ -0,0 +1,263 @@
+# pylint: skip-file
+import csv
+import io
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+import pytest
+from history import DiskCache, HistoryFetcher, list_day_files, merge_csv_files
+from history import ArchiveQuery, get_byte_ranges, HISTORY_COLUMNS, MANIFEST_VERSION
+
+BUCKET = "plant-backups"
+DAY = date(2024, 11, 25)
+
+
+def put(client, key, body):
+    client.put_object(Bucket=BUCKET, Key=key, Body=body)
+
+
+class CountingClient:
+    """Counts the downloads made through a real client"""
+
+    def __init__(self, client):
+        self.client = client
+        self.downloads = []
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def download_file(self, bucket, key, path):
+        with self.lock:
+            self.downloads.append(key)
+        self.client.download_file(bucket, key, path)
+
+
+def test_lists_single_and_partitioned_archives(s3_client):
+    put(s3_client, "2024-11-25_plant_monitor_data.part-0001.csv", b"a\n2\n")
+    put(s3_client, "2024-11-25_plant_monitor_data.part-0000.csv", b"a\n1\n")
+    put(s3_client, "2024-11-25_plant_monitor_data.part-0000.parquet", b"x")
+    put(s3_client, "2024-11-25_plant_monitor_data.manifest.json", b"{}")
+    put(s3_client, "2024-11-26_plant_monitor_data.csv", b"a\n3\n")
+
+    files = list_day_files(s3_client, BUCKET, DAY)
+
+    assert [key for key, _, _ in files] == ["2024-11-25_plant_monitor_data.part-0000.csv",
+                                            "2024-11-25_plant_monitor_data.part-0001.csv"]
+    assert [key for key, _, _ in list_day_files(s3_client, BUCKET, date(2024, 11, 26))] == [
+        "2024-11-26_plant_monitor_data.csv"]
+
+
+def test_fetch_downloads_every_day_once(s3_client, tmp_path):
+    for day in range(20, 26):
+        put(s3_client, f"2024-11-{day}_plant_monitor_data.csv", f"a\n{day}\n".encode())
+    client = CountingClient(s3_client)
+    fetcher = HistoryFetcher(client, BUCKET, DiskCache(str(tmp_path)), workers=4)
+    days = [date(2024, 11, day) for day in range(19, 26)]
+
+    files = fetcher.fetch(days)
+    fetcher.fetch(days)
+
+    assert sorted(files) == days[1:]
+    assert len(client.downloads) == 6
+    with open(files[DAY][0], "rb") as csv_file:
+        assert csv_file.read() == b"a\n25\n"
+
+
+def test_replaced_object_is_downloaded_again(s3_client, tmp_path):
+    put(s3_client, "2024-11-25_plant_monitor_data.csv", b"a\n1\n")
+    client = CountingClient(s3_client)
+    fetcher = HistoryFetcher(client, BUCKET, DiskCache(str(tmp_path)))
+    fetcher.fetch([DAY])
+
+    put(s3_client, "2024-11-25_plant_monitor_data.csv", b"a\n2\n")
+    files = fetcher.fetch([DAY])
+
+    assert len(client.downloads) == 2
+    with open(files[DAY][0], "rb") as csv_file:
+        assert csv_file.read() == b"a\n2\n"
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+
+    def write(size):
+        def download(path):
+            with open(path, "wb") as cache_file:
+                cache_file.write(b"x" * size)
+        return download
+
+    first = cache.put("first", "1", write(100))
+    second = cache.put("second", "1", write(100))
+    os.utime(first, (0, 0))
+    os.utime(second, (1, 1))
+    cache.get("first", "1")
+    cache.put("third", "1", write(100))
+
+    assert cache.get("first", "1") == first
+    assert cache.get("second", "1") is None
+    assert cache.get("third", "1") is not None
+
+
+def test_failed_download_is_not_cached(tmp_path):
+    cache = DiskCache(str(tmp_path))
+
+    def download(path):
+        with open(path, "wb") as cache_file:
+            cache_file.write(b"partial")
+        raise OSError("connection reset")
+
+    with pytest.raises(OSError):
+        cache.put("key", "1", download)
+
+    assert cache.get("key", "1") is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_merge_keeps_one_header(tmp_path):
+    paths = []
+    for index in range(3):
+        paths.append(str(tmp_path / f"{index}.csv"))
+        with open(paths[-1], "wb") as csv_file:
+            csv_file.write(f"a,b\r\n{index},{index}\r\n".encode())
+    output = io.BytesIO()
+
+    merge_csv_files(paths, output)
+
+    assert output.getvalue() == b"a,b\r\n0,0\r\n1,1\r\n2,2\r\n"
+
+
+ARCHIVE_COLUMNS = HISTORY_COLUMNS + ["plant_name"]
+TAKEN = datetime(2024, 11, 24, 12)
+
+
+def write_archive(client, key, rows):
+    """Uploads rows ordered by plant as CSV, returning its manifest entry
+    with the byte range of each plant's rows"""
+    text = io.StringIO(newline="")
+    writer = csv.writer(text)
+    writer.writerow(ARCHIVE_COLUMNS)
+    plant_ranges = []
+    for plant_id in sorted({row[5] for row in rows}):
+        plant_rows = [row for row in rows if row[5] == plant_id]
+        start = len(text.getvalue().encode())
+        writer.writerows(plant_rows)
+        plant_ranges.append({"plant_id": plant_id, "start": start,
+                             "end": len(text.getvalue().encode()),
+                             "row_count": len(plant_rows),
+                             "min_recording_taken": str(min(row[1] for row in plant_rows)),
+                             "max_recording_taken": str(max(row[1] for row in plant_rows))})
+    put(client, key, text.getvalue().encode())
+    return {"key": key, "format": "csv", "row_count": len(rows),
+            "columns": ARCHIVE_COLUMNS, "plant_ranges": plant_ranges}
+
+
+def make_archive_rows(plant_count, minutes):
+    return [(index, TAKEN + timedelta(minutes=index // plant_count), None,
+             50.0, 20.0, index % plant_count, "cactus")
+            for index in range(plant_count * minutes)]
+
+
+@pytest.fixture
+def archive(s3_client):
+    entry = write_archive(s3_client, "2024-11-25_plant_monitor_data.csv", make_archive_rows(10, 60))
+    put(s3_client, "2024-11-25_plant_monitor_data.manifest.json",
+        json.dumps({"manifest_version": MANIFEST_VERSION, "status": "archived",
+                    "plant_ids": list(range(10)), "min_recording_taken": str(TAKEN),
+                    "max_recording_taken": str(TAKEN + timedelta(minutes=59)),
+                    "files": [entry]}).encode())
+    return entry
+
+
+def test_byte_ranges_are_pruned_and_joined(archive):
+    end = TAKEN + timedelta(hours=1)
+
+    assert len(get_byte_ranges(archive, {2, 3, 4}, TAKEN, end)) == 1
+    assert len(get_byte_ranges(archive, {2, 4}, TAKEN, end)) == 2
+    assert get_byte_ranges(archive, {2}, end, end + timedelta(hours=1)) == []
+
+
+def test_query_reads_only_the_selected_plants(s3_client, archive):
+    query = ArchiveQuery(s3_client, BUCKET)
+
+    recordings = query.query([3], TAKEN, TAKEN + timedelta(minutes=30))
+
+    assert list(recordings.columns) == HISTORY_COLUMNS
+    assert set(recordings["plant_id"]) == {3}
+    assert len(recordings) == 30
+    assert recordings["recording_taken"].dtype.kind == "M"
+    plant_range = archive["plant_ranges"][3]
+    assert query.stats()["bytes_read"] == plant_range["end"] - plant_range["start"]
+    assert query.stats()["requests"] == 1
+
+
+def test_query_includes_start_and_excludes_end(s3_client):
+    midnight = datetime(2024, 11, 24)
+    rows = [(1, midnight, None, 50.0, 20.0, 1, "cactus"),
+            (2, midnight + timedelta(days=1) - timedelta(seconds=1), None, 50.0, 20.0, 1, "cactus"),
+            (3, midnight + timedelta(days=1), None, 50.0, 20.0, 1, "cactus")]
+    entry = write_archive(s3_client, "2024-11-25_plant_monitor_data.csv", rows)
+    put(s3_client, "2024-11-25_plant_monitor_data.manifest.json",
+        json.dumps({"manifest_version": MANIFEST_VERSION, "status": "archived",
+                    "plant_ids": [1], "min_recording_taken": str(rows[0][1]),
+                    "max_recording_taken": str(rows[-1][1]), "files": [entry]}).encode())
+    query = ArchiveQuery(s3_client, BUCKET)
+
+    recordings = query.query([1], midnight, midnight + timedelta(days=1))
+
+    assert list(recordings["recording_id"]) == [1, 2]
+
+
+def test_query_skips_archives_outside_the_time_range(s3_client, archive):
+    query = ArchiveQuery(s3_client, BUCKET)
+
+    recordings = query.query([3], TAKEN - timedelta(days=2), TAKEN - timedelta(days=1))
+
+    assert recordings.empty
+    assert query.stats()["requests"] == 0
+
+
+def test_query_reads_archives_without_a_manifest_whole(s3_client):
+    rows = make_archive_rows(2, 10)
+    text = io.StringIO(newline="")
+    csv.writer(text).writerows([ARCHIVE_COLUMNS] + rows)
+    put(s3_client, "2024-11-24_plant_monitor_data.csv", text.getvalue().encode())
+    query = ArchiveQuery(s3_client, BUCKET)
+
+    recordings = query.query([1], TAKEN - timedelta(minutes=1), TAKEN + timedelta(hours=1))
+
+    assert list(recordings["recording_id"]) == [row[0] for row in rows if row[5] == 1]
+
+
+def test_query_combines_partitioned_archives(s3_client):
+    rows = make_archive_rows(4, 20)
+    entries = [write_archive(s3_client, f"2024-11-25_plant_monitor_data.part-{index:04d}.csv",
+                             [row for row in rows if row[5] // 2 == index])
+               for index in range(2)]
+    put(s3_client, "2024-11-25_plant_monitor_data.manifest.json",
+        json.dumps({"status": "archived", "files": entries}).encode())
+    query = ArchiveQuery(s3_client, BUCKET)
+
+    recordings = query.query([1, 2], TAKEN - timedelta(minutes=1), TAKEN + timedelta(hours=1))
+
+    assert len(recordings) == 40
+    assert query.stats()["requests"] == 2
+
+
+def test_query_skips_archives_without_the_plants(s3_client, archive):
+    query = ArchiveQuery(s3_client, BUCKET)
+
+    assert query.query([42], TAKEN, TAKEN + timedelta(hours=1)).empty
+    assert query.stats()["requests"] == 0
+
+
+def test_newer_manifest_versions_are_read_whole(s3_client, archive):
+    put(s3_client, "2024-11-25_plant_monitor_data.manifest.json",
+        json.dumps({"manifest_version": MANIFEST_VERSION + 1}).encode())
+    query = ArchiveQuery(s3_client, BUCKET)
+
+    recordings = query.query([3], TAKEN, TAKEN + timedelta(minutes=30))
+
+    assert len(recordings) == 30
+    assert query.stats()["bytes_read"] > archive["plant_ranges"][3]["end"]
@@ -0,0 +1,243 @@
+"""Builds and validates the manifest written next to each day's archive. It tells
+readers what is in each file, so they can skip files and jump to a plant's rows
+without downloading everything first"""
+
+from array import array
+from datetime import datetime
+
+import numpy as np
+
+MANIFEST_VERSION = 1
+STATUSES = ("exported", "archived")
+MANIFEST_FIELDS = {
+    "manifest_version": int,
+    "status": str,
+    "exported_at": str,
+    "min_recording_id": int,
+    "max_recording_id": int,
+    "row_count": int,
+    "deleted_count": int,
+    "min_recording_taken": (str, type(None)),
+    "max_recording_taken": (str, type(None)),
+    "plant_ids": list,
+    "recording_id_runs": list,
+    "column_stats": dict,
+    "partitions": int,
+    "files": list,
+}
+FILE_FIELDS = {"key": str, "format": str, "row_count": int, "column_stats": dict}
+RANGE_FIELDS = ("plant_id", "start", "end", "first_row", "row_count",
+                "min_recording_taken", "max_recording_taken")
+ROW_GROUP_FIELDS = ("id", "row_count", "plant_ids", "min_recording_taken",
+                    "max_recording_taken")
+
+
+def to_json_value(value):
+    """Returns datetimes as they are written in the CSV, and anything else as it is"""
+    return str(value) if isinstance(value, datetime) else value
+
+
+class ColumnStats:
+    """The min, max and null count of every column of the rows written to an archive"""
+
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        self.mins = [None] * len(self.columns)
+        self.maxes = [None] * len(self.columns)
+        self.null_counts = [0] * len(self.columns)
+
+    def update(self, rows: list) -> None:
+        """Adds a batch of rows to the statistics, a column at a time"""
+        for index, values in enumerate(zip(*rows)):
+            present = [value for value in values if value is not None]
+            self.null_counts[index] += len(values) - len(present)
+            if present:
+                self.add_extremes(index, min(present), max(present))
+
+    def add_extremes(self, index: int, low, high) -> None:
+        """Widens a column's min and max to include low and high"""
+        if self.mins[index] is None or low < self.mins[index]:
+            self.mins[index] = low
+        if self.maxes[index] is None or high > self.maxes[index]:
+            self.maxes[index] = high
+
+    def merge(self, other: "ColumnStats") -> None:
+        """Adds the statistics of another archive file with the same columns"""
+        for index in range(len(self.columns)):
+            self.null_counts[index] += other.null_counts[index]
+            if other.mins[index] is not None:
+                self.add_extremes(index, other.mins[index], other.maxes[index])
+
+    def get_extremes(self, column: str) -> tuple:
+        """Returns the min and max of a column, or Nones if it is not in the archive"""
+        if column not in self.columns:
+            return None, None
+        index = self.columns.index(column)
+        return self.mins[index], self.maxes[index]
+
+    def to_dict(self) -> dict:
+        """Returns the statistics as they are written to the manifest"""
+        return {column: {"min": to_json_value(low), "max": to_json_value(high),
+                         "null_count": null_count}
+                for column, low, high, null_count
+                in zip(self.columns, self.mins, self.maxes, self.null_counts)}
+
+
+class ArchiveIndex:  # pylint: disable=too-few-public-methods
+    """What an export learns about one archive part while writing it: the column
+    statistics, the plant ids and recording ids present, where each plant's rows
+    are in the CSV, and the plants and time range of each Parquet row group"""
+
+    def __init__(self):
+        self.column_stats = None
+        self.plant_ids = set()
+        self.recording_ids = array("q")
+        self.plant_ranges = []
+        self.row_groups = []
+
+    def update(self, columns: list, rows: list) -> None:
+        """Adds a batch of the exported rows"""
+        if self.column_stats is None:
+            self.column_stats = ColumnStats(columns)
+        self.column_stats.update(rows)
+        if "plant_id" in columns:
+            plant_index = columns.index("plant_id")
+            self.plant_ids.update(row[plant_index] for row in rows)
+        if "recording_id" in columns:
+            id_index = columns.index("recording_id")
+            self.recording_ids.extend(row[id_index] for row in rows)
+
+
+def get_id_runs(indexes: list) -> list:
+    """Returns the recording ids of every archive part as [first, last] runs
+    of consecutive ids, so the rows that were exported can be deleted by range
+    without touching any id the export did not see"""
+    ids = np.unique(np.concatenate(
+        [np.frombuffer(index.recording_ids, dtype=np.int64) for index in indexes]
+        + [np.empty(0, dtype=np.int64)]))
+    if ids.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(ids) != 1)
+    firsts = np.concatenate(([ids[0]], ids[breaks + 1]))
+    lasts = np.concatenate((ids[breaks], [ids[-1]]))
+    return [[int(first), int(last)] for first, last in zip(firsts, lasts)]
+
+
+def build_manifest(id_range: tuple, files: list, indexes: list) -> dict:
+    """Returns the manifest of an exported slice. The files are the manifest entries
+    of every archive file and the indexes are those of every archive part"""
+    column_stats = None
+    plant_ids = set()
+    for index in indexes:
+        plant_ids |= index.plant_ids
+        if index.column_stats is None:
+            continue
+        if column_stats is None:
+            column_stats = ColumnStats(index.column_stats.columns)
+        column_stats.merge(index.column_stats)
+    first_format = files[0]["format"] if files else None
+    min_taken, max_taken = (column_stats.get_extremes("recording_taken")
+                            if column_stats else (None, None))
+    return {
+        "manifest_version": MANIFEST_VERSION,
+        "status": "exported",
+        "exported_at": datetime.now().isoformat(timespec="seconds"),
+        "min_recording_id": id_range[0],
+        "max_recording_id": id_range[1],
+        "row_count": sum(entry["row_count"] for entry in files
+                         if entry["format"] == first_format),
+        "deleted_count": 0,
+        "min_recording_taken": to_json_value(min_taken),
+        "max_recording_taken": to_json_value(max_taken),
+        "plant_ids": sorted(plant_ids),
+        "recording_id_runs": get_id_runs(indexes),
+        "column_stats": column_stats.to_dict() if column_stats else {},
+        "partitions": len({entry["key"].rsplit(".", 1)[0] for entry in files}),
+        "files": files
+    }
+
+
+def check_fields(item: dict, fields: dict, name: str) -> list:
+    """Returns a problem for every field that is missing or has the wrong type"""
+    problems = []
+    for field, field_type in fields.items():
+        if field not in item:
+            problems.append(f"{name} is missing {field}")
+        elif not isinstance(item[field], field_type) or isinstance(item[field], bool):
+            problems.append(f"{name} has a {type(item[field]).__name__} {field}")
+    return problems
+
+
+def check_file(entry: dict, plant_ids: set) -> list:
+    """Returns the problems with one file's manifest entry"""
+    name = entry.get("key", "a file")
+    problems = check_fields(entry, FILE_FIELDS, name)
+    if problems:
+        return problems
+    for column, stats in entry["column_stats"].items():
+        if not 0 <= stats.get("null_count", -1) <= entry["row_count"]:
+            problems.append(f"{name} has an invalid null_count for {column}")
+    if entry["format"] == "csv":
+        ranges = entry.get("plant_ranges", [])
+        if any(field not in plant_range for plant_range in ranges for field in RANGE_FIELDS):
+            return problems + [f"{name} has an incomplete plant range"]
+        if ranges and sum(plant_range["row_count"] for plant_range in ranges) != entry["row_count"]:
+            problems.append(f"{name} plant ranges do not add up to its row_count")
+        for previous, plant_range in zip(ranges, ranges[1:]):
+            if plant_range["start"] < previous["end"]:
+                problems.append(f"{name} has overlapping plant ranges")
+        problems += [f"{name} has rows of plant {plant_range['plant_id']} not in plant_ids"
+                     for plant_range in ranges if plant_range["plant_id"] not in plant_ids]
+    if entry["format"] == "parquet":
+        row_groups = entry.get("row_groups", [])
+        if any(field not in row_group for row_group in row_groups for field in ROW_GROUP_FIELDS):
+            return problems + [f"{name} has an incomplete row group"]
+        if sum(row_group["row_count"] for row_group in row_groups) != entry["row_count"]:
+            problems.append(f"{name} row groups do not add up to its row_count")
+    return problems
+
+
+def check_id_runs(manifest: dict) -> list:
+    """Returns the problems with the runs of exported recording ids, which must be
+    ordered, inside the id range and cover exactly row_count ids"""
+    runs = manifest["recording_id_runs"]
+    if any(not isinstance(run, list) or len(run) != 2 or run[0] > run[1] for run in runs):
+        return ["The manifest has an invalid recording id run"]
+    problems = []
+    if any(previous[1] >= run[0] for previous, run in zip(runs, runs[1:])):
+        problems.append("The manifest's recording id runs are out of order")
+    if runs and (runs[0][0] < manifest["min_recording_id"]
+                 or runs[-1][1] > manifest["max_recording_id"]):
+        problems.append("The manifest's recording id runs are outside its id range")
+    if sum(last - first + 1 for first, last in runs) != manifest["row_count"]:
+        problems.append("The manifest's recording id runs do not add up to its row_count")
+    return problems
+
+
+def validate_manifest(manifest: dict) -> None:
+    """Raises a ValueError listing everything wrong with a manifest"""
+    if not isinstance(manifest, dict):
+        raise ValueError("The manifest is not an object")
+    if manifest.get("manifest_version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version {manifest.get('manifest_version')}")
+    problems = check_fields(manifest, MANIFEST_FIELDS, "The manifest")
+    if problems:
+        raise ValueError("; ".join(problems))
+    if manifest["status"] not in STATUSES:
+        problems.append(f"The manifest has an unknown status {manifest['status']}")
+    if manifest["min_recording_id"] > manifest["max_recording_id"]:
+        problems.append("The manifest's recording id range is reversed")
+    if (manifest["min_recording_taken"] and manifest["max_recording_taken"]
+            and manifest["min_recording_taken"] > manifest["max_recording_taken"]):
+        problems.append("The manifest's recording_taken range is reversed")
+    problems += check_id_runs(manifest)
+    plant_ids = set(manifest["plant_ids"])
+    for entry in manifest["files"]:
+        problems += check_file(entry, plant_ids)
+    for backup_format in {entry.get("format") for entry in manifest["files"]}:
+        row_count = sum(entry.get("row_count", 0) for entry in manifest["files"]
+                        if entry.get("format") == backup_format)
+        if row_count != manifest["row_count"]:
+            problems.append(f"The {backup_format} files do not add up to the row_count")
+    if problems:
+        raise ValueError("; ".join(problems))
@@ -0,0 +1,324 @@
+"""Benchmarks the backup export against a local SQLite stand-in
+for the plants database, recording peak memory and rows per second,
+then compares the size and read time of the CSV and Parquet formats,
+times the partitioned export with a growing number of workers,
+and compares joining the plant dimensions in SQL against joining them in memory.
+Usage: python3 benchmark_backup.py [row counts...]"""
+
+# pylint: disable=C0413
+# pylint: disable=W0613
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import csv
+from datetime import datetime
+
+import pandas as pd
+
+os.environ["SCHEMA_NAME"] = "beta"
+
+import extract_from_database as backup
+from enrichment import EnrichingCursor, PlantDimensions
+from parquet_backup import read_backup
+
+ROW_COUNTS = [10000, 1000000, 10000000]
+PLANT_COUNT = 51
+STAND_IN_QUERY = backup.QUERY.replace("%s", "?")
+JOIN_QUERY = """
+SELECT
+    recording.recording_id, recording.recording_taken, recording.last_watered,
+    recording.soil_moisture, recording.temperature, plant.plant_id, species.plant_name,
+    country.country_name, botanist.botanist_first_name, botanist.botanist_last_name,
+    botanist.botanist_email, botanist.botanist_phone_number
+FROM beta.recording
+JOIN beta.plant ON recording.plant_id = plant.plant_id
+JOIN beta.species ON plant.species_id = species.species_id
+JOIN beta.country ON plant.country_id = country.country_id
+JOIN beta.botanist ON plant.botanist_id = botanist.botanist_id
+WHERE recording.recording_id BETWEEN ? AND ?
+ORDER BY recording.plant_id, recording.recording_taken;
+"""
+ALL_RECORDINGS = (0, 2 ** 62)
+PARTITION_COUNT = 8
+WORKER_COUNTS = [1, 2, 4, 8]
+FETCH_ROUND_TRIP = 0.002
+ROW_COST = 0.00002
+
+
+class StandInCursor:
+    """Cursor that converts pymssql placeholders and, for every fetch, sleeps for
+    a round trip plus the time SQL Server would take to scan and send the rows"""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self.cursor = cursor
+
+    @property
+    def description(self):
+        """The columns of the executed query"""
+        return self.cursor.description
+
+    def execute(self, query: str, params: tuple = ()) -> None:
+        """Runs a query"""
+        self.cursor.execute(query.replace("%s", "?"), params)
+
+    def fetchone(self):
+        """Fetches one row after one simulated round trip"""
+        time.sleep(FETCH_ROUND_TRIP)
+        return self.cursor.fetchone()
+
+    def fetchall(self) -> list:
+        """Fetches every row after one simulated round trip"""
+        time.sleep(FETCH_ROUND_TRIP)
+        return self.cursor.fetchall()
+
+    def fetchmany(self, size: int) -> list:
+        """Fetches a batch after simulating the scan and the round trip"""
+        rows = self.cursor.fetchmany(size)
+        time.sleep(FETCH_ROUND_TRIP + ROW_COST * len(rows))
+        return rows
+
+
+class StandInConnection:
+    """Connection to the stand-in with simulated latency"""
+
+    def __init__(self, path: str):
+        self.connection = connect_stand_in(path)
+
+    def cursor(self) -> StandInCursor:
+        """Gets cursor"""
+        return StandInCursor(self.connection.cursor())
+
+    def close(self) -> None:
+        """Closes the connection"""
+        self.connection.close()
+
+
+class DiscardingS3Client:
+    """S3 client that accepts every upload and keeps nothing,
+    so the benchmark only measures reading and writing the export"""
+
+    def put_object(self, **kwargs) -> dict:
+        """Accepts a whole object"""
+        return {}
+
+    def create_multipart_upload(self, **kwargs) -> dict:
+        """Starts a multipart upload"""
+        return {"UploadId": "benchmark"}
+
+    def upload_part(self, **kwargs) -> dict:
+        """Accepts a part"""
+        return {"ETag": str(kwargs["PartNumber"])}
+
+    def complete_multipart_upload(self, **kwargs) -> dict:
+        """Completes a multipart upload"""
+        return {}
+
+    def abort_multipart_upload(self, **kwargs) -> dict:
+        """Aborts a multipart upload"""
+        return {}
+
+    def delete_objects(self, **kwargs) -> dict:
+        """Deletes uploaded parts"""
+        return {}
+
+
+def create_stand_in_database(path: str, row_count: int) -> None:
+    """Creates a SQLite database with the plants schema and row_count recordings"""
+    conn = sqlite3.connect(path)
+    conn.executescript(f"""
+    CREATE TABLE country (country_id INTEGER PRIMARY KEY, country_code TEXT, country_name TEXT);
+    CREATE TABLE species (species_id INTEGER PRIMARY KEY, plant_name TEXT);
+    CREATE TABLE botanist (botanist_id INTEGER PRIMARY KEY, botanist_first_name TEXT,
+        botanist_last_name TEXT, botanist_email TEXT, botanist_phone_number TEXT);
+    CREATE TABLE plant (plant_id INTEGER PRIMARY KEY, botanist_id INTEGER,
+        species_id INTEGER, country_id INTEGER);
+    CREATE TABLE recording (recording_id INTEGER PRIMARY KEY, plant_id INTEGER,
+        recording_taken TIMESTAMP, last_watered TIMESTAMP, soil_moisture REAL, temperature REAL);
+    CREATE INDEX IX_recording_plant_taken ON recording (plant_id, recording_taken);
+
+    INSERT INTO country VALUES (1, 'GB', 'United Kingdom'), (2, 'BR', 'Brazil'),
+        (3, 'US', 'United States');
+    INSERT INTO botanist VALUES
+        (1, 'Carl', 'Linnaeus', 'carl.linnaeus@lnhm.co.uk', '(146)994-1635x35992'),
+        (2, 'Gertrude', 'Jekyll', 'gertrude.jekyll@lnhm.co.uk', '001-481-273-3691x127'),
+        (3, 'Eliza', 'Andrews', 'eliza.andrews@lnhm.co.uk', '(846)669-6651x75948');
+    WITH RECURSIVE ids(id) AS (SELECT 0 UNION ALL SELECT id + 1 FROM ids WHERE id < 46)
+    INSERT INTO species SELECT id + 1, 'species ' || id FROM ids;
+    WITH RECURSIVE ids(id) AS (SELECT 0 UNION ALL SELECT id + 1 FROM ids
+                               WHERE id < {PLANT_COUNT - 1})
+    INSERT INTO plant SELECT id, id % 3 + 1, id % 47 + 1, id % 3 + 1 FROM ids;
+    WITH RECURSIVE ids(id) AS (SELECT 1 UNION ALL SELECT id + 1 FROM ids WHERE id < {row_count})
+    INSERT INTO recording SELECT id, id % {PLANT_COUNT},
+        datetime('2024-11-25', '+' || (id * 86400 / {row_count}) || ' seconds'),
+        datetime('2024-11-25', '+' || (id * 86400 / {row_count} / 3600) || ' hours'),
+        (id * 7919 % 10000) / 100.0, 10 + (id * 104729 % 2000) / 100.0 FROM ids;
+    """)
+    conn.commit()
+    conn.close()
+
+
+def connect_stand_in(path: str) -> sqlite3.Connection:
+    """Connects to the stand-in so that the beta schema prefix resolves"""
+    conn = sqlite3.connect(":memory:", check_same_thread=False,
+                           detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.execute("ATTACH DATABASE ? AS beta", (path,))
+    return conn
+
+
+def export_with_fetchall(cursor, csv_file) -> int:
+    """The original export, which holds every row in memory before writing"""
+    results = cursor.fetchall()
+    writer = csv.writer(csv_file)
+    writer.writerow([description[0] for description in cursor.description])
+    writer.writerows(results)
+    return len(results)
+
+
+def execute_export(conn: sqlite3.Connection, join: bool):
+    """Runs the original joined export query, or the recording-only query
+    wrapped so that the plant dimensions are joined on in memory"""
+    cursor = conn.cursor()
+    if join:
+        cursor.execute(JOIN_QUERY, ALL_RECORDINGS)
+        return cursor
+    dimensions = PlantDimensions.load(cursor, "beta")
+    cursor.execute(STAND_IN_QUERY, ALL_RECORDINGS)
+    return EnrichingCursor(cursor, dimensions)
+
+
+def measure(export, path: str, join=False) -> tuple:
+    """Runs one export and returns its peak memory in MiB and rows per second"""
+    conn = connect_stand_in(path)
+    with tempfile.TemporaryFile(mode="w+", newline="", encoding="utf-8") as csv_file:
+        tracemalloc.start()
+        started = time.perf_counter()
+        row_count = export(execute_export(conn, join), csv_file)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    conn.close()
+    return peak / 2 ** 20, row_count / elapsed
+
+
+def time_call(function) -> float:
+    """Returns how long the function took in seconds"""
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def compare_formats(path: str, directory: str) -> tuple:
+    """Exports both formats and returns their sizes in MiB, and the time taken
+    to read everything, and to read two columns of one plant over one hour"""
+    csv_path = os.path.join(directory, "backup.csv")
+    parquet_path = os.path.join(directory, "backup.parquet")
+    conn = connect_stand_in(path)
+    with open(csv_path, mode="w", newline="", encoding="utf-8") as csv_file:
+        backup.export_rows(execute_export(conn, False), csv_file, parquet_path)
+    conn.close()
+
+    start, end = datetime(2024, 11, 25, 12), datetime(2024, 11, 25, 13)
+    columns = ["recording_taken", "soil_moisture"]
+
+    def query_csv():
+        data = pd.read_csv(csv_path, parse_dates=["recording_taken"])
+        data = data[(data["plant_id"] == 5) & (data["recording_taken"] >= start)
+                    & (data["recording_taken"] <= end)]
+        return data[columns]
+
+    return (os.path.getsize(csv_path) / 2 ** 20, os.path.getsize(parquet_path) / 2 ** 20,
+            time_call(lambda: pd.read_csv(csv_path)),
+            time_call(lambda: read_backup(parquet_path).to_pandas()),
+            time_call(query_csv),
+            time_call(lambda: read_backup(parquet_path, columns, [5], start, end).to_pandas()))
+
+
+def measure_frame(path: str, join: bool) -> tuple:
+    """Loads every recording into a DataFrame the way the dashboard does,
+    and returns the peak memory in MiB and the time taken in seconds"""
+    conn = connect_stand_in(path)
+    tracemalloc.start()
+    started = time.perf_counter()
+    if join:
+        pd.read_sql(JOIN_QUERY, conn, params=ALL_RECORDINGS)
+    else:
+        dimensions = PlantDimensions.load(conn.cursor(), "beta")
+        dimensions.enrich_frame(pd.read_sql(STAND_IN_QUERY, conn, params=ALL_RECORDINGS))
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    conn.close()
+    return peak / 2 ** 20, elapsed
+
+
+def compare_joins(path: str) -> tuple:
+    """Returns the export rate and peak memory, then the DataFrame load time
+    and peak memory, with the dimensions joined in SQL and then in memory"""
+    join_memory, join_rate = measure(backup.export_rows, path, join=True)
+    enriched_memory, enriched_rate = measure(backup.export_rows, path)
+    join_frame_memory, join_frame_time = measure_frame(path, True)
+    enriched_frame_memory, enriched_frame_time = measure_frame(path, False)
+    return (join_rate, join_memory, enriched_rate, enriched_memory,
+            join_frame_time, join_frame_memory, enriched_frame_time, enriched_frame_memory)
+
+
+def time_partitioned_export(path: str, workers: int) -> float:
+    """Returns how long exporting PARTITION_COUNT plant partitions
+    with the given number of workers took in seconds"""
+    conn = StandInConnection(path)
+    started = time.perf_counter()
+    backup.export_slice(conn, lambda: StandInConnection(path), DiscardingS3Client(),
+                        "benchmark", "backup", ALL_RECORDINGS,
+                        (PARTITION_COUNT, "plant", workers))
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed
+
+
+def main(row_counts: list) -> None:
+    """Prints the peak memory and throughput of both exports for each row count,
+    then the sizes and read times of both formats, then the partitioned export times,
+    then the cost of joining the dimensions in SQL and in memory"""
+    print(f"{'rows':>9} {'fetchall MiB':>13} {'fetchall rows/s':>16} "
+          f"{'streaming MiB':>14} {'streaming rows/s':>17}")
+    format_results = []
+    partition_results = []
+    join_results = []
+    for row_count in row_counts:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "plants.db")
+            create_stand_in_database(path, row_count)
+            fetchall_memory, fetchall_rate = measure(export_with_fetchall, path, join=True)
+            streaming_memory, streaming_rate = measure(backup.export_rows, path)
+            format_results.append((row_count, compare_formats(path, directory)))
+            partition_results.append((row_count, [time_partitioned_export(path, workers)
+                                                  for workers in WORKER_COUNTS]))
+            join_results.append((row_count, compare_joins(path)))
+        print(f"{row_count:>9} {fetchall_memory:>13.1f} {fetchall_rate:>16.0f} "
+              f"{streaming_memory:>14.1f} {streaming_rate:>17.0f}")
+
+    print(f"\n{'rows':>9} {'CSV MiB':>8} {'Parquet MiB':>12} {'CSV read':>9} "
+          f"{'Parquet read':>13} {'CSV query':>10} {'Parquet query':>14}")
+    for row_count, (csv_size, parquet_size, *timings) in format_results:
+        print(f"{row_count:>9} {csv_size:>8.1f} {parquet_size:>12.1f} "
+              + " ".join(f"{timing:>{width}.3f}s"
+                         for timing, width in zip(timings, [8, 12, 9, 13])))
+
+    print(f"\n{'rows':>9} " + " ".join(f"{f'{workers} workers':>10}" for workers in WORKER_COUNTS))
+    for row_count, timings in partition_results:
+        print(f"{row_count:>9} " + " ".join(f"{timing:>9.2f}s" for timing in timings))
+
+    print(f"\n{'rows':>9} {'join rows/s':>12} {'join MiB':>9} {'memory rows/s':>14} "
+          f"{'memory MiB':>11} {'join frame':>11} {'MiB':>6} {'memory frame':>13} {'MiB':>6}")
+    for row_count, results in join_results:
+        print(f"{row_count:>9} {results[0]:>12.0f} {results[1]:>9.1f} {results[2]:>14.0f} "
+              f"{results[3]:>11.1f} {results[4]:>10.3f}s {results[5]:>6.1f} "
+              f"{results[6]:>12.3f}s {results[7]:>6.1f}")
+
+
+if __name__ == "__main__":
+    main([int(count) for count in sys.argv[1:]] or ROW_COUNTS)
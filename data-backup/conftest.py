@@ -0,0 +1,21 @@
+# pylint: skip-file
+import os
+import sys
+import boto3
+import pytest
+from moto import mock_aws
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "pipeline"))
+
+BUCKET = "plant-backups"
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        client = boto3.client("s3", region_name="eu-west-2")
+        client.create_bucket(Bucket=BUCKET,
+                             CreateBucketConfiguration={"LocationConstraint": "eu-west-2"})
+        yield client
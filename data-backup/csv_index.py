@@ -0,0 +1,68 @@
+"""Writes the archive CSV while recording where each plant's rows are in it,
+so readers can fetch one plant's rows with a range GET instead of the whole file"""
+
+import csv
+from itertools import groupby
+from operator import itemgetter
+
+
+class IndexedCsvWriter:  # pylint: disable=too-many-instance-attributes
+    """CSV writer that records the byte range, first row, row count and recording_taken
+    range of every run of consecutive rows of one plant. The export is ordered by plant,
+    so each plant normally has a single range per file"""
+
+    def __init__(self, csv_file, columns: list, plant_column="plant_id",
+                 time_column="recording_taken"):
+        self.csv_file = csv_file
+        self.writer = csv.writer(self)
+        self.indexed = plant_column in columns and time_column in columns
+        if self.indexed:
+            self.plant_index = columns.index(plant_column)
+            self.time_index = columns.index(time_column)
+        self.position = 0
+        self.row_count = 0
+        self.ranges = []
+        self.writer.writerow(columns)
+
+    def write(self, text: str) -> None:
+        """Counts the UTF-8 bytes of the text and passes it on to the file"""
+        self.position += len(text) if text.isascii() else len(text.encode("utf-8"))
+        self.csv_file.write(text)
+
+    def add_range(self, plant_id, start: int, first_row: int, rows: list) -> None:
+        """Records the range of a run of one plant's rows that ends at the current position,
+        extending the previous range if the run carries straight on from it"""
+        taken = [row[self.time_index] for row in rows]
+        first, last = min(taken), max(taken)
+        if (self.ranges and self.ranges[-1]["plant_id"] == plant_id
+                and self.ranges[-1]["end"] == start):
+            previous = self.ranges[-1]
+            previous["end"] = self.position
+            previous["row_count"] += len(rows)
+            previous["min_recording_taken"] = min(previous["min_recording_taken"], first)
+            previous["max_recording_taken"] = max(previous["max_recording_taken"], last)
+            return
+        self.ranges.append({"plant_id": plant_id, "start": start, "end": self.position,
+                            "first_row": first_row, "row_count": len(rows),
+                            "min_recording_taken": first, "max_recording_taken": last})
+
+    def writerows(self, rows: list) -> None:
+        """Writes the rows, indexing each run of one plant's rows
+        when the columns include the plant and recording_taken"""
+        if not self.indexed:
+            self.writer.writerows(rows)
+            self.row_count += len(rows)
+            return
+        for plant_id, run in groupby(rows, key=itemgetter(self.plant_index)):
+            run = list(run)
+            start = self.position
+            self.writer.writerows(run)
+            self.add_range(plant_id, start, self.row_count, run)
+            self.row_count += len(run)
+
+    def get_ranges(self) -> list:
+        """Returns the ranges with recording_taken as it is written in the CSV"""
+        return [{**plant_range,
+                 "min_recording_taken": str(plant_range["min_recording_taken"]),
+                 "max_recording_taken": str(plant_range["max_recording_taken"])}
+                for plant_range in self.ranges]
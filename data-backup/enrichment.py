@@ -0,0 +1,80 @@
+"""Loads the plant, species, country and botanist tables once and joins them
+onto recordings in memory, so the heavy queries only have to scan recording"""
+
+import pandas as pd
+
+DIMENSION_COLUMNS = ["plant_name", "country_name", "botanist_first_name",
+                     "botanist_last_name", "botanist_email", "botanist_phone_number"]
+
+
+def build_dimension_query(schema: str) -> str:
+    """Returns the query for every plant's species, country and botanist"""
+    return f"""
+    SELECT
+        plant.plant_id,
+        species.plant_name,
+        country.country_name,
+        botanist.botanist_first_name,
+        botanist.botanist_last_name,
+        botanist.botanist_email,
+        botanist.botanist_phone_number
+    FROM {schema}.plant
+    JOIN {schema}.species ON plant.species_id = species.species_id
+    JOIN {schema}.country ON plant.country_id = country.country_id
+    JOIN {schema}.botanist ON plant.botanist_id = botanist.botanist_id;
+    """
+
+
+class PlantDimensions:
+    """The dimension values of every plant, keyed by plant_id.
+    Recordings of plants that are not in the lookup are dropped,
+    matching an inner join"""
+
+    def __init__(self, rows: list):
+        self.lookup = {row[0]: tuple(row[1:]) for row in rows}
+        self.frame = pd.DataFrame([(plant_id, *values) for plant_id, values in self.lookup.items()],
+                                  columns=["plant_id"] + DIMENSION_COLUMNS)
+
+    @classmethod
+    def load(cls, cursor, schema: str):
+        """Loads the dimensions of every plant with a single query"""
+        cursor.execute(build_dimension_query(schema))
+        return cls(cursor.fetchall())
+
+    def enrich_rows(self, rows: list, plant_index: int) -> list:
+        """Appends the dimension values to each row, using the plant_id at plant_index"""
+        lookup = self.lookup
+        return [row + lookup[row[plant_index]] for row in rows
+                if row[plant_index] in lookup]
+
+    def enrich_frame(self, recordings: pd.DataFrame, columns=None) -> pd.DataFrame:
+        """Merges the requested dimension columns onto the recordings,
+        keeping the recordings' order"""
+        columns = list(columns or DIMENSION_COLUMNS)
+        return recordings.merge(self.frame[["plant_id"] + columns], on="plant_id", how="inner")
+
+
+class EnrichingCursor:
+    """Wraps a cursor over recordings so that every fetched row
+    comes back with its plant's dimension values appended"""
+
+    def __init__(self, cursor, dimensions: PlantDimensions, plant_column="plant_id"):
+        self.cursor = cursor
+        self.dimensions = dimensions
+        self.plant_index = [column[0] for column in cursor.description].index(plant_column)
+
+    @property
+    def description(self) -> list:
+        """The recording columns followed by the dimension columns"""
+        return list(self.cursor.description) + [(column,) for column in DIMENSION_COLUMNS]
+
+    def fetchmany(self, size: int) -> list:
+        """Fetches and enriches the next batch. Keeps fetching while every
+        row in a batch was dropped, so an empty batch still means the end"""
+        while True:
+            rows = self.cursor.fetchmany(size)
+            if not rows:
+                return rows
+            enriched = self.dimensions.enrich_rows(rows, self.plant_index)
+            if enriched:
+                return enriched
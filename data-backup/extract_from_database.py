@@ -1,50 +1,85 @@
-"""Connects to Microsoft SQL Server, extracts all data,
-stores it as a .csv file, uploads to S3 and resets the database"""
+"""Connects to Microsoft SQL Server, archives every recording up to a
+high-water mark to S3 and then deletes only those recordings"""
 
 # pylint: disable=E1101
 # pylint: disable=W0613
 # pylint: disable=E1120
 
+import io
 import os
-import csv
+import json
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 from datetime import datetime
 
 import pymssql
 from dotenv import load_dotenv
 import boto3
 
+from archive_manifest import (ArchiveIndex, build_manifest, to_json_value,
+                              validate_manifest)
+from csv_index import IndexedCsvWriter
+from enrichment import EnrichingCursor, PlantDimensions
+from metrics import METRICS
+from parquet_backup import ParquetBackupWriter
+from partitions import PREDICATES, get_partitions
+from s3_stream import S3MultipartWriter
+
 load_dotenv()
 
 SCHEMA = os.getenv("SCHEMA_NAME")
 
-QUERY = f"""
+
+def build_query(predicate=None) -> str:
+    """Returns the export query for a recording_id range,
+    narrowed to one partition by the predicate if given.
+    Only recording is scanned, the plant's dimensions are joined on in memory"""
+    partition = f"\n    AND {predicate}" if predicate else ""
+    return f"""
 SELECT
     recording.recording_id,
     recording.recording_taken,
     recording.last_watered,
     recording.soil_moisture,
     recording.temperature,
-    plant.plant_id,
-    species.plant_name,
-    country.country_name,
-    botanist.botanist_first_name,
-    botanist.botanist_last_name,
-    botanist.botanist_email,
-    botanist.botanist_phone_number
+    recording.plant_id
 FROM
     {SCHEMA}.recording
-JOIN
-    {SCHEMA}.plant ON recording.plant_id = plant.plant_id
-JOIN
-    {SCHEMA}.species ON plant.species_id = species.species_id
-JOIN
-    {SCHEMA}.country ON plant.country_id = country.country_id
-JOIN
-    {SCHEMA}.botanist ON plant.botanist_id = botanist.botanist_id;
+WHERE
+    recording.recording_id BETWEEN %s AND %s{partition}
+ORDER BY
+    recording.plant_id, recording.recording_taken;
+"""
+
+
+QUERY = build_query()
+
+PARTITION_QUERIES = {partition_by: build_query(predicate)
+                     for partition_by, predicate in PREDICATES.items()}
+
+BOUNDS_QUERY = f"""
+SELECT MIN(plant_id), MAX(plant_id), MIN(recording_taken), MAX(recording_taken)
+FROM {SCHEMA}.recording WHERE recording_id BETWEEN %s AND %s;
 """
 
-CSV_FILE = f"""/tmp/{datetime.today().strftime('%Y-%m-%d')
-                     }_plant_monitor_data.csv"""
+WATERMARK_QUERY = f"""
+SELECT MIN(recording_id), MAX(recording_id) FROM {SCHEMA}.recording;
+"""
+
+COUNT_QUERY = f"""
+SELECT COUNT(*) FROM {SCHEMA}.recording WHERE recording_id BETWEEN %s AND %s;
+"""
+
+DELETE_QUERY = f"""
+DELETE TOP (%s) FROM {SCHEMA}.recording WHERE recording_id BETWEEN %s AND %s;
+"""
+
+BATCH_SIZE = 5000
+DELETE_BATCH_SIZE = 5000
+BACKUP_FORMATS = os.getenv("BACKUP_FORMATS", "csv").split(",")
+BACKUP_PARTITIONS = int(os.getenv("BACKUP_PARTITIONS", "1"))
+BACKUP_WORKERS = int(os.getenv("BACKUP_WORKERS", "4"))
+PARTITION_BY = os.getenv("BACKUP_PARTITION_BY", "plant")
 
 
 def get_connection():
@@ -56,30 +91,300 @@ def get_connection():
 
 
 def get_cursor(conn):
-    """Gets cursor"""
-    return conn.cursor()
+    """Gets a cursor that counts its round trips to the database"""
+    return METRICS.wrap_cursor(conn.cursor())
 
 
-def extract_data() -> None:
-    """Extracts all data from database"""
-    conn = get_connection()
-    if not conn:
-        return None
+def fetch_batches(cursor, batch_size=BATCH_SIZE):
+    """Yields the results of an executed query a batch at a time"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def export_rows(cursor, csv_file=None, parquet_sink=None, batch_size=BATCH_SIZE,
+                index=None) -> int:
+    """Writes the results of an executed query to a CSV file and/or Parquet sink
+    a batch at a time, so only one batch is ever held in memory.
+    If an ArchiveIndex is given, it is filled in for the manifest"""
+    row_count = 0
+    columns = [description[0] for description in cursor.description]
+    with ExitStack() as stack:
+        csv_writer = None
+        if csv_file is not None:
+            csv_writer = IndexedCsvWriter(csv_file, columns)
+        parquet_writer = None
+        if parquet_sink is not None:
+            parquet_writer = stack.enter_context(ParquetBackupWriter(parquet_sink))
+        for rows in fetch_batches(cursor, batch_size):
+            if csv_writer:
+                csv_writer.writerows(rows)
+            if parquet_writer:
+                parquet_writer.write_rows(rows)
+            if index is not None:
+                index.update(columns, rows)
+            row_count += len(rows)
+    if index is not None:
+        index.plant_ranges = csv_writer.get_ranges() if csv_writer else []
+        index.row_groups = parquet_writer.row_groups if parquet_writer else []
+    return row_count
+
+
+def get_archive_prefix() -> str:
+    """Returns the start of today's backup keys"""
+    return f"{datetime.today().strftime('%Y-%m-%d')}_plant_monitor_data"
+
+
+def get_backup_keys(prefix: str) -> dict:
+    """Returns the S3 key of every configured backup format"""
+    return {backup_format: f"{prefix}.{backup_format}" for backup_format in BACKUP_FORMATS}
+
+
+def export_to_s3(cursor, s3_client, bucket, prefix, partition=None) -> tuple:
+    """Streams the results of an executed query straight into S3
+    in every configured format, aborting all uploads if any of them fail.
+    Returns the manifest entry of every file and the ArchiveIndex of the part"""
+    keys = get_backup_keys(prefix)
+    uploads = []
+    index = ArchiveIndex()
+    try:
+        csv_file = parquet_sink = None
+        if "csv" in keys:
+            uploads.append(S3MultipartWriter(s3_client, bucket, keys["csv"]))
+            csv_file = io.TextIOWrapper(uploads[-1], encoding="utf-8", newline="")
+        if "parquet" in keys:
+            uploads.append(S3MultipartWriter(s3_client, bucket, keys["parquet"]))
+            parquet_sink = uploads[-1]
+        row_count = export_rows(cursor, csv_file, parquet_sink, index=index)
+        if csv_file is not None:
+            csv_file.flush()
+            csv_file.detach()
+        for upload in uploads:
+            upload.close()
+    except Exception:
+        for upload in uploads:
+            upload.abort()
+        raise
+    columns = [description[0] for description in cursor.description]
+    return get_part_entries(prefix, row_count, partition, columns, index), index
+
+
+def export_partition(connect, s3_client, bucket, prefix,  # pylint: disable=R0913,R0917
+                     partition_by: str, params: tuple, dimensions) -> tuple:
+    """Exports one partition of the slice over its own connection, opened with connect"""
+    conn = connect()
     try:
-        conn = get_connection()
         cursor = get_cursor(conn)
-        cursor.execute(QUERY)
-        results = cursor.fetchall()
-        column_titles = [description[0] for description in cursor.description]
-        with open(CSV_FILE, mode="w", newline="", encoding="utf-8") as csv_file:
-            writer = csv.writer(csv_file)
-            writer.writerow(column_titles)
-            writer.writerows(results)
-        print("Data extracted successfully.")
+        cursor.execute(PARTITION_QUERIES[partition_by], params)
+        return export_to_s3(EnrichingCursor(cursor, dimensions), s3_client, bucket, prefix,
+                            {"by": partition_by, "low": params[2], "high": params[3]})
+    finally:
+        conn.close()
+
+
+def get_part_entries(prefix, row_count, partition=None, columns=None, index=None) -> list:
+    """Returns the manifest entry of every file in one archive part. Entries hold
+    the part's column statistics. CSV entries also list the columns and where each
+    plant's rows are, for range GETs, and Parquet entries list their row groups"""
+    entries = []
+    for backup_format, key in get_backup_keys(prefix).items():
+        entry = {"key": key, "format": backup_format, "row_count": row_count}
+        if partition:
+            entry["partition"] = {name: to_json_value(value) for name, value in partition.items()}
+        if index is not None:
+            entry["column_stats"] = index.column_stats.to_dict() if index.column_stats else {}
+            if backup_format == "csv":
+                entry["columns"] = columns
+                entry["plant_ranges"] = index.plant_ranges
+            if backup_format == "parquet":
+                entry["row_groups"] = index.row_groups
+        entries.append(entry)
+    return entries
+
+
+def export_partitions(connect, s3_client, bucket, prefix,  # pylint: disable=R0913,R0917
+                      partition_by: str, workers: int, partition_params: list,
+                      dimensions) -> tuple:
+    """Exports every partition, given by its query parameters, into its own archive
+    part, up to workers at a time, and returns the manifest entries of their files
+    and their indexes. If any part fails, the parts that were uploaded are deleted"""
+    prefixes = [f"{prefix}.part-{index:04d}" for index in range(len(partition_params))]
+    with ThreadPoolExecutor(max_workers=min(workers, len(partition_params))) as executor:
+        futures = [executor.submit(export_partition, connect, s3_client, bucket, part_prefix,
+                                   partition_by, params, dimensions)
+                   for part_prefix, params in zip(prefixes, partition_params)]
+        wait(futures, return_when=FIRST_EXCEPTION)
+        for future in futures:
+            future.cancel()
+
+    completed = [future for future in futures if not future.cancelled()]
+    failures = [future.exception() for future in completed if future.exception()]
+    if failures:
+        uploaded = [{"Key": key} for part_prefix, future in zip(prefixes, futures)
+                    if future in completed and not future.exception()
+                    for key in get_backup_keys(part_prefix).values()]
+        if uploaded:
+            s3_client.delete_objects(Bucket=bucket, Delete={"Objects": uploaded})
+        raise failures[0]
+    return ([entry for future in futures for entry in future.result()[0]],
+            [future.result()[1] for future in futures])
+
+
+def export_slice(conn, connect, s3_client, bucket, prefix,  # pylint: disable=R0913,R0917
+                 id_range: tuple, partitioning: tuple) -> tuple:
+    """Exports the slice of recordings in the (min, max) id_range and returns
+    the manifest entries of its files and the indexes of its parts. partitioning
+    is (partition count, partition by, workers). With more than one partition,
+    the slice is split and up to workers partitions are read in parallel, each
+    on its own connection from connect. The plant dimensions are loaded once and
+    shared by every partition"""
+    partition_count, partition_by, workers = partitioning
+    cursor = get_cursor(conn)
+    dimensions = PlantDimensions.load(cursor, SCHEMA)
+    if partition_count <= 1:
+        cursor.execute(QUERY, id_range)
+        entries, index = export_to_s3(EnrichingCursor(cursor, dimensions),
+                                      s3_client, bucket, prefix)
+        return entries, [index]
+
+    cursor.execute(BOUNDS_QUERY, id_range)
+    partitions = get_partitions(partition_by, cursor.fetchone(), partition_count)
+    return export_partitions(connect, s3_client, bucket, prefix, partition_by, workers,
+                             [(*id_range, low, high) for low, high in partitions], dimensions)
+
+
+def get_high_water_mark(cursor) -> tuple:
+    """Returns the lowest and highest recording_id currently in the table"""
+    cursor.execute(WATERMARK_QUERY)
+    return cursor.fetchone()
+
+
+def count_slice(cursor, min_id: int, max_id: int) -> int:
+    """Returns how many recordings are in the slice"""
+    cursor.execute(COUNT_QUERY, (min_id, max_id))
+    return cursor.fetchone()[0]
+
+
+def delete_slice(conn, cursor, id_runs: list, batch_size=DELETE_BATCH_SIZE) -> int:
+    """Deletes the exported recordings, one run of consecutive exported ids at a time.
+    Every id in a run was exported, so a recording whose insert committed after the
+    export read past it falls between runs and is left for the next archive.
+    Deletes batch_size rows at a time, committing after every batch
+    so the locks on the recording table are only ever held briefly"""
+    deleted_count = 0
+    for first_id, last_id in id_runs:
+        while True:
+            cursor.execute(DELETE_QUERY, (batch_size, first_id, last_id))
+            conn.commit()
+            deleted_count += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+    return deleted_count
+
+
+def get_existing_manifest(s3_client, bucket, key):
+    """Returns the manifest already uploaded to the key, or None if there is none"""
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(body)
+
+
+def upload_manifest(s3_client, bucket, key, manifest: dict) -> None:
+    """Uploads the manifest as JSON"""
+    s3_client.put_object(Bucket=bucket, Key=key, Body=json.dumps(manifest, indent=2, default=str),
+                         ContentType="application/json")
+
+
+def export_manifest(conn, cursor, s3_client, bucket, prefix):
+    """Exports every recording up to the current high-water mark and returns
+    the validated manifest of the export, or None if there is nothing to archive.
+    Raises if the slice holds a different number of recordings than were exported"""
+    min_id, max_id = get_high_water_mark(cursor)
+    if max_id is None:
         return None
-    except pymssql.Error as e:
-        print(f"Error executing query: {e}")
+
+    with METRICS.stage("export") as stage:
+        files, indexes = export_slice(conn, get_connection, s3_client, bucket, prefix,
+                                      (min_id, max_id),
+                                      (BACKUP_PARTITIONS, PARTITION_BY, BACKUP_WORKERS))
+        manifest = build_manifest((min_id, max_id), files, indexes)
+        stage.count_rows(rows_out=manifest["row_count"])
+    expected_count = count_slice(cursor, min_id, max_id)
+    if manifest["row_count"] != expected_count:
+        raise RuntimeError(f"Exported {manifest['row_count']} of {expected_count} recordings "
+                           f"between {min_id} and {max_id}, not deleting them")
+    validate_manifest(manifest)
+    return manifest
+
+
+def find_unfinished_manifests(s3_client, bucket) -> list:
+    """Returns the key and manifest of every archive that was exported but whose
+    delete did not finish, oldest first. Every run finishes these before exporting,
+    so the search stops at the newest archive that was fully deleted"""
+    keys = []
+    for page in s3_client.get_paginator("list_objects_v2").paginate(Bucket=bucket):
+        keys += [entry["Key"] for entry in page.get("Contents", [])
+                 if entry["Key"].endswith("_plant_monitor_data.manifest.json")]
+    unfinished = []
+    for key in sorted(keys, reverse=True):
+        manifest = get_existing_manifest(s3_client, bucket, key)
+        if manifest.get("status") == "archived":
+            break
+        unfinished.append((key, manifest))
+    return unfinished[::-1]
+
+
+def finish_archive(conn, cursor, s3_client, bucket, manifest_key,  # pylint: disable=R0913,R0917
+                   manifest: dict) -> dict:
+    """Deletes the recordings the manifest lists as exported, then marks it archived"""
+    with METRICS.stage("delete") as stage:
+        deleted_count = delete_slice(conn, cursor, manifest["recording_id_runs"])
+        stage.count_rows(manifest["row_count"], deleted_count)
+    manifest["deleted_count"] += deleted_count
+    manifest["status"] = "archived"
+    upload_manifest(s3_client, bucket, manifest_key, manifest)
+    print(f"Archived {manifest['row_count']} recordings between "
+          f"{manifest['min_recording_id']} and {manifest['max_recording_id']}.")
+    return manifest
+
+
+def archive_slice(conn, s3_client, bucket):
+    """Exports every recording up to the current high-water mark, then deletes
+    only the recordings that were exported. Recordings inserted while the job runs
+    are left for the next run. Nothing is deleted unless every row in the slice
+    was exported, and a manifest is written before deleting and again once the
+    slice is gone. If an earlier run, today or on an earlier day, stopped after
+    writing its manifest but before finishing the delete, that delete is resumed
+    first, so its recordings are not exported a second time"""
+    prefix = get_archive_prefix()
+    manifest_key = f"{prefix}.manifest.json"
+    cursor = get_cursor(conn)
+    for key, manifest in find_unfinished_manifests(s3_client, bucket):
+        validate_manifest(manifest)
+        print(f"Resuming the delete of the recordings exported to {key}.")
+        finish_archive(conn, cursor, s3_client, bucket, key, manifest)
+        if key == manifest_key:
+            return manifest
+
+    if get_existing_manifest(s3_client, bucket, manifest_key) is not None:
+        raise RuntimeError(f"{manifest_key} is already archived, refusing to overwrite it")
+    manifest = export_manifest(conn, cursor, s3_client, bucket, prefix)
+    if manifest is None:
+        print("No recordings to archive.")
         return None
+    upload_manifest(s3_client, bucket, manifest_key, manifest)
+    return finish_archive(conn, cursor, s3_client, bucket, manifest_key, manifest)
+
+
+def archive_data(s3_client):
+    """Archives the recordings over a single connection"""
+    conn = get_connection()
+    try:
+        return archive_slice(conn, s3_client, os.getenv("BUCKET_NAME"))
     finally:
         conn.close()
         print("Connection closed.")
@@ -97,40 +402,18 @@ def get_client():
     return client
 
 
-def truncate_table():
-    """Truncates tables within the schema"""
-    conn = get_connection()
-    if not conn:
-        return None
-    try:
-        conn = get_connection()
-        cursor = get_cursor(conn)
-        cursor.execute(f"TRUNCATE TABLE {SCHEMA}.recording")
-        print("Table truncated.")
-        conn.commit()
-        return None
-    except pymssql.Error as e:
-        print(f"Error executing query: {e}")
-        return None
-    finally:
-        conn.close()
-        print("Connection closed.")
-
-
 def lambda_handler(event, context):
-    """Lambda function that runs the data backup pipeline"""
+    """Lambda function that runs the data backup pipeline, returning the metrics of the run"""
+    METRICS.reset()
     try:
-        extract_data()
-        s3_client = get_client()
-        s3_client.upload_file(CSV_FILE, os.getenv("BUCKET_NAME"), CSV_FILE)
-        truncate_table()
-        return {"statusCode": 200, "body": "Successfully executed data backup pipeline"}
+        with METRICS.stage("backup"):
+            archive_data(get_client())
+        return {"statusCode": 200, "body": "Successfully executed data backup pipeline",
+                "metrics": METRICS.log_summary("backup_run")}
     except Exception as e:  # pylint: disable=broad-except
-        return {"statusCode": 500, "body": f"Error occurred: {str(e)}"}
+        return {"statusCode": 500, "body": f"Error occurred: {str(e)}",
+                "metrics": METRICS.log_summary("backup_run")}
 
 
 if __name__ == "__main__":
-    extract_data()
-    s3 = get_client()
-    s3.upload_file(CSV_FILE, os.getenv("BUCKET_NAME"), CSV_FILE)
-    truncate_table()
+    archive_data(get_client())
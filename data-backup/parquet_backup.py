@@ -0,0 +1,131 @@
+"""Writes the backup as a compressed, columnar Parquet file, and reads it back
+while only touching the columns and row groups that are needed"""
+
+# pylint: disable=E1101
+
+from datetime import datetime
+from itertools import groupby
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+PLANTS_PER_ROW_GROUP = 10
+COMPRESSION = "zstd"
+
+SCHEMA = pa.schema([
+    ("recording_id", pa.int64()),
+    ("recording_taken", pa.timestamp("ms")),
+    ("last_watered", pa.timestamp("ms")),
+    ("soil_moisture", pa.float64()),
+    ("temperature", pa.float64()),
+    ("plant_id", pa.int16()),
+    ("plant_name", pa.string()),
+    ("country_name", pa.string()),
+    ("botanist_first_name", pa.string()),
+    ("botanist_last_name", pa.string()),
+    ("botanist_email", pa.string()),
+    ("botanist_phone_number", pa.string()),
+])
+
+DICTIONARY_COLUMNS = ["plant_name", "country_name", "botanist_first_name",
+                      "botanist_last_name", "botanist_email", "botanist_phone_number"]
+
+PLANT_INDEX = SCHEMA.get_field_index("plant_id")
+TAKEN_INDEX = SCHEMA.get_field_index("recording_taken")
+TAKEN_TYPE = SCHEMA.field("recording_taken").type
+
+
+def get_hour(row: tuple) -> datetime:
+    """Returns the start of the hour a row was recorded in"""
+    return row[TAKEN_INDEX].replace(minute=0, second=0, microsecond=0)
+
+
+class ParquetBackupWriter:
+    """Streams backup rows into a Parquet file with one row group per hour
+    for each bucket of PLANTS_PER_ROW_GROUP plants.
+    Rows should arrive ordered by plant_id, so only one bucket is buffered at a time."""
+
+    def __init__(self, sink, plants_per_row_group=PLANTS_PER_ROW_GROUP):
+        self.writer = pq.ParquetWriter(sink, SCHEMA, compression=COMPRESSION,
+                                       use_dictionary=DICTIONARY_COLUMNS)
+        self.plants_per_row_group = plants_per_row_group
+        self.buffered = []
+        self.bucket = None
+        self.row_groups = []
+
+    def write_rows(self, rows: list) -> None:
+        """Adds rows, writing out the buffered bucket whenever a new one starts"""
+        for row in rows:
+            bucket = row[PLANT_INDEX] // self.plants_per_row_group
+            if bucket != self.bucket:
+                self.flush()
+                self.bucket = bucket
+            self.buffered.append(row)
+
+    def flush(self) -> None:
+        """Writes the buffered rows as one row group per hour,
+        noting the plants and time range of each in row_groups"""
+        self.buffered.sort(key=lambda row: (get_hour(row), row[PLANT_INDEX], row[TAKEN_INDEX]))
+        for _, hour_rows in groupby(self.buffered, key=get_hour):
+            hour_rows = list(hour_rows)
+            table = pa.Table.from_arrays(
+                [pa.array([row[index] for row in hour_rows], type=field.type)
+                 for index, field in enumerate(SCHEMA)], schema=SCHEMA)
+            self.writer.write_table(table, row_group_size=len(hour_rows))
+            self.row_groups.append({
+                "id": len(self.row_groups), "row_count": len(hour_rows),
+                "plant_ids": sorted({row[PLANT_INDEX] for row in hour_rows}),
+                "min_recording_taken": str(min(row[TAKEN_INDEX] for row in hour_rows)),
+                "max_recording_taken": str(max(row[TAKEN_INDEX] for row in hour_rows))})
+        self.buffered = []
+
+    def close(self) -> None:
+        """Writes any remaining rows and the file footer"""
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def row_group_matches(row_group, plant_ids=None, start=None, end=None) -> bool:
+    """Uses a row group's min/max statistics to decide whether it can hold matching rows"""
+    plant_stats = row_group.column(PLANT_INDEX).statistics
+    if plant_ids is not None and plant_stats is not None and plant_stats.has_min_max:
+        if not any(plant_stats.min <= plant_id <= plant_stats.max for plant_id in plant_ids):
+            return False
+    taken_stats = row_group.column(TAKEN_INDEX).statistics
+    if taken_stats is not None and taken_stats.has_min_max:
+        if start is not None and taken_stats.max < start:
+            return False
+        if end is not None and taken_stats.min > end:
+            return False
+    return True
+
+
+def read_backup(source, columns=None, plant_ids=None, start=None, end=None) -> pa.Table:
+    """Reads the requested columns of the rows matching the plant IDs and time range,
+    skipping every row group whose statistics rule it out"""
+    parquet_file = pq.ParquetFile(source)
+    row_groups = [index for index in range(parquet_file.num_row_groups)
+                  if row_group_matches(parquet_file.metadata.row_group(index),
+                                       plant_ids, start, end)]
+    columns = list(columns or SCHEMA.names)
+    read_columns = list(dict.fromkeys(columns + ["plant_id", "recording_taken"]))
+    table = parquet_file.read_row_groups(row_groups, columns=read_columns)
+
+    mask = pa.array([True] * table.num_rows)
+    if plant_ids is not None:
+        mask = pc.and_(mask, pc.is_in(table["plant_id"],
+                                      value_set=pa.array(list(plant_ids), type=pa.int16())))
+    if start is not None:
+        mask = pc.and_(mask, pc.greater_equal(table["recording_taken"],
+                                              pa.scalar(start, TAKEN_TYPE)))
+    if end is not None:
+        mask = pc.and_(mask, pc.less_equal(table["recording_taken"],
+                                           pa.scalar(end, TAKEN_TYPE)))
+    return table.filter(mask).select(columns)
@@ -0,0 +1,38 @@
+"""Splits an archive slice into partitions that can be exported in parallel,
+either by plant_id range or by whole hours of recording_taken"""
+
+from datetime import timedelta
+from math import ceil
+
+PREDICATES = {
+    "plant": "recording.plant_id BETWEEN %s AND %s",
+    "hour": "recording.recording_taken >= %s AND recording.recording_taken < %s",
+}
+
+
+def plant_partitions(min_plant_id: int, max_plant_id: int, partition_count: int) -> list:
+    """Splits the plant IDs into up to partition_count inclusive ranges"""
+    size = ceil((max_plant_id - min_plant_id + 1) / partition_count)
+    return [(low, min(low + size - 1, max_plant_id))
+            for low in range(min_plant_id, max_plant_id + 1, size)]
+
+
+def hour_partitions(first_taken, last_taken, partition_count: int) -> list:
+    """Splits the time between the first and last recording into up to
+    partition_count half-open ranges of whole hours"""
+    start = first_taken.replace(minute=0, second=0, microsecond=0)
+    hours = (last_taken - start) // timedelta(hours=1) + 1
+    size = ceil(hours / partition_count)
+    return [(start + timedelta(hours=offset), start + timedelta(hours=offset + size))
+            for offset in range(0, hours, size)]
+
+
+def get_partitions(partition_by: str, bounds: tuple, partition_count: int) -> list:
+    """Returns the partitions of a slice from its
+    (min plant_id, max plant_id, first recording_taken, last recording_taken)"""
+    min_plant_id, max_plant_id, first_taken, last_taken = bounds
+    if partition_by == "plant":
+        return plant_partitions(min_plant_id, max_plant_id, partition_count)
+    if partition_by == "hour":
+        return hour_partitions(first_taken, last_taken, partition_count)
+    raise ValueError(f"Cannot partition the backup by {partition_by}")
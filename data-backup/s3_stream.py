@@ -0,0 +1,107 @@
+"""Streams data straight into an S3 multipart upload,
+so the backup never has to be staged in /tmp"""
+
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MIN_PART_SIZE = 5 * 2 ** 20
+PART_SIZE = 8 * 2 ** 20
+MAX_IN_FLIGHT = 4
+
+
+class S3MultipartWriter(io.RawIOBase):  # pylint: disable=too-many-instance-attributes
+    """Writable binary stream that uploads every PART_SIZE bytes as a part,
+    with up to max_in_flight parts uploading in parallel.
+    Writes block while all upload slots are busy, so memory stays bounded
+    at roughly (max_in_flight + 1) * part_size. The upload is aborted if
+    any part fails, and objects smaller than one part are sent with a single PUT."""
+
+    def __init__(self, client, bucket, key, part_size=PART_SIZE, max_in_flight=MAX_IN_FLIGHT):
+        super().__init__()
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"S3 parts must be at least {MIN_PART_SIZE} bytes")
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.futures = []
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        """Buffers the data and uploads every full part"""
+        if self.closed:
+            raise ValueError("write to closed upload")
+        self.buffer.extend(data)
+        while len(self.buffer) >= self.part_size:
+            self.submit_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    def submit_part(self, body: bytes) -> None:
+        """Starts uploading a part once an upload slot is free"""
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key)["UploadId"]
+        for future in self.futures:
+            if future.done() and future.exception():
+                raise future.exception()
+        self.slots.acquire()  # pylint: disable=consider-using-with
+        future = self.executor.submit(self.upload_part, len(self.futures) + 1, body)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+
+    def upload_part(self, part_number: int, body: bytes) -> dict:
+        """Uploads one part and returns the details needed to complete the upload"""
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key,
+                                           UploadId=self.upload_id,
+                                           PartNumber=part_number, Body=body)
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def close(self) -> None:
+        """Uploads what is left and completes the upload, aborting it on failure"""
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+            else:
+                if self.buffer:
+                    self.submit_part(bytes(self.buffer))
+                parts = [future.result() for future in self.futures]
+                self.client.complete_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                    MultipartUpload={"Parts": parts})
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self.executor.shutdown(wait=True)
+            self.buffer = bytearray()
+            super().close()
+
+    def abort(self) -> None:
+        """Cancels the upload so no partial object or orphaned parts are left behind"""
+        if self.closed:
+            return
+        for future in self.futures:
+            future.cancel()
+        self.executor.shutdown(wait=True)
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                               UploadId=self.upload_id)
+            print(f"Aborted upload of {self.key}")
+        self.buffer = bytearray()
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
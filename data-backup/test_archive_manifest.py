@@ -0,0 +1,131 @@
+# pylint: skip-file
+import copy
+import json
+from datetime import datetime
+import pytest
+from archive_manifest import (ArchiveIndex, ColumnStats, build_manifest, validate_manifest,
+                              get_id_runs, MANIFEST_VERSION)
+
+COLUMNS = ["recording_id", "recording_taken", "soil_moisture", "plant_id"]
+TAKEN = datetime(2024, 11, 25, 10)
+
+
+def make_index(rows):
+    index = ArchiveIndex()
+    index.update(COLUMNS, rows)
+    return index
+
+
+def make_manifest():
+    index = make_index([(1, TAKEN, 30.0, 1), (2, TAKEN.replace(minute=5), None, 2)])
+    plant_ranges = [
+        {"plant_id": 1, "start": 50, "end": 80, "first_row": 0, "row_count": 1,
+         "min_recording_taken": str(TAKEN), "max_recording_taken": str(TAKEN)},
+        {"plant_id": 2, "start": 80, "end": 110, "first_row": 1, "row_count": 1,
+         "min_recording_taken": "2024-11-25 10:05:00",
+         "max_recording_taken": "2024-11-25 10:05:00"}]
+    files = [{"key": "day.csv", "format": "csv", "row_count": 2,
+              "column_stats": index.column_stats.to_dict(), "columns": COLUMNS,
+              "plant_ranges": plant_ranges}]
+    return json.loads(json.dumps(build_manifest((1, 2), files, [index])))
+
+
+def test_column_stats_count_nulls_and_extremes():
+    stats = ColumnStats(COLUMNS)
+    stats.update([(1, TAKEN, None, 3), (2, TAKEN.replace(hour=11), 40.0, 1)])
+    other = ColumnStats(COLUMNS)
+    other.update([(3, TAKEN.replace(hour=9), 20.0, 2)])
+
+    stats.merge(other)
+
+    assert stats.to_dict() == {
+        "recording_id": {"min": 1, "max": 3, "null_count": 0},
+        "recording_taken": {"min": "2024-11-25 09:00:00", "max": "2024-11-25 11:00:00",
+                            "null_count": 0},
+        "soil_moisture": {"min": 20.0, "max": 40.0, "null_count": 1},
+        "plant_id": {"min": 1, "max": 3, "null_count": 0}}
+
+
+def test_column_of_only_nulls_has_no_extremes():
+    stats = ColumnStats(["last_watered"])
+    stats.update([(None,), (None,)])
+
+    assert stats.to_dict() == {"last_watered": {"min": None, "max": None, "null_count": 2}}
+
+
+def test_id_runs_join_consecutive_ids_across_parts():
+    first = make_index([(7, TAKEN, 1.0, 1), (3, TAKEN, 1.0, 1), (4, TAKEN, 1.0, 2)])
+    second = make_index([(5, TAKEN, 1.0, 3), (9, TAKEN, 1.0, 3)])
+
+    assert get_id_runs([first, second]) == [[3, 5], [7, 7], [9, 9]]
+    assert get_id_runs([ArchiveIndex()]) == []
+
+
+def test_build_manifest_summarises_every_part():
+    manifest = make_manifest()
+
+    validate_manifest(manifest)
+    assert manifest["manifest_version"] == MANIFEST_VERSION
+    assert manifest["row_count"] == 2
+    assert manifest["plant_ids"] == [1, 2]
+    assert manifest["min_recording_taken"] == "2024-11-25 10:00:00"
+    assert manifest["max_recording_taken"] == "2024-11-25 10:05:00"
+    assert manifest["column_stats"]["soil_moisture"]["null_count"] == 1
+    assert manifest["partitions"] == 1
+
+
+def test_empty_export_has_a_valid_manifest():
+    manifest = build_manifest((1, 2), [{"key": "day.csv", "format": "csv", "row_count": 0,
+                                        "column_stats": {}, "columns": COLUMNS,
+                                        "plant_ranges": []}], [ArchiveIndex()])
+    manifest["row_count"] = 0
+
+    validate_manifest(json.loads(json.dumps(manifest)))
+    assert manifest["min_recording_taken"] is None
+
+
+def broken(change):
+    manifest = make_manifest()
+    change(manifest)
+    return manifest
+
+
+@pytest.mark.parametrize("manifest, message", [
+    (broken(lambda m: m.update(manifest_version=MANIFEST_VERSION + 1)), "Unsupported"),
+    (broken(lambda m: m.pop("manifest_version")), "Unsupported"),
+    (broken(lambda m: m.pop("plant_ids")), "missing plant_ids"),
+    (broken(lambda m: m.update(row_count="2")), "str row_count"),
+    (broken(lambda m: m.update(status="deleting")), "unknown status"),
+    (broken(lambda m: m.update(min_recording_id=3)), "id range is reversed"),
+    (broken(lambda m: m.update(row_count=3)), "do not add up to the row_count"),
+    (broken(lambda m: m["files"][0].pop("column_stats")), "missing column_stats"),
+    (broken(lambda m: m["files"][0]["plant_ranges"][1].update(start=70)), "overlapping"),
+    (broken(lambda m: m["files"][0]["plant_ranges"][1].update(row_count=2)), "plant ranges"),
+    (broken(lambda m: m["files"][0]["plant_ranges"][1].update(plant_id=9)), "not in plant_ids"),
+    (broken(lambda m: m["files"][0]["plant_ranges"][0].pop("end")), "incomplete plant range"),
+    (broken(lambda m: m["files"][0]["column_stats"]["soil_moisture"].update(null_count=5)),
+     "null_count"),
+    (broken(lambda m: m.update(recording_id_runs=[[1, 1]])), "runs do not add up"),
+    (broken(lambda m: m.update(recording_id_runs=[[2, 1]])), "invalid recording id run"),
+    (broken(lambda m: m.update(recording_id_runs=[[0, 1]])), "outside its id range"),
+])
+def test_invalid_manifests_are_rejected(manifest, message):
+    with pytest.raises(ValueError, match=message):
+        validate_manifest(manifest)
+
+
+def test_parquet_row_groups_must_cover_the_file():
+    manifest = make_manifest()
+    parquet_entry = copy.deepcopy(manifest["files"][0])
+    parquet_entry.update(key="day.parquet", format="parquet", row_groups=[
+        {"id": 0, "row_count": 1, "plant_ids": [1, 2],
+         "min_recording_taken": str(TAKEN), "max_recording_taken": str(TAKEN)}])
+    manifest["files"].append(parquet_entry)
+
+    with pytest.raises(ValueError, match="row groups"):
+        validate_manifest(manifest)
+
+
+def test_not_an_object():
+    with pytest.raises(ValueError):
+        validate_manifest([])
@@ -0,0 +1,62 @@
+# pylint: skip-file
+import csv
+import io
+from datetime import datetime, timedelta
+from csv_index import IndexedCsvWriter
+
+COLUMNS = ["recording_id", "recording_taken", "plant_id", "plant_name"]
+TAKEN = datetime(2024, 11, 25, 10)
+
+
+def make_rows(plant_ids, name="cactus"):
+    return [(index, TAKEN + timedelta(minutes=index), plant_id, name)
+            for index, plant_id in enumerate(plant_ids)]
+
+
+def read_range(csv_file, plant_range):
+    body = csv_file.getvalue().encode("utf-8")[plant_range["start"]:plant_range["end"]]
+    return list(csv.reader(io.StringIO(body.decode("utf-8"))))
+
+
+def test_ranges_cover_each_plants_rows():
+    csv_file = io.StringIO(newline="")
+    writer = IndexedCsvWriter(csv_file, COLUMNS)
+    rows = make_rows([1, 1, 1, 2, 2, 3])
+
+    writer.writerows(rows[:2])
+    writer.writerows(rows[2:])
+
+    assert [(plant_range["plant_id"], plant_range["row_count"])
+            for plant_range in writer.ranges] == [(1, 3), (2, 2), (3, 1)]
+    first = writer.ranges[0]
+    assert first["min_recording_taken"] == TAKEN
+    assert first["max_recording_taken"] == TAKEN + timedelta(minutes=2)
+    assert [int(row[0]) for row in read_range(csv_file, first)] == [0, 1, 2]
+    assert writer.ranges[-1]["end"] == len(csv_file.getvalue().encode("utf-8"))
+
+
+def test_offsets_count_utf8_bytes():
+    csv_file = io.StringIO(newline="")
+    writer = IndexedCsvWriter(csv_file, COLUMNS)
+
+    writer.writerows(make_rows([1, 2], name="café, olé"))
+
+    assert read_range(csv_file, writer.ranges[1])[0][3] == "café, olé"
+
+
+def test_plant_seen_again_gets_another_range():
+    writer = IndexedCsvWriter(io.StringIO(), COLUMNS)
+
+    writer.writerows(make_rows([1, 2, 1]))
+
+    assert [plant_range["plant_id"] for plant_range in writer.ranges] == [1, 2, 1]
+
+
+def test_columns_without_a_plant_are_not_indexed():
+    csv_file = io.StringIO()
+    writer = IndexedCsvWriter(csv_file, ["a", "b"])
+
+    writer.writerows([(1, 2), (3, 4)])
+
+    assert writer.ranges == []
+    assert len(csv_file.getvalue().splitlines()) == 3
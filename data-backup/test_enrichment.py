@@ -0,0 +1,83 @@
+# pylint: skip-file
+import sqlite3
+import pandas as pd
+import pytest
+from enrichment import PlantDimensions, EnrichingCursor, DIMENSION_COLUMNS
+
+JOIN_QUERY = """
+SELECT recording.recording_id, recording.recording_taken, recording.soil_moisture,
+    plant.plant_id, species.plant_name, country.country_name,
+    botanist.botanist_first_name, botanist.botanist_last_name,
+    botanist.botanist_email, botanist.botanist_phone_number
+FROM beta.recording
+JOIN beta.plant ON recording.plant_id = plant.plant_id
+JOIN beta.species ON plant.species_id = species.species_id
+JOIN beta.country ON plant.country_id = country.country_id
+JOIN beta.botanist ON plant.botanist_id = botanist.botanist_id
+ORDER BY recording.plant_id, recording.recording_taken;
+"""
+
+RECORDING_QUERY = """
+SELECT recording_id, recording_taken, soil_moisture, plant_id FROM beta.recording
+ORDER BY plant_id, recording_taken;
+"""
+
+
+@pytest.fixture
+def cursor():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("ATTACH DATABASE ':memory:' AS beta")
+    conn.executescript("""
+    CREATE TABLE beta.country (country_id INTEGER PRIMARY KEY, country_name TEXT);
+    CREATE TABLE beta.species (species_id INTEGER PRIMARY KEY, plant_name TEXT);
+    CREATE TABLE beta.botanist (botanist_id INTEGER PRIMARY KEY, botanist_first_name TEXT,
+        botanist_last_name TEXT, botanist_email TEXT, botanist_phone_number TEXT);
+    CREATE TABLE beta.plant (plant_id INTEGER PRIMARY KEY, botanist_id INTEGER,
+        species_id INTEGER, country_id INTEGER);
+    CREATE TABLE beta.recording (recording_id INTEGER PRIMARY KEY, plant_id INTEGER,
+        recording_taken TEXT, soil_moisture REAL);
+    INSERT INTO beta.country VALUES (1, 'Brazil'), (2, 'United Kingdom');
+    INSERT INTO beta.species VALUES (1, 'Cactus'), (2, 'Fern');
+    INSERT INTO beta.botanist VALUES (1, 'Carl', 'Linnaeus', 'carl@lnhm.co.uk', '123'),
+        (2, 'Eliza', 'Andrews', 'eliza@lnhm.co.uk', '456');
+    INSERT INTO beta.plant VALUES (0, 1, 1, 1), (1, 2, 2, 2), (2, 1, 2, 2), (3, 2, 1, 99);
+    """)
+    conn.executemany("INSERT INTO beta.recording VALUES (?, ?, ?, ?)",
+                     [(index, index % 6, f"2024-11-25 10:{index % 60:02}:00", index / 3)
+                      for index in range(1, 200)])
+    yield conn.cursor()
+    conn.close()
+
+
+def test_enriching_cursor_matches_join(cursor):
+    dimensions = PlantDimensions.load(cursor, "beta")
+    expected = cursor.execute(JOIN_QUERY).fetchall()
+
+    cursor.execute(RECORDING_QUERY)
+    enriching_cursor = EnrichingCursor(cursor, dimensions)
+    rows = []
+    while batch := enriching_cursor.fetchmany(7):
+        rows += batch
+
+    assert rows == expected
+    assert [column[0] for column in enriching_cursor.description] == \
+        ["recording_id", "recording_taken", "soil_moisture", "plant_id"] + DIMENSION_COLUMNS
+
+
+def test_enriching_cursor_skips_batches_of_unknown_plants(cursor):
+    dimensions = PlantDimensions.load(cursor, "beta")
+    cursor.execute("SELECT recording_id, plant_id FROM beta.recording ORDER BY plant_id DESC")
+    enriching_cursor = EnrichingCursor(cursor, dimensions)
+
+    assert enriching_cursor.fetchmany(10)[0][1] == 2
+
+
+def test_enrich_frame_matches_join(cursor):
+    dimensions = PlantDimensions.load(cursor, "beta")
+    columns = ["plant_name", "country_name", "botanist_first_name"]
+    expected = pd.read_sql(JOIN_QUERY, cursor.connection)[
+        ["recording_id", "recording_taken", "soil_moisture", "plant_id"] + columns]
+
+    recordings = pd.read_sql(RECORDING_QUERY, cursor.connection)
+
+    pd.testing.assert_frame_equal(dimensions.enrich_frame(recordings, columns), expected)
@@ -0,0 +1,399 @@
+# pylint: skip-file
+import io
+import json
+from datetime import datetime, timedelta
+import pytest
+import pyarrow.parquet as pq
+import extract_from_database as backup
+from enrichment import build_dimension_query
+from archive_manifest import validate_manifest, MANIFEST_VERSION
+
+BUCKET = "plant-backups"
+COLUMNS = ["recording_id", "recording_taken", "last_watered", "soil_moisture",
+           "temperature", "plant_id", "plant_name", "country_name",
+           "botanist_first_name", "botanist_last_name", "botanist_email",
+           "botanist_phone_number"]
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.description = [(column,) for column in COLUMNS]
+        self.fetch_sizes = []
+
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+class FakeDatabase:
+    """Answers the archive queries from an in-memory recording table"""
+
+    def __init__(self, rows, on_export=None):
+        self.rows = list(rows)
+        self.on_export = on_export
+        self.commits = 0
+        self.closed = False
+
+    def cursor(self):
+        return FakeDatabaseCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDatabaseCursor(FakeCursor):
+    def __init__(self, database):
+        super().__init__([])
+        self.database = database
+        self.result = None
+        self.rowcount = -1
+
+    def in_slice(self, min_id, max_id):
+        return [row for row in self.database.rows if min_id <= row[0] <= max_id]
+
+    def select(self, rows):
+        self.rows = [row[:6] for row in rows]
+        self.description = [(column,) for column in COLUMNS[:6]]
+
+    def execute(self, query, params=()):
+        ids = [row[0] for row in self.database.rows]
+        if query == build_dimension_query(backup.SCHEMA):
+            self.result = list({row[5]: (row[5], *row[6:]) for row in self.database.rows}.values())
+        elif query == backup.WATERMARK_QUERY:
+            self.result = (min(ids, default=None), max(ids, default=None))
+        elif query == backup.COUNT_QUERY:
+            self.result = (len(self.in_slice(*params)),)
+        elif query == backup.BOUNDS_QUERY:
+            rows = self.in_slice(*params)
+            self.result = (min(row[5] for row in rows), max(row[5] for row in rows),
+                           min(row[1] for row in rows), max(row[1] for row in rows))
+        elif query == backup.QUERY:
+            self.select(self.in_slice(*params))
+            if self.database.on_export:
+                self.database.on_export(self.database)
+        elif query == backup.PARTITION_QUERIES["plant"]:
+            self.select([row for row in self.in_slice(*params[:2])
+                         if params[2] <= row[5] <= params[3]])
+        elif query == backup.PARTITION_QUERIES["hour"]:
+            self.select([row for row in self.in_slice(*params[:2])
+                         if params[2] <= row[1] < params[3]])
+        elif query == backup.DELETE_QUERY:
+            batch_size, min_id, max_id = params
+            deleted = self.in_slice(min_id, max_id)[:batch_size]
+            self.database.rows = [row for row in self.database.rows if row not in deleted]
+            self.rowcount = len(deleted)
+
+    def fetchone(self):
+        return self.result
+
+    def fetchall(self):
+        return self.result
+
+
+def make_rows(count):
+    taken = datetime(2024, 11, 25, 10, 30)
+    return [(index, taken + timedelta(minutes=index), taken, 50.0, 20.0, index % 3, "cactus", "Brazil", "Carl",
+             "Linnaeus", "carl.linnaeus@lnhm.co.uk", "(146)994-1635x35992")
+            for index in range(count)]
+
+
+def test_export_rows_writes_csv_in_batches():
+    csv_file = io.StringIO()
+    row_count = backup.export_rows(FakeCursor(make_rows(5)), csv_file, batch_size=2)
+
+    lines = csv_file.getvalue().splitlines()
+    assert row_count == 5
+    assert lines[0] == ",".join(COLUMNS)
+    assert len(lines) == 6
+
+
+def test_rows_are_fetched_in_batches_and_written_across_batch_boundaries():
+    cursor = FakeCursor(make_rows(2 * backup.BATCH_SIZE + 3))
+    csv_file = io.StringIO()
+
+    row_count = backup.export_rows(cursor, csv_file)
+
+    lines = csv_file.getvalue().splitlines()
+    assert cursor.fetch_sizes == [backup.BATCH_SIZE] * 4
+    assert row_count == 2 * backup.BATCH_SIZE + 3
+    assert lines[0] == ",".join(COLUMNS)
+    assert [int(line.split(",")[0]) for line in lines[1:]] == list(range(row_count))
+
+
+def test_export_to_s3_streams_every_format(s3_client, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_FORMATS", ["csv", "parquet"])
+
+    entries, index = backup.export_to_s3(FakeCursor(make_rows(7)), s3_client, BUCKET, "backup")
+
+    assert [(entry["key"], entry["row_count"]) for entry in entries] == [
+        ("backup.csv", 7), ("backup.parquet", 7)]
+    assert entries[0]["columns"] == COLUMNS
+    assert "plant_ranges" not in entries[1]
+    assert sum(row_group["row_count"] for row_group in entries[1]["row_groups"]) == 7
+    assert index.plant_ids == {0, 1, 2}
+    csv_body = s3_client.get_object(Bucket=BUCKET, Key="backup.csv")["Body"].read()
+    assert len(csv_body.decode("utf-8").splitlines()) == 8
+    parquet_body = s3_client.get_object(Bucket=BUCKET, Key="backup.parquet")["Body"].read()
+    assert pq.read_table(io.BytesIO(parquet_body)).num_rows == 7
+
+
+def test_export_to_s3_aborts_on_failure(s3_client, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_FORMATS", ["csv"])
+    cursor = FakeCursor(make_rows(3))
+    cursor.fetchmany = lambda size: (_ for _ in ()).throw(RuntimeError("connection lost"))
+
+    with pytest.raises(RuntimeError):
+        backup.export_to_s3(cursor, s3_client, BUCKET, "backup")
+
+    assert "Contents" not in s3_client.list_objects_v2(Bucket=BUCKET)
+
+
+def get_manifest(s3_client):
+    key = f"{backup.get_archive_prefix()}.manifest.json"
+    return json.loads(s3_client.get_object(Bucket=BUCKET, Key=key)["Body"].read())
+
+
+def test_archive_slice_keeps_rows_inserted_during_export(s3_client, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_FORMATS", ["csv"])
+    late_rows = make_rows(12)[10:]
+    database = FakeDatabase(make_rows(10),
+                            on_export=lambda database: database.rows.extend(late_rows))
+
+    manifest = backup.archive_slice(database, s3_client, BUCKET)
+
+    assert database.rows == late_rows
+    assert manifest == get_manifest(s3_client)
+    assert manifest["min_recording_id"] == 0
+    assert manifest["max_recording_id"] == 9
+    assert manifest["row_count"] == manifest["deleted_count"] == 10
+    assert manifest["status"] == "archived"
+    assert manifest["partitions"] == 1
+    [entry] = manifest["files"]
+    assert entry["key"] == f"{backup.get_archive_prefix()}.csv"
+    assert entry["format"] == "csv"
+    assert entry["row_count"] == 10
+    assert entry["columns"] == COLUMNS
+
+
+def test_manifest_describes_the_archive(s3_client, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_FORMATS", ["csv", "parquet"])
+    rows = sorted(make_rows(30), key=lambda row: (row[5], row[1]))
+
+    backup.archive_slice(FakeDatabase(rows), s3_client, BUCKET)
+
+    manifest = get_manifest(s3_client)
+    validate_manifest(manifest)
+    assert manifest["manifest_version"] == MANIFEST_VERSION
+    assert manifest["plant_ids"] == [0, 1, 2]
+    assert manifest["min_recording_taken"] == "2024-11-25 10:30:00"
+    assert manifest["max_recording_taken"] == "2024-11-25 10:59:00"
+    assert manifest["column_stats"]["soil_moisture"] == {"min": 50.0, "max": 50.0,
+                                                         "null_count": 0}
+    assert manifest["column_stats"]["recording_id"]["max"] == 29
+    parquet_entry = manifest["files"][1]
+    assert [row_group["id"] for row_group in parquet_entry["row_groups"]] == [0]
+    assert parquet_entry["row_groups"][0]["plant_ids"] == [0, 1, 2]
+
+
+def test_manifest_locates_each_plants_rows(s3_client, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_FORMATS", ["csv"])
+    rows = sorted(make_rows(30), key=lambda row: (row[5], row[1]))
+
+    manifest = backup.archive_slice(FakeDatabase(rows), s3_client, BUCKET)
+
+    [entry] = manifest["files"]
+    assert [plant_range["plant_id"] for plant_range in entry["plant_ranges"]] == [0, 1, 2]
+    for plant_range in entry["plant_ranges"]:
+        body = s3_client.get_object(
+            Bucket=BUCKET, Key=entry["key"],
+            Range=f"bytes={plant_range['start']}-{plant_range['end'] - 1}")["Body"].read()
+        lines = body.decode("utf-8").splitlines()
+        assert len(lines) == plant_range["row_count"] == 10
+        assert {line.split(",")[5] for line in lines} == {str(plant_range["plant_id"])}
+        assert lines[0].split(",")[1] == plant_range["min_recording_taken"]
+        assert lines[-1].split(",")[1] == plant_range["max_recording_taken"]
+
+
+def test_delete_slice_commits_every_batch():
+    database = FakeDatabase(make_rows(25))
+
+    deleted_count = backup.delete_slice(database, database.cursor(), [[0, 19]], batch_size=5)
+
+    assert deleted_count == 20
+    assert database.commits == 5
+    assert [row[0] for row in database.rows] == list(range(20, 25))
+
+
+def test_archive_slice_keeps_rows_committed_after_the_export(s3_client, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_FORMATS", ["csv"])
+    rows = make_rows(10)
+    late_row = rows.pop(4)
+    database = FakeDatabase(rows)
+    count_slice = backup.count_slice
+
+    def count_then_commit_late_row(cursor, min_id, max_id):
+        count = count_slice(cursor, min_id, max_id)
+        database.rows.append(late_row)
+        return count
+    monkeypatch.setattr(backup, "count_slice", count_then_commit_late_row)
+
+    manifest = backup.archive_slice(database, s3_client, BUCKET)
+
+    assert manifest["recording_id_runs"] == [[0, 3], [5, 9]]
+    assert manifest["deleted_count"] == 9
+    assert database.rows == [late_row]
+
+
+def test_archive_slice_resumes_an_unfinished_delete(s3_client, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_FORMATS", ["csv"])
+    database = FakeDatabase(make_rows(10))
+    delete_slice = backup.delete_slice
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("connection lost")
+    monkeypatch.setattr(backup, "delete_slice", crash)
+    with pytest.raises(RuntimeError):
+        backup.archive_slice(database, s3_client, BUCKET)
+    assert get_manifest(s3_client)["status"] == "exported"
+
+    monkeypatch.setattr(backup, "delete_slice", delete_slice)
+    database.rows += make_rows(12)[10:]
+    manifest = backup.archive_slice(database, s3_client, BUCKET)
+
+    assert manifest["status"] == get_manifest(s3_client)["status"] == "archived"
+    assert manifest["row_count"] == manifest["deleted_count"] == 10
+    assert [row[0] for row in database.rows] == [10, 11]
+
+
+def test_archive_slice_resumes_an_unfinished_delete_from_an_earlier_day(s3_client, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_FORMATS", ["csv"])
+    monkeypatch.setattr(backup, "get_archive_prefix", lambda: "2024-11-25_plant_monitor_data")
+    database = FakeDatabase(make_rows(10))
+    delete_slice = backup.delete_slice
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("connection lost")
+    monkeypatch.setattr(backup, "delete_slice", crash)
+    with pytest.raises(RuntimeError):
+        backup.archive_slice(database, s3_client, BUCKET)
+
+    monkeypatch.setattr(backup, "delete_slice", delete_slice)
+    monkeypatch.setattr(backup, "get_archive_prefix", lambda: "2024-11-26_plant_monitor_data")
+    database.rows += make_rows(12)[10:]
+    manifest = backup.archive_slice(database, s3_client, BUCKET)
+
+    earlier = json.loads(s3_client.get_object(
+        Bucket=BUCKET, Key="2024-11-25_plant_monitor_data.manifest.json")["Body"].read())
+    assert earlier["status"] == "archived"
+    assert earlier["deleted_count"] == 10
+    assert manifest["min_recording_id"] == 10
+    assert manifest["row_count"] == manifest["deleted_count"] == 2
+    assert database.rows == []
+
+
+def test_archive_slice_does_not_delete_unexported_rows(s3_client, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_FORMATS", ["csv"])
+    database = FakeDatabase(make_rows(5))
+    monkeypatch.setattr(backup, "export_rows", lambda cursor, *args, **kwargs: 4)
+
+    with pytest.raises(RuntimeError):
+        backup.archive_slice(database, s3_client, BUCKET)
+
+    assert len(database.rows) == 5
+    assert database.commits == 0
+
+
+def test_archive_slice_refuses_to_overwrite_an_archive(s3_client, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_FORMATS", ["csv"])
+    backup.archive_slice(FakeDatabase(make_rows(3)), s3_client, BUCKET)
+    database = FakeDatabase(make_rows(5))
+
+    with pytest.raises(RuntimeError):
+        backup.archive_slice(database, s3_client, BUCKET)
+
+    assert len(database.rows) == 5
+    assert get_manifest(s3_client)["row_count"] == 3
+
+
+def test_archive_slice_skips_empty_table(s3_client):
+    assert backup.archive_slice(FakeDatabase([]), s3_client, BUCKET) is None
+    assert "Contents" not in s3_client.list_objects_v2(Bucket=BUCKET)
+
+
+@pytest.mark.parametrize("partition_by", ["plant", "hour"])
+def test_archive_slice_exports_partitions_in_parallel(s3_client, monkeypatch, partition_by):
+    monkeypatch.setattr(backup, "BACKUP_FORMATS", ["csv"])
+    monkeypatch.setattr(backup, "BACKUP_PARTITIONS", 3)
+    monkeypatch.setattr(backup, "PARTITION_BY", partition_by)
+    database = FakeDatabase(make_rows(300))
+    monkeypatch.setattr(backup, "get_connection", lambda: database)
+
+    manifest = backup.archive_slice(database, s3_client, BUCKET)
+
+    assert manifest["partitions"] == 3
+    assert manifest["row_count"] == manifest["deleted_count"] == 300
+    exported_ids = []
+    for entry in manifest["files"]:
+        assert entry["partition"]["by"] == partition_by
+        body = s3_client.get_object(Bucket=BUCKET, Key=entry["key"])["Body"].read()
+        header, *lines = body.decode("utf-8").splitlines()
+        assert header == ",".join(COLUMNS)
+        assert len(lines) == entry["row_count"]
+        exported_ids += [int(line.split(",")[0]) for line in lines]
+    assert sorted(exported_ids) == list(range(300))
+
+
+def test_export_slice_deletes_parts_when_a_partition_fails(s3_client, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_FORMATS", ["csv"])
+    monkeypatch.setattr(backup, "BACKUP_PARTITIONS", 3)
+    monkeypatch.setattr(backup, "BACKUP_WORKERS", 1)
+    monkeypatch.setattr(backup, "PARTITION_BY", "plant")
+    database = FakeDatabase(make_rows(30))
+    monkeypatch.setattr(backup, "get_connection", lambda: database)
+    export_to_s3 = backup.export_to_s3
+
+    def fail_last_partition(cursor, s3_client, bucket, prefix, partition):
+        if prefix.endswith("part-0002"):
+            raise RuntimeError("connection lost")
+        return export_to_s3(cursor, s3_client, bucket, prefix, partition)
+    monkeypatch.setattr(backup, "export_to_s3", fail_last_partition)
+
+    with pytest.raises(RuntimeError):
+        backup.archive_slice(database, s3_client, BUCKET)
+
+    assert len(database.rows) == 30
+    assert "Contents" not in s3_client.list_objects_v2(Bucket=BUCKET)
+
+
+def test_lambda_handler_reports_backup_metrics(s3_client, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_FORMATS", ["csv"])
+    monkeypatch.setenv("BUCKET_NAME", BUCKET)
+    monkeypatch.setattr(backup, "get_client", lambda: s3_client)
+    monkeypatch.setattr(backup, "get_connection", lambda: FakeDatabase(make_rows(10)))
+
+    response = backup.lambda_handler({}, None)
+
+    stages = response["metrics"]["stages"]
+    assert response["statusCode"] == 200
+    assert set(stages) == {"backup", "export", "delete"}
+    assert stages["export"]["rows_out"] == 10
+    assert stages["delete"]["rows_out"] == 10
+    assert response["metrics"]["db_round_trips"] > 0
+
+
+def test_lambda_handler_reports_failed_stage(s3_client, monkeypatch):
+    def get_connection():
+        raise RuntimeError("down")
+
+    monkeypatch.setattr(backup, "get_client", lambda: s3_client)
+    monkeypatch.setattr(backup, "get_connection", get_connection)
+
+    response = backup.lambda_handler({}, None)
+
+    assert response["statusCode"] == 500
+    assert response["metrics"]["stages"]["backup"]["failures"] == 1
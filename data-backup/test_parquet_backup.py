@@ -0,0 +1,51 @@
+# pylint: skip-file
+import io
+from datetime import datetime, timedelta
+import pyarrow.parquet as pq
+from parquet_backup import ParquetBackupWriter, read_backup
+
+
+def make_rows():
+    start = datetime(2024, 11, 25)
+    rows = []
+    for plant_id in range(25):
+        for minute in range(0, 180, 30):
+            taken = start + timedelta(minutes=minute)
+            rows.append((len(rows) + 1, taken, taken, 50.0 + plant_id, 20.0, plant_id,
+                         "cactus", "Brazil", "Carl", "Linnaeus",
+                         "carl.linnaeus@lnhm.co.uk", "(146)994-1635x35992"))
+    return rows
+
+
+def write_backup(rows):
+    sink = io.BytesIO()
+    with ParquetBackupWriter(sink, plants_per_row_group=10) as writer:
+        writer.write_rows(rows[:70])
+        writer.write_rows(rows[70:])
+    sink.seek(0)
+    return sink
+
+
+def test_writer_splits_row_groups_by_hour_and_plant_bucket():
+    sink = write_backup(make_rows())
+    parquet_file = pq.ParquetFile(sink)
+
+    assert parquet_file.metadata.num_rows == 150
+    assert parquet_file.num_row_groups == 3 * 3
+    plant_stats = parquet_file.metadata.row_group(0).column(5).statistics
+    assert (plant_stats.min, plant_stats.max) == (0, 9)
+
+
+def test_read_backup_filters_and_projects():
+    sink = write_backup(make_rows())
+
+    table = read_backup(sink, columns=["plant_id", "soil_moisture"], plant_ids=[12],
+                        start=datetime(2024, 11, 25, 1), end=datetime(2024, 11, 25, 1, 59))
+
+    assert table.column_names == ["plant_id", "soil_moisture"]
+    assert table["plant_id"].to_pylist() == [12, 12]
+    assert table["soil_moisture"].to_pylist() == [62.0, 62.0]
+
+
+def test_read_backup_without_filters_returns_everything():
+    assert read_backup(write_backup(make_rows())).num_rows == 150
@@ -0,0 +1,29 @@
+# pylint: skip-file
+from datetime import datetime
+import pytest
+from partitions import plant_partitions, hour_partitions, get_partitions
+
+
+def test_plant_partitions_cover_every_plant():
+    assert plant_partitions(0, 50, 4) == [(0, 12), (13, 25), (26, 38), (39, 50)]
+    assert plant_partitions(3, 4, 8) == [(3, 3), (4, 4)]
+
+
+def test_hour_partitions_cover_every_recording():
+    partitions = hour_partitions(datetime(2024, 11, 25, 10, 30),
+                                 datetime(2024, 11, 25, 14, 59), 2)
+
+    assert partitions == [(datetime(2024, 11, 25, 10), datetime(2024, 11, 25, 13)),
+                          (datetime(2024, 11, 25, 13), datetime(2024, 11, 25, 16))]
+
+
+def test_single_hour_is_one_partition():
+    taken = datetime(2024, 11, 25, 10, 30)
+
+    assert hour_partitions(taken, taken, 4) == [(datetime(2024, 11, 25, 10),
+                                                 datetime(2024, 11, 25, 11))]
+
+
+def test_get_partitions_rejects_unknown_column():
+    with pytest.raises(ValueError):
+        get_partitions("botanist", (0, 50, None, None), 4)
@@ -0,0 +1,60 @@
+# pylint: skip-file
+import io
+import pytest
+from s3_stream import S3MultipartWriter, MIN_PART_SIZE
+
+BUCKET = "plant-backups"
+
+
+def read_object(client, key):
+    return client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+
+
+def test_small_object_uses_single_put(s3_client):
+    with S3MultipartWriter(s3_client, BUCKET, "small.csv") as upload:
+        upload.write(b"a,b\n")
+        upload.write(b"1,2\n")
+
+    assert upload.upload_id is None
+    assert read_object(s3_client, "small.csv") == b"a,b\n1,2\n"
+
+
+def test_large_object_uploads_parts(s3_client):
+    chunk = bytes(range(256)) * 4096
+    expected = io.BytesIO()
+    with S3MultipartWriter(s3_client, BUCKET, "large.csv",
+                           part_size=MIN_PART_SIZE, max_in_flight=2) as upload:
+        for _ in range(11 * MIN_PART_SIZE // 5 // len(chunk)):
+            upload.write(chunk)
+            expected.write(chunk)
+
+    assert len(upload.futures) == 3
+    assert read_object(s3_client, "large.csv") == expected.getvalue()
+
+
+def test_text_wrapper_streams_csv(s3_client):
+    upload = S3MultipartWriter(s3_client, BUCKET, "text.csv")
+    text = io.TextIOWrapper(upload, encoding="utf-8", newline="")
+    text.write("plant_name\nrésumé\n")
+    text.close()
+
+    assert upload.closed
+    assert read_object(s3_client, "text.csv").decode("utf-8") == "plant_name\nrésumé\n"
+
+
+def test_failed_part_aborts_upload(s3_client, mocker):
+    upload = S3MultipartWriter(s3_client, BUCKET, "broken.csv", part_size=MIN_PART_SIZE)
+    mocker.patch.object(upload, "upload_part", side_effect=RuntimeError("network down"))
+
+    with pytest.raises(RuntimeError):
+        with upload:
+            upload.write(b"x" * (MIN_PART_SIZE + 1))
+
+    assert upload.closed
+    assert s3_client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+    assert "Contents" not in s3_client.list_objects_v2(Bucket=BUCKET)
+
+
+def test_part_size_must_meet_s3_minimum(s3_client):
+    with pytest.raises(ValueError):
+        S3MultipartWriter(s3_client, BUCKET, "tiny.csv", part_size=1024)
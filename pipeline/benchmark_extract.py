@@ -0,0 +1,70 @@
+"""Benchmarks building the extract DataFrame with repeated pd.concat
+   against the preallocated DataFrameBuilder. The concat version grows
+   quadratically, so above CONCAT_LIMIT plants only the builder is timed.
+   Usage: python3 benchmark_extract.py [plant counts...]"""
+import sys
+import time
+import pandas as pd
+from extract import initialise_dataframe, DataFrameBuilder
+
+PLANT_COUNTS = [50, 500, 5000, 50000]
+CONCAT_LIMIT = 5000
+
+
+def make_record(plant_id: int) -> dict:
+    """Creates a synthetic extracted plant record."""
+    return {
+        "botanist_first_name": "Carl",
+        "botanist_last_name": "Linnaeus",
+        "botanist_email": "carl.linnaeus@lnhm.co.uk",
+        "botanist_phone_number": "(146)994-1635x35992",
+        "plant_name": "Epipremnum Aureum",
+        "recording_taken": "2024-11-25 14:19:28",
+        "last_watered": "Mon, 25 Nov 2024 14:03:04 GMT",
+        "soil_moisture": 99.0464993678606,
+        "temperature": 13.15915073027191,
+        "country_code": "BR",
+        "plant_id": plant_id
+    }
+
+
+def build_with_concat(records: list) -> pd.DataFrame:
+    """The original approach of concatenating one row at a time."""
+    plant_dataframe = initialise_dataframe()
+    for record in records:
+        plant_dataframe = pd.concat(
+            [plant_dataframe, pd.DataFrame([record])], ignore_index=True)
+    return plant_dataframe
+
+
+def build_with_builder(records: list) -> pd.DataFrame:
+    """Fills the column buffers and builds the DataFrame once."""
+    builder = DataFrameBuilder(len(records))
+    for record in records:
+        builder.append(record)
+    return builder.build()
+
+
+def time_call(function, records: list) -> float:
+    """Returns how long the function took in seconds."""
+    started = time.perf_counter()
+    function(records)
+    return time.perf_counter() - started
+
+
+def main(plant_counts: list) -> None:
+    """Prints the timings of both approaches for each plant count."""
+    print(f"{'plants':>8} {'concat (s)':>12} {'builder (s)':>12} {'speedup':>9}")
+    for plant_count in plant_counts:
+        records = [make_record(plant_id) for plant_id in range(plant_count)]
+        builder_time = time_call(build_with_builder, records)
+        if plant_count > CONCAT_LIMIT:
+            print(f"{plant_count:>8} {'skipped':>12} {builder_time:>12.3f} {'-':>9}")
+            continue
+        concat_time = time_call(build_with_concat, records)
+        print(f"{plant_count:>8} {concat_time:>12.3f} {builder_time:>12.3f} "
+              f"{concat_time / builder_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(count) for count in sys.argv[1:]] or PLANT_COUNTS)
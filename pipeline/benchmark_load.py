@@ -0,0 +1,94 @@
+"""Benchmarks inserting recordings one row and one commit at a time
+   against bulk_insert_into_recording_table, using SQLite as a local
+   stand-in for SQL Server with a simulated network round trip.
+   Usage: python3 benchmark_load.py [row counts...]"""
+import sqlite3
+import sys
+import time
+import numpy as np
+import pandas as pd
+from load import insert_into_recording_table, bulk_insert_into_recording_table
+
+ROW_COUNTS = [50, 500, 5000]
+ROUND_TRIP = 0.002
+
+sqlite3.register_adapter(pd.Timestamp, str)
+sqlite3.register_adapter(np.int64, int)
+
+
+class RoundTripCursor:  # pylint: disable=too-few-public-methods
+    """Cursor that converts pymssql placeholders and sleeps for each round trip."""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self.cursor = cursor
+
+    def execute(self, query: str, params: tuple = ()) -> None:
+        """Runs a query after one simulated round trip."""
+        time.sleep(ROUND_TRIP)
+        self.cursor.execute(query.replace("%s", "?"), params)
+
+
+class RoundTripConnection:
+    """Connection whose commits and rollbacks each cost one round trip."""
+
+    def __init__(self):
+        self.connection = sqlite3.connect(":memory:")
+        self.connection.execute("""CREATE TABLE recording (
+            recording_id INTEGER PRIMARY KEY, plant_id INTEGER NOT NULL,
+            recording_taken TEXT NOT NULL, last_watered TEXT,
+            soil_moisture REAL, temperature REAL)""")
+
+    def cursor(self) -> RoundTripCursor:
+        """Gets cursor"""
+        return RoundTripCursor(self.connection.cursor())
+
+    def commit(self) -> None:
+        """Commits after one simulated round trip."""
+        time.sleep(ROUND_TRIP)
+        self.connection.commit()
+
+    def rollback(self) -> None:
+        """Rolls back after one simulated round trip."""
+        time.sleep(ROUND_TRIP)
+        self.connection.rollback()
+
+    def row_count(self) -> int:
+        """Counts the inserted recordings."""
+        return self.connection.execute("SELECT COUNT(*) FROM recording").fetchone()[0]
+
+
+def make_recordings(row_count: int) -> pd.DataFrame:
+    """Creates a synthetic transformed recording DataFrame."""
+    taken = pd.Timestamp("2024-11-25 14:19:28", tz="UTC")
+    return pd.DataFrame({
+        "plant_id": np.arange(row_count) % 51,
+        "recording_taken": [taken] * row_count,
+        "last_watered": [taken] * row_count,
+        "soil_moisture": np.random.default_rng(0).uniform(0, 100, row_count),
+        "temperature": np.random.default_rng(1).uniform(10, 30, row_count),
+    })
+
+
+def rows_per_second(insert, recordings: pd.DataFrame) -> float:
+    """Inserts the recordings into a fresh database and returns the insert rate."""
+    connection = RoundTripConnection()
+    started = time.perf_counter()
+    insert(connection, connection.cursor(), recordings)
+    elapsed = time.perf_counter() - started
+    assert connection.row_count() == len(recordings)
+    return len(recordings) / elapsed
+
+
+def main(row_counts: list) -> None:
+    """Prints the insert rates of both approaches for each row count."""
+    print(f"Simulated round trip: {ROUND_TRIP * 1000:.0f}ms")
+    print(f"{'rows':>7} {'per-row (rows/s)':>17} {'bulk (rows/s)':>14} {'speedup':>9}")
+    for row_count in row_counts:
+        recordings = make_recordings(row_count)
+        row_rate = rows_per_second(insert_into_recording_table, recordings)
+        bulk_rate = rows_per_second(bulk_insert_into_recording_table, recordings)
+        print(f"{row_count:>7} {row_rate:>17.0f} {bulk_rate:>14.0f} {bulk_rate / row_rate:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(count) for count in sys.argv[1:]] or ROW_COUNTS)
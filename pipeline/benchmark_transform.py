@@ -0,0 +1,47 @@
+"""Benchmarks cleaning plant names row by row with Series.apply
+   against the factorised lookup in clean_names.
+   Usage: python3 benchmark_transform.py [row counts...]"""
+import random
+import sys
+import time
+import pandas as pd
+from transform import clean_name, clean_names
+
+ROW_COUNTS = [10000, 100000, 1000000]
+SPECIES = ["Epipremnum Aureum", "Venus Flytrap", "Corpse flower", "Rafflesia arnoldii",
+           "Black bat flower", "Pitcher plant", "Wollemi pine", "Bird of paradise",
+           "Cactus", "Dragon tree", "Asclepias Curassavica", "Brugmansia X Candida",
+           "Canna 'Striata'", "Colocasia Esculenta", "Euphorbia Cotinifolia",
+           "Ipomoea Batatas", "Cuphea 'David Verity'", "Manihot Esculenta 'Variegata'",
+           "Musa Basjoo", "Salvia Splendens", "Anthurium", "Cordyline Fruticosa",
+           "Ficus", "Palm Trees", "Dieffenbachia Seguine", "Spathiphyllum", "Croton",
+           "Ficus Elastica", "Aloe Vera", "Sansevieria Trifasciata",
+           "Philodendron Hederaceum", "Schefflera Arboricola", "Aglaonema Commutatum",
+           "Monstera Deliciosa", "Tacca Integrifolia", "Psychopsis Papilio",
+           "Saintpaulia Ionantha", "Gaillardia", "Amaryllis", "Caladium Bicolor",
+           "Chlorophytum Comosum", "Araucaria Heterophylla", "Begonia",
+           "Medinilla Magnifica", "Calliandra Haematocephala", "Zamioculcas Zamiifolia",
+           "Crassula Ovata"]
+
+
+def time_call(function, names: pd.Series) -> float:
+    """Returns how long the function took in seconds."""
+    started = time.perf_counter()
+    function(names)
+    return time.perf_counter() - started
+
+
+def main(row_counts: list) -> None:
+    """Prints the timings of both approaches for each row count."""
+    rng = random.Random(0)
+    print(f"{'rows':>9} {'apply (s)':>10} {'lookup (s)':>11} {'speedup':>9}")
+    for row_count in row_counts:
+        names = pd.Series([rng.choice(SPECIES) for _ in range(row_count)])
+        apply_time = time_call(lambda names: names.apply(clean_name), names)
+        lookup_time = time_call(clean_names, names)
+        print(f"{row_count:>9} {apply_time:>10.3f} {lookup_time:>11.3f} "
+              f"{apply_time / lookup_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(count) for count in sys.argv[1:]] or ROW_COUNTS)
@@ -1,11 +1,83 @@
 """Script that emulates the ETL pipeline in a single file."""
+import pymssql
+from dotenv import load_dotenv
+import extract
+import transform
 import load
+from metrics import METRICS
+
+load_dotenv()
+
+CONNECTION = None
+INVOCATIONS = 0
+
+
+def is_alive(connection: object) -> bool:
+    """Checks the connection still works with a cheap query."""
+    try:
+        cursor = load.get_cursor(connection)
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        return True
+    except pymssql.Error:
+        return False
+
+
+def get_live_connection() -> object:
+    """Returns the connection kept from earlier warm invocations,
+       reconnecting if there is none or it has gone stale."""
+    global CONNECTION  # pylint: disable=global-statement
+    if CONNECTION is not None and not is_alive(CONNECTION):
+        print("Database connection is stale, reconnecting.")
+        try:
+            CONNECTION.close()
+        except pymssql.Error:
+            pass
+        CONNECTION = None
+    if CONNECTION is None:
+        CONNECTION = load.get_connection()
+    return CONNECTION
+
+
+def run_pipeline(shard_index: int = 0, shard_count: int = 1) -> dict:
+    """Runs extract, transform and load, reusing the connection, HTTP session
+       and caches of warm invocations. Returns the counts and the run's metrics,
+       which hold how long each stage took."""
+    global INVOCATIONS  # pylint: disable=global-statement
+    cold_start = INVOCATIONS == 0
+    INVOCATIONS += 1
+    METRICS.reset()
+
+    with METRICS.stage("setup"):
+        connection = get_live_connection()
+        cursor = load.get_cursor(connection)
+        load.initialise_state(cursor)
+
+    plant_dataframe = extract.load_into_dataframe(
+        shard_index=shard_index, shard_count=shard_count)
+    plant_dataframe = transform.transform_dataframe(plant_dataframe)
+    counts = load.load_dataframe(connection, cursor, plant_dataframe)
+
+    metrics = METRICS.log_summary("pipeline_run")
+    print(f"{'Cold' if cold_start else 'Warm'} start, stage timings: "
+          + ", ".join(f"{stage} {totals['seconds']:.3f}s"
+                      for stage, totals in metrics["stages"].items()))
+    return {"cold_start": cold_start, **counts, "metrics": metrics}
 
 
 def lambda_handler(event, context):  # pylint: disable=unused-argument
-    """Calls load.main() when the Lambda is invoked on AWS"""
+    """Runs the pipeline when the Lambda is invoked on AWS.
+       The event can set shard_index and shard_count so that several
+       invocations each extract a disjoint slice of the plant IDs."""
+    event = event or {}
     try:
-        load.main()
-        return {"statusCode": 200, "body": "Successfully executed ETL pipeline"}
+        report = run_pipeline(int(event.get("shard_index", 0)),
+                              int(event.get("shard_count", 1)))
+        return {"statusCode": 200, "body": "Successfully executed ETL pipeline",
+                "report": report}
     except Exception as e:  # pylint: disable=broad-except
         return {"statusCode": 500, "body": f"Error occurred: {str(e)}"}
+
+
+if __name__ == "__main__":
+    print(lambda_handler({}, None))
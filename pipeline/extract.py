@@ -1,21 +1,146 @@
 """Script that connects to 'data-eng-plants-api'
    Extracts the data
    Puts it into a Pandas DataFrame"""
-from typing import Optional
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Iterable, Iterator, List, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
+from registry import PlantRegistry
+from metrics import METRICS
 
 URL = "https://data-eng-plants-api.herokuapp.com/plants/"
 TOTAL_NUMBER_OF_PLANTS = 50
+MAX_WORKERS = 10
+REQUEST_TIMEOUT = 30
+RUN_DEADLINE = 45
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 4
+REQUEST_BUDGET = 150
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
 
 
-def get_plant_data(plant_id: int) -> dict:
+class PlantAPIClient:  # pylint: disable=too-many-instance-attributes
+    """Keep-alive HTTP client for the plants API.
+       Retries retryable responses with jittered exponential backoff. During a
+       run begun with start_run(), it stops making requests once the run's
+       request budget or deadline has been used up."""
+
+    def __init__(self, pool_size: int = MAX_WORKERS, max_retries: int = MAX_RETRIES,
+                 request_budget: int = REQUEST_BUDGET, run_deadline: float = RUN_DEADLINE):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.max_retries = max_retries
+        self.request_budget = request_budget
+        self.run_deadline = run_deadline
+        self.lock = threading.Lock()
+        self.requests_made = 0
+        self.deadline = None
+        self.stats = {}
+
+    def start_run(self) -> None:
+        """Resets the request budget, deadline and stats for a new run."""
+        with self.lock:
+            self.requests_made = 0
+            self.deadline = time.monotonic() + self.run_deadline
+            self.stats = {}
+
+    def end_run(self) -> None:
+        """Ends the run, so later requests are not held to its budget or deadline."""
+        with self.lock:
+            self.deadline = None
+
+    def take_request(self) -> Optional[str]:
+        """Uses up one request from the run's budget. Returns why no request
+           can be made, "budget" or "deadline", or None if one can.
+           Outside a run neither limit applies."""
+        with self.lock:
+            if self.deadline is not None:
+                if self.requests_made >= self.request_budget:
+                    return "budget"
+                if time.monotonic() >= self.deadline:
+                    return "deadline"
+            self.requests_made += 1
+            return None
+
+    @staticmethod
+    def backoff(retries: int) -> float:
+        """Seconds to wait before the next retry, using full jitter."""
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** retries))
+
+    def get_plant_data(self, plant_id: int, timeout: float = REQUEST_TIMEOUT) -> dict:
+        """GET request to collect plant data from API."""
+        started = time.perf_counter()
+        retries = 0
+        status_code = None
+        try:
+            while True:
+                refusal = self.take_request()
+                if refusal == "budget":
+                    return {"error": "budget",
+                            "message": f"Request budget used up before plant ID {plant_id}."}
+                if refusal == "deadline":
+                    return {"error": "deadline",
+                            "message": f"Run deadline passed before plant ID {plant_id}."}
+                try:
+                    response = self.session.get(URL + str(plant_id), timeout=timeout)
+                    status_code = response.status_code
+                    if status_code == 200:
+                        return response.json()
+                    if status_code not in RETRYABLE_STATUS_CODES or retries >= self.max_retries:
+                        return {"error": status_code,
+                                "message": f"Failed to retrieve data for plant ID {plant_id}."}
+                except (requests.ConnectionError, requests.Timeout):
+                    if retries >= self.max_retries:
+                        raise
+                delay = self.backoff(retries)
+                deadline = self.deadline
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    return {"error": status_code or "timeout",
+                            "message": f"Out of time retrying plant ID {plant_id}."}
+                time.sleep(delay)
+                retries += 1
+        finally:
+            latency = time.perf_counter() - started
+            METRICS.record_latency(plant_id, latency)
+            with self.lock:
+                self.stats[plant_id] = {"latency": latency,
+                                        "retries": retries,
+                                        "status_code": status_code}
+
+    def report(self) -> dict:
+        """Summarises the requests made during the current run."""
+        with self.lock:
+            latencies = [stat["latency"] for stat in self.stats.values()]
+            return {"requests": self.requests_made,
+                    "plants": len(self.stats),
+                    "retries": sum(stat["retries"] for stat in self.stats.values()),
+                    "max_latency": max(latencies, default=0.0),
+                    "per_plant": dict(self.stats)}
+
+
+CLIENT = None
+
+
+def get_client() -> PlantAPIClient:
+    """Returns the API client, reusing it across warm invocations."""
+    global CLIENT  # pylint: disable=global-statement
+    if CLIENT is None:
+        CLIENT = PlantAPIClient()
+    return CLIENT
+
+
+def get_plant_data(plant_id: int, timeout: float = REQUEST_TIMEOUT) -> dict:
     """GET request to collect plant data from API."""
-    response = requests.get(URL + str(plant_id), timeout=30)
-    if response.status_code == 200:
-        return response.json()
-    return {"error": response.status_code,
-            "message": f"Failed to retrieve data for plant ID {plant_id}."}
+    return get_client().get_plant_data(plant_id, timeout)
 
 
 def extract_plant_data(response: dict) -> dict:
@@ -38,14 +163,56 @@ def extract_plant_data(response: dict) -> dict:
     }
 
 
-def fetch_and_extract_plant_data(plant_id: int) -> Optional[dict]:
+def fetch_and_extract_plant_data(plant_id: int,
+                                 timeout: float = REQUEST_TIMEOUT) -> Optional[dict]:
     """Fetches plant data and extracts relevant fields."""
-    response = get_plant_data(plant_id)
+    response = get_plant_data(plant_id, timeout)
     if "error" in response:
         return None
     return extract_plant_data(response)
 
 
+def fetch_plant_data_concurrently(plant_ids: Iterable[int],
+                                  max_workers: int = MAX_WORKERS,
+                                  request_timeout: float = REQUEST_TIMEOUT,
+                                  run_deadline: float = RUN_DEADLINE) -> List[dict]:
+    """Fetches and extracts plant data with up to max_workers requests in flight.
+       A max_workers of 1 fetches one plant at a time. Plants that fail, or are
+       still pending when the run deadline passes, are dropped. Results are
+       returned in the order of plant_ids."""
+    plant_ids = list(plant_ids)
+    results = dict(iter_plant_data(plant_ids, max(max_workers, 1),
+                                   request_timeout, run_deadline))
+    return [results[plant_id] for plant_id in plant_ids if results.get(plant_id)]
+
+
+def iter_plant_data(plant_ids: Iterable[int],
+                    max_workers: int = MAX_WORKERS,
+                    request_timeout: float = REQUEST_TIMEOUT,
+                    run_deadline: float = RUN_DEADLINE) -> Iterator[Tuple[int, Optional[dict]]]:
+    """Yields each plant ID with its extracted data as soon as its fetch finishes,
+       with up to max_workers requests in flight. Plants whose request fails, or
+       that are still pending when the run deadline passes, are not yielded."""
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(fetch_and_extract_plant_data, plant_id, request_timeout): plant_id
+               for plant_id in plant_ids}
+    try:
+        for future in as_completed(futures, timeout=run_deadline):
+            plant_id = futures[future]
+            try:
+                plant_data = future.result()
+            except requests.RequestException as e:
+                print(f"Request for plant ID {plant_id} failed: {e}")
+                continue
+            yield plant_id, plant_data
+    except FuturesTimeoutError:
+        pending = sorted(futures[future]
+                         for future in futures if not future.done())
+        print(f"Run deadline of {run_deadline}s reached, skipping plant IDs {pending}")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
 def initialise_dataframe() -> pd.DataFrame:
     """Creates the initial, empty DataFrame with columns."""
     return pd.DataFrame({
@@ -63,14 +230,80 @@ def initialise_dataframe() -> pd.DataFrame:
     })
 
 
-def load_into_dataframe() -> pd.DataFrame:
+class DataFrameBuilder:
+    """Collects extracted plant records into preallocated column buffers,
+       then builds the DataFrame in one go with the dtypes of initialise_dataframe()."""
+
+    def __init__(self, capacity: int = TOTAL_NUMBER_OF_PLANTS + 1):
+        self.dtypes = initialise_dataframe().dtypes
+        self.size = 0
+        self.columns = {column: self.new_buffer(dtype, max(capacity, 1))
+                        for column, dtype in self.dtypes.items()}
+
+    @staticmethod
+    def new_buffer(dtype, capacity: int) -> np.ndarray:
+        """Creates an empty buffer able to hold values of the column's dtype."""
+        if pd.api.types.is_float_dtype(dtype):
+            return np.full(capacity, np.nan)
+        return np.empty(capacity, dtype=object)
+
+    def append(self, record: dict) -> None:
+        """Adds one extracted plant record, doubling the buffers when full."""
+        if self.size == len(self.columns["plant_id"]):
+            for column, buffer in self.columns.items():
+                grown = self.new_buffer(self.dtypes[column], 2 * len(buffer))
+                grown[:self.size] = buffer
+                self.columns[column] = grown
+        for column, buffer in self.columns.items():
+            value = record.get(column)
+            buffer[self.size] = np.nan if value is None and buffer.dtype != object else value
+        self.size += 1
+
+    def build(self) -> pd.DataFrame:
+        """Builds the DataFrame from the filled part of the buffers."""
+        data = {}
+        for column, buffer in self.columns.items():
+            values = pd.Series(buffer[:self.size])
+            if pd.api.types.is_integer_dtype(self.dtypes[column]) and values.isna().any():
+                data[column] = values.astype(float)
+            else:
+                data[column] = values.astype(self.dtypes[column])
+        return pd.DataFrame(data)
+
+
+REGISTRY = PlantRegistry(TOTAL_NUMBER_OF_PLANTS)
+
+
+def record_run_results(client: PlantAPIClient, plant_ids: List[int]) -> None:
+    """Tells the registry which plants answered or were missing in the run,
+       and prints a summary of the requests made."""
+    report = client.report()
+    REGISTRY.record_results(
+        (plant_id for plant_id in plant_ids
+         if report["per_plant"].get(plant_id, {}).get("status_code") == 200),
+        (plant_id for plant_id in plant_ids
+         if report["per_plant"].get(plant_id, {}).get("status_code") == 404))
+    print(f"Made {report['requests']} requests for {report['plants']} plants "
+          f"with {report['retries']} retries, slowest took {report['max_latency']:.2f}s")
+
+
+def load_into_dataframe(max_workers: int = MAX_WORKERS,
+                        shard_index: int = 0, shard_count: int = 1) -> pd.DataFrame:
     """Fetches API data for all plants appends it to a DataFrame."""
-    plant_dataframe = initialise_dataframe()
-    for plant_id in range(TOTAL_NUMBER_OF_PLANTS + 1):
-        plant_data = fetch_and_extract_plant_data(plant_id)
-        if plant_data:
-            plant_dataframe = pd.concat(
-                [plant_dataframe, pd.DataFrame([plant_data])], ignore_index=True)
+    with METRICS.stage("extract") as stage:
+        client = get_client()
+        client.start_run()
+        plant_ids = REGISTRY.plant_ids(shard_index, shard_count)
+        builder = DataFrameBuilder(len(plant_ids))
+        try:
+            for plant_data in fetch_plant_data_concurrently(plant_ids, max_workers):
+                builder.append(plant_data)
+        finally:
+            client.end_run()
+        plant_dataframe = builder.build()
+        stage.count_rows(len(plant_ids), len(plant_dataframe))
+
+        record_run_results(client, plant_ids)
 
     return plant_dataframe
 
@@ -6,6 +6,15 @@ import pymssql
 import pandas as pd
 from dotenv import load_dotenv
 import transform as tf
+import rollup
+from extract import REGISTRY
+from metrics import METRICS
+
+RECORDING_COLUMNS = ("plant_id", "recording_taken", "last_watered",
+                     "soil_moisture", "temperature")
+MAX_CHUNK_SIZE = 1000
+CHUNK_SIZE = 500
+HIGH_WATER_MARKS = {}
 
 
 def get_connection() -> object:
@@ -17,8 +26,8 @@ def get_connection() -> object:
 
 
 def get_cursor(connection: object) -> object:
-    """Gets cursor"""
-    return connection.cursor()
+    """Gets a cursor that counts its round trips to the database."""
+    return METRICS.wrap_cursor(connection.cursor())
 
 
 def get_foreign_key(db_cursor: object, table_name: str,
@@ -70,13 +79,138 @@ def insert_into_recording_table(connection: object,
         connection.commit()
 
 
-def main() -> None:
+def get_recording_rows(dataframe: pd.DataFrame) -> List[tuple]:
+    """Gets the recording columns as tuples of plain values, with nulls as None."""
+    recordings = dataframe[list(RECORDING_COLUMNS)].astype(object)
+    recordings = recordings.where(recordings.notna(), None)
+    return list(recordings.itertuples(index=False, name=None))
+
+
+def check_chunk_size(chunk_size: int) -> None:
+    """Raises an error if the chunk size is outside SQL Server's limits."""
+    if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        raise ValueError(f"Chunk size must be between 1 and {MAX_CHUNK_SIZE}")
+
+
+def get_values_list(row_count: int) -> str:
+    """Gets the placeholders for a multi-row VALUES list of recordings."""
+    row_placeholder = f"({', '.join(['%s'] * len(RECORDING_COLUMNS))})"
+    return ', '.join([row_placeholder] * row_count)
+
+
+def bulk_insert_into_recording_table(connection: object, db_cursor: object,
+                                     dataframe: pd.DataFrame,
+                                     chunk_size: int = CHUNK_SIZE) -> int:
+    """Inserts the recordings with one multi-row INSERT per chunk,
+       committing the whole batch once and rolling it all back on failure.
+       SQL Server allows at most 1000 rows in a VALUES list, which caps the chunk size."""
+    check_chunk_size(chunk_size)
+    rows = get_recording_rows(dataframe)
+    try:
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            db_cursor.execute(
+                f"INSERT INTO recording ({', '.join(RECORDING_COLUMNS)}) VALUES "
+                f"{get_values_list(len(chunk))}",
+                tuple(value for row in chunk for value in row))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return len(rows)
+
+
+def load_high_water_marks(db_cursor: object) -> None:
+    """Loads the latest stored recording_taken of each plant."""
+    db_cursor.execute(f"""SELECT plant_id, MAX(recording_taken)
+                      FROM {os.getenv('SCHEMA_NAME')}.recording GROUP BY plant_id""")
+    for plant_id, recording_taken in db_cursor.fetchall():
+        HIGH_WATER_MARKS[plant_id] = pd.Timestamp(recording_taken).tz_localize('UTC')
+
+
+def filter_new_recordings(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """Drops repeated recordings within the batch, and recordings that are
+       no newer than the latest one already stored for their plant."""
+    dataframe = dataframe.drop_duplicates(subset=["plant_id", "recording_taken"])
+    recording_taken = pd.to_datetime(dataframe["recording_taken"], utc=True)
+    high_water_marks = pd.to_datetime(
+        dataframe["plant_id"].map(HIGH_WATER_MARKS), utc=True)
+    return dataframe[high_water_marks.isna() | (recording_taken > high_water_marks)]
+
+
+def update_high_water_marks(dataframe: pd.DataFrame) -> None:
+    """Records the latest recording_taken of each plant in a stored batch."""
+    latest = pd.to_datetime(dataframe["recording_taken"], utc=True).groupby(
+        dataframe["plant_id"]).max()
+    for plant_id, recording_taken in latest.dropna().items():
+        if plant_id not in HIGH_WATER_MARKS or recording_taken > HIGH_WATER_MARKS[plant_id]:
+            HIGH_WATER_MARKS[plant_id] = recording_taken
+
+
+def upsert_recordings(connection: object, db_cursor: object,
+                      dataframe: pd.DataFrame, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Inserts only the recordings that are not already stored, keyed by
+       (plant_id, recording_taken), so retries and overlapping runs are harmless.
+       Rows at or below a plant's high-water mark are skipped without a query,
+       and the rest are merged against the table in one transaction, which also
+       adds the recordings that were actually inserted onto the rollup tables."""
+    check_chunk_size(chunk_size)
+    new_recordings = filter_new_recordings(dataframe)
+    rows = get_recording_rows(new_recordings)
+    columns = ', '.join(RECORDING_COLUMNS)
+    outputs = ', '.join(f"inserted.{column}" for column in RECORDING_COLUMNS)
+    inserted_rows = []
+    try:
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            db_cursor.execute(f"""
+                INSERT INTO recording ({columns})
+                OUTPUT {outputs}
+                SELECT v.plant_id, CAST(v.recording_taken AS DATETIME),
+                       CAST(v.last_watered AS DATETIME), v.soil_moisture, v.temperature
+                FROM (VALUES {get_values_list(len(chunk))}) AS v ({columns})
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM recording AS r WITH (UPDLOCK, HOLDLOCK)
+                    WHERE r.plant_id = v.plant_id
+                    AND r.recording_taken = CAST(v.recording_taken AS DATETIME))""",
+                              tuple(value for row in chunk for value in row))
+            inserted_rows += db_cursor.fetchall()
+        rollup.update_rollups(db_cursor, inserted_rows)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    update_high_water_marks(new_recordings)
+    return {"inserted": len(inserted_rows), "skipped": len(dataframe) - len(inserted_rows)}
+
+
+def initialise_state(db_cursor: object) -> None:
+    """Loads the state that is kept across warm invocations, if it is missing."""
+    if not REGISTRY.seeded:
+        REGISTRY.seed_from_database(db_cursor)
+    if not HIGH_WATER_MARKS:
+        load_high_water_marks(db_cursor)
+
+
+def load_dataframe(connection: object, db_cursor: object, dataframe: pd.DataFrame) -> dict:
+    """Stores the new recordings of a transformed DataFrame."""
+    with METRICS.stage("load") as stage:
+        counts = upsert_recordings(connection, db_cursor, dataframe)
+        stage.count_rows(len(dataframe), counts["inserted"])
+    print(f"Inserted {counts['inserted']} recordings, skipped {counts['skipped']} duplicates")
+    return counts
+
+
+def main(shard_index: int = 0, shard_count: int = 1) -> None:
     """Calls the above functions."""
     load_dotenv()
-    plant_dataframe = tf.main()
+    METRICS.reset()
     conn = get_connection()
     cursor = get_cursor(conn)
-    insert_into_recording_table(conn, cursor, plant_dataframe)
+    initialise_state(cursor)
+    plant_dataframe = tf.main(shard_index, shard_count)
+    load_dataframe(conn, cursor, plant_dataframe)
+    METRICS.log_summary("pipeline_run")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+"""Lightweight instrumentation of the pipeline and data backup stages. Records
+   the wall time and rows in and out of each stage, a latency histogram of the
+   HTTP requests of each plant, the number of database round trips and the peak
+   RSS. Every finished stage is logged as one JSON line, and summary() returns
+   the totals so the caller and tests can inspect them. Recording only adds
+   counters under a lock, so it is cheap enough to leave on in production.
+   The data backup's dockerfile copies this file into its image."""
+
+import json
+import resource
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Stage:  # pylint: disable=too-few-public-methods
+    """Lets the code inside a timed stage report the rows it took in and put out."""
+
+    def __init__(self):
+        self.rows_in = 0
+        self.rows_out = 0
+
+    def count_rows(self, rows_in: int = 0, rows_out: int = 0) -> None:
+        """Adds to the stage's row counts."""
+        self.rows_in += rows_in
+        self.rows_out += rows_out
+
+
+class CountingCursor:
+    """Database cursor that counts every statement it sends as a round trip."""
+
+    def __init__(self, cursor: object, metrics: "Metrics"):
+        self.cursor = cursor
+        self.metrics = metrics
+
+    def __getattr__(self, name: str):
+        return getattr(self.cursor, name)
+
+    def execute(self, *args, **kwargs):
+        """Executes a statement, counting the round trip."""
+        self.metrics.count_round_trips()
+        return self.cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        """Executes a statement for many parameter sets, counting the round trip."""
+        self.metrics.count_round_trips()
+        return self.cursor.executemany(*args, **kwargs)
+
+
+class Metrics:
+    """The measurements of one pipeline run, safe to record from several threads."""
+
+    def __init__(self, log=print):
+        self.log = log
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.latencies = {}
+        self.round_trips = 0
+
+    def reset(self) -> None:
+        """Clears the measurements at the start of a run, as warm invocations
+           reuse the module-level instance."""
+        with self.lock:
+            self.stages = {}
+            self.latencies = {}
+            self.round_trips = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times the code inside the block as one call of the stage, then logs it.
+           A stage that raises is still recorded, and marked as failed."""
+        stage = Stage()
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield stage
+            failed = False
+        finally:
+            seconds = time.perf_counter() - started
+            with self.lock:
+                totals = self.stages.setdefault(
+                    name, {"calls": 0, "failures": 0, "seconds": 0.0,
+                           "rows_in": 0, "rows_out": 0})
+                totals["calls"] += 1
+                totals["failures"] += failed
+                totals["seconds"] += seconds
+                totals["rows_in"] += stage.rows_in
+                totals["rows_out"] += stage.rows_out
+            self.emit({"event": "stage", "stage": name, "seconds": round(seconds, 6),
+                       "rows_in": stage.rows_in, "rows_out": stage.rows_out,
+                       "failed": failed})
+
+    def record_latency(self, key, seconds: float) -> None:
+        """Adds one request's latency to the histogram of its key, usually a plant ID.
+           Bucket i counts requests up to LATENCY_BUCKETS[i] seconds, and the
+           last bucket those slower than all of them."""
+        bucket = bisect_left(LATENCY_BUCKETS, seconds)
+        with self.lock:
+            histogram = self.latencies.get(key)
+            if histogram is None:
+                histogram = self.latencies[key] = [0] * (len(LATENCY_BUCKETS) + 1)
+            histogram[bucket] += 1
+
+    def count_round_trips(self, count: int = 1) -> None:
+        """Adds to the number of database round trips."""
+        with self.lock:
+            self.round_trips += count
+
+    def wrap_cursor(self, cursor: object) -> CountingCursor:
+        """Returns the cursor wrapped so its statements are counted."""
+        return CountingCursor(cursor, self)
+
+    @staticmethod
+    def get_peak_rss() -> int:
+        """Returns the largest resident set size of the process so far, in kilobytes."""
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def summary(self) -> dict:
+        """Returns everything recorded since the last reset."""
+        with self.lock:
+            return {"stages": {name: dict(totals) for name, totals in self.stages.items()},
+                    "http_latency": {"buckets": list(LATENCY_BUCKETS),
+                                     "per_plant": {key: list(histogram) for key, histogram
+                                                   in self.latencies.items()}},
+                    "db_round_trips": self.round_trips,
+                    "peak_rss_kb": self.get_peak_rss()}
+
+    def emit(self, record: dict) -> None:
+        """Logs a record as a single JSON line."""
+        self.log(json.dumps(record, default=str))
+
+    def log_summary(self, event: str) -> dict:
+        """Logs the summary as one JSON line and returns it."""
+        summary = self.summary()
+        self.emit({"event": event, **summary})
+        return summary
+
+
+METRICS = Metrics()
@@ -0,0 +1,57 @@
+"""Script that keeps track of which plant IDs exist,
+   So that extraction only requests plants that are likely to return data."""
+import os
+from typing import Iterable, List
+
+PROBE_INTERVAL = 10
+PROBE_AHEAD = 5
+
+
+def shard_plant_ids(plant_ids: Iterable[int], shard_index: int, shard_count: int) -> List[int]:
+    """Returns the plant IDs belonging to one shard of the ID space."""
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f"Invalid shard {shard_index} of {shard_count}")
+    return [plant_id for plant_id in plant_ids if plant_id % shard_count == shard_index]
+
+
+class PlantRegistry:
+    """Learns which plant IDs are valid from the plant table and from API results.
+       IDs that are known to be missing are only probed every probe_interval runs."""
+
+    def __init__(self, max_plant_id: int, probe_interval: int = PROBE_INTERVAL):
+        self.max_plant_id = max_plant_id
+        self.probe_interval = probe_interval
+        self.known_ids = set()
+        self.missing_ids = set()
+        self.runs = 0
+        self.seeded = False
+
+    def seed_from_database(self, db_cursor: object) -> None:
+        """Marks every plant in the plant table as valid."""
+        db_cursor.execute(f"SELECT plant_id FROM {os.getenv('SCHEMA_NAME')}.plant")
+        self.record_results((row[0] for row in db_cursor.fetchall()), [])
+        self.seeded = True
+
+    def record_results(self, found_ids: Iterable[int], missing_ids: Iterable[int]) -> None:
+        """Updates the registry with the IDs that did and did not return data."""
+        found_ids = set(found_ids)
+        missing_ids = set(missing_ids) - found_ids
+        self.known_ids |= found_ids
+        self.known_ids -= missing_ids
+        self.missing_ids |= missing_ids
+        self.missing_ids -= found_ids
+
+    def is_probe_run(self) -> bool:
+        """Whether the current run should re-check known missing IDs."""
+        return self.runs % self.probe_interval == 0
+
+    def plant_ids(self, shard_index: int = 0, shard_count: int = 1) -> List[int]:
+        """Returns the plant IDs to request this run and starts the next run."""
+        highest_id = max(self.known_ids | {self.max_plant_id})
+        if self.is_probe_run():
+            plant_ids = list(range(highest_id + PROBE_AHEAD + 1))
+        else:
+            plant_ids = [plant_id for plant_id in range(highest_id + 1)
+                         if plant_id not in self.missing_ids]
+        self.runs += 1
+        return shard_plant_ids(plant_ids, shard_index, shard_count)
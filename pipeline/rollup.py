@@ -0,0 +1,91 @@
+"""Script that keeps per-plant, per-minute and per-hour rollups of the recordings
+   up to date, so long windows and history can be read without scanning recording."""
+from typing import List
+import pandas as pd
+
+ROLLUP_TABLES = {
+    "recording_rollup_minute": "1min",
+    "recording_rollup_hour": "1h",
+}
+MEASURES = ("soil_moisture", "temperature")
+INSERTED_COLUMNS = ("plant_id", "recording_taken", "last_watered",
+                    "soil_moisture", "temperature")
+ROLLUP_COLUMNS = ("plant_id", "bucket_start", "recording_count",
+                  "soil_moisture_count", "soil_moisture_sum",
+                  "soil_moisture_min", "soil_moisture_max",
+                  "temperature_count", "temperature_sum",
+                  "temperature_min", "temperature_max", "last_watered")
+MAX_CHUNK_SIZE = 1000
+
+
+def compute_rollups(inserted: pd.DataFrame, freq: str) -> List[tuple]:
+    """Aggregates newly inserted recordings into one row per plant and bucket.
+       Sums and counts are kept rather than means so buckets can be combined."""
+    buckets = inserted["recording_taken"].dt.floor(freq)
+    grouped = inserted.groupby([inserted["plant_id"], buckets])
+    rollups = grouped.size().rename("recording_count").to_frame()
+    for measure in MEASURES:
+        aggregates = grouped[measure].agg(["count", "sum", "min", "max"])
+        rollups[[f"{measure}_{name}" for name in aggregates.columns]] = aggregates
+    rollups["last_watered"] = grouped["last_watered"].max()
+    rollups = rollups.reset_index().rename(columns={"recording_taken": "bucket_start"})
+    rollups = rollups[list(ROLLUP_COLUMNS)].astype(object)
+    rollups = rollups.where(rollups.notna(), None)
+    return list(rollups.itertuples(index=False, name=None))
+
+
+def get_least(column: str) -> str:
+    """Gets the smaller of the stored and new value, ignoring nulls."""
+    return (f"CASE WHEN r.{column} IS NULL OR v.{column} < r.{column} "
+            f"THEN v.{column} ELSE r.{column} END")
+
+
+def get_greatest(column: str) -> str:
+    """Gets the larger of the stored and new value, ignoring nulls."""
+    return (f"CASE WHEN r.{column} IS NULL OR v.{column} > r.{column} "
+            f"THEN v.{column} ELSE r.{column} END")
+
+
+def get_merge_query(table_name: str, row_count: int) -> str:
+    """Gets a MERGE that adds a chunk of rollups onto the stored buckets."""
+    columns = ", ".join(ROLLUP_COLUMNS)
+    row_placeholder = f"({', '.join(['%s'] * len(ROLLUP_COLUMNS))})"
+    updates = ["recording_count = r.recording_count + v.recording_count"]
+    for measure in MEASURES:
+        updates += [f"{measure}_count = r.{measure}_count + v.{measure}_count",
+                    f"{measure}_sum = r.{measure}_sum + v.{measure}_sum",
+                    f"{measure}_min = {get_least(f'{measure}_min')}",
+                    f"{measure}_max = {get_greatest(f'{measure}_max')}"]
+    updates.append(f"last_watered = {get_greatest('last_watered')}")
+    return f"""
+        MERGE {table_name} WITH (HOLDLOCK) AS r
+        USING (SELECT v.plant_id, CAST(v.bucket_start AS DATETIME) AS bucket_start,
+                      {", ".join(f"v.{column}" for column in ROLLUP_COLUMNS[2:-1])},
+                      CAST(v.last_watered AS DATETIME) AS last_watered
+               FROM (VALUES {", ".join([row_placeholder] * row_count)}) AS v ({columns})) AS v
+        ON r.plant_id = v.plant_id AND r.bucket_start = v.bucket_start
+        WHEN MATCHED THEN UPDATE SET {", ".join(updates)}
+        WHEN NOT MATCHED THEN INSERT ({columns})
+            VALUES ({", ".join(f"v.{column}" for column in ROLLUP_COLUMNS)});"""
+
+
+def merge_rollups(db_cursor: object, table_name: str, rows: List[tuple],
+                  chunk_size: int = MAX_CHUNK_SIZE) -> None:
+    """Adds the rollup rows onto a rollup table, one MERGE per chunk."""
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        db_cursor.execute(get_merge_query(table_name, len(chunk)),
+                          tuple(value for row in chunk for value in row))
+
+
+def update_rollups(db_cursor: object, inserted_rows: List[tuple]) -> None:
+    """Rolls the recordings that were just inserted into every rollup table.
+       Runs inside the insert's transaction, so the rollups only ever
+       count recordings that were committed, and each of them once."""
+    if not inserted_rows:
+        return
+    inserted = pd.DataFrame(inserted_rows, columns=list(INSERTED_COLUMNS))
+    inserted["recording_taken"] = pd.to_datetime(inserted["recording_taken"])
+    inserted["last_watered"] = pd.to_datetime(inserted["last_watered"])
+    for table_name, freq in ROLLUP_TABLES.items():
+        merge_rollups(db_cursor, table_name, compute_rollups(inserted, freq))
@@ -0,0 +1,205 @@
+"""Streaming mode of the ETL pipeline. Extract, transform and load run at the
+   same time in their own threads, connected by bounded queues, so plants are
+   transformed and loaded in micro-batches as soon as their fetches finish.
+   A full queue blocks the stage feeding it, so the loader is never flooded.
+   run_worker() repeats this at a fixed cadence as a long-running alternative
+   to invoking the Lambda once a minute."""
+import os
+import queue
+import threading
+import time
+from dotenv import load_dotenv
+import extract
+import transform
+import load
+import etl
+from metrics import METRICS
+
+load_dotenv()
+
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "10"))
+STREAM_BATCH_WAIT = float(os.getenv("STREAM_BATCH_WAIT", "1.0"))
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "2"))
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "60"))
+STOP_CHECK_INTERVAL = 0.1
+
+DONE = object()
+
+
+def put(stage_queue: queue.Queue, item, stop: threading.Event) -> bool:
+    """Puts an item on a queue, waiting while it is full.
+       Gives up and returns False if the run is stopped meanwhile."""
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=STOP_CHECK_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def get(stage_queue: queue.Queue, stop: threading.Event, timeout: float = None):
+    """Takes an item off a queue, waiting up to timeout seconds (forever if None).
+       Returns None if nothing arrived in time, and DONE if the run is stopped."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not stop.is_set():
+        wait = STOP_CHECK_INTERVAL
+        if deadline is not None:
+            wait = min(wait, deadline - time.monotonic())
+            if wait <= 0:
+                return None
+        try:
+            return stage_queue.get(timeout=wait)
+        except queue.Empty:
+            continue
+    return DONE
+
+
+def extract_stage(plant_ids: list, records: queue.Queue, stop: threading.Event,
+                  max_workers: int = extract.MAX_WORKERS) -> None:
+    """Puts each plant's extracted data on the records queue as its fetch finishes."""
+    with METRICS.stage("extract") as stage:
+        stage.count_rows(rows_in=len(plant_ids))
+        client = extract.get_client()
+        client.start_run()
+        try:
+            for _, plant_data in extract.iter_plant_data(plant_ids, max_workers):
+                if not plant_data:
+                    continue
+                if not put(records, plant_data, stop):
+                    return
+                stage.count_rows(rows_out=1)
+        finally:
+            client.end_run()
+        extract.record_run_results(client, plant_ids)
+    put(records, DONE, stop)
+
+
+def transform_stage(records: queue.Queue, batches: queue.Queue, stop: threading.Event,
+                    batch_size: int = STREAM_BATCH_SIZE,
+                    batch_wait: float = STREAM_BATCH_WAIT) -> None:
+    """Groups records into micro-batches of up to batch_size, sending a batch on early
+       once batch_wait seconds have passed since its first record, and puts each
+       transformed batch on the batches queue."""
+    done = False
+    while not done:
+        batch = []
+        deadline = None
+        while len(batch) < batch_size:
+            record = get(records, stop,
+                         None if deadline is None else deadline - time.monotonic())
+            if record is None:
+                break
+            if record is DONE:
+                done = True
+                break
+            batch.append(record)
+            deadline = deadline or time.monotonic() + batch_wait
+        if stop.is_set():
+            return
+        if batch:
+            builder = extract.DataFrameBuilder(len(batch))
+            for record in batch:
+                builder.append(record)
+            if not put(batches, transform.transform_dataframe(builder.build()), stop):
+                return
+    put(batches, DONE, stop)
+
+
+def load_stage(connection: object, db_cursor: object, batches: queue.Queue,
+               stop: threading.Event, started: float) -> dict:
+    """Loads each transformed batch as it arrives, in its own transaction.
+       Returns the totals and how long after started the first batch was stored."""
+    totals = {"batches": 0, "inserted": 0, "skipped": 0, "first_load": None}
+    while True:
+        batch = get(batches, stop)
+        if batch is DONE:
+            return totals
+        counts = load.load_dataframe(connection, db_cursor, batch)
+        totals["batches"] += 1
+        totals["inserted"] += counts["inserted"]
+        totals["skipped"] += counts["skipped"]
+        if totals["first_load"] is None:
+            totals["first_load"] = time.perf_counter() - started
+
+
+def run_stage(stage, errors: list, stop: threading.Event, *args) -> None:
+    """Runs a stage, recording its error and stopping the other stages if it fails."""
+    try:
+        stage(*args)
+    except Exception as e:  # pylint: disable=broad-except
+        errors.append(e)
+        stop.set()
+
+
+def start_stage(stage, errors: list, stop: threading.Event, *args) -> threading.Thread:
+    """Starts a stage in its own thread."""
+    thread = threading.Thread(target=run_stage, args=(stage, errors, stop, *args), daemon=True)
+    thread.start()
+    return thread
+
+
+def stop_stages(threads: list, stop: threading.Event) -> None:
+    """Stops the stages and waits for their threads to finish."""
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+
+def run_stream(shard_index: int = 0, shard_count: int = 1,
+               batch_size: int = STREAM_BATCH_SIZE, batch_wait: float = STREAM_BATCH_WAIT,
+               queue_size: int = STREAM_QUEUE_SIZE) -> dict:
+    """Runs one streaming pass over the shard's plants. The connection and state
+       are shared with etl.run_pipeline, and the first error from any stage is
+       raised once every stage has stopped."""
+    METRICS.reset()
+    started = time.perf_counter()
+    connection = etl.get_live_connection()
+    db_cursor = load.get_cursor(connection)
+    load.initialise_state(db_cursor)
+    timings = {"setup": time.perf_counter() - started}
+
+    records = queue.Queue(maxsize=queue_size * batch_size)
+    batches = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    threads = [
+        start_stage(extract_stage, errors, stop,
+                    extract.REGISTRY.plant_ids(shard_index, shard_count), records, stop),
+        start_stage(transform_stage, errors, stop, records, batches, stop,
+                    batch_size, batch_wait)]
+    try:
+        totals = load_stage(connection, db_cursor, batches, stop, started)
+    finally:
+        stop_stages(threads, stop)
+    if errors:
+        raise errors[0]
+
+    timings["first_load"] = totals.pop("first_load")
+    timings["total"] = time.perf_counter() - started
+    print(f"Streamed {totals['batches']} batches, inserted {totals['inserted']} recordings, "
+          + ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in timings.items()
+                      if seconds is not None))
+    return {"timings": timings, **totals, "metrics": METRICS.log_summary("stream_run")}
+
+
+def run_worker(cadence: float = POLL_INTERVAL, shard_index: int = 0, shard_count: int = 1,
+               max_runs: int = None) -> None:
+    """Runs a streaming pass every cadence seconds until max_runs have been made,
+       or forever if it is None. A failed pass is reported and retried on the
+       next tick, and a pass that overruns the cadence starts the next at once."""
+    runs = 0
+    while max_runs is None or runs < max_runs:
+        started = time.monotonic()
+        try:
+            run_stream(shard_index, shard_count)
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"Streaming run failed: {e}")
+        runs += 1
+        if max_runs is None or runs < max_runs:
+            time.sleep(max(0.0, cadence - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    run_worker(POLL_INTERVAL, int(os.getenv("SHARD_INDEX", "0")),
+               int(os.getenv("SHARD_COUNT", "1")))
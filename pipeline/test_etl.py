@@ -0,0 +1,81 @@
+# pylint: skip-file
+import pytest
+import pymssql
+import pandas as pd
+from unittest.mock import MagicMock
+import etl
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    etl.CONNECTION = None
+    etl.INVOCATIONS = 0
+    yield
+    etl.CONNECTION = None
+    etl.INVOCATIONS = 0
+
+
+def test_get_live_connection_reuses_healthy_connection(mocker):
+    connection = MagicMock()
+    get_connection = mocker.patch("etl.load.get_connection", return_value=connection)
+
+    assert etl.get_live_connection() is connection
+    assert etl.get_live_connection() is connection
+    assert get_connection.call_count == 1
+    connection.cursor.return_value.execute.assert_called_with("SELECT 1")
+
+
+def test_get_live_connection_reconnects_when_stale(mocker):
+    stale, fresh = MagicMock(), MagicMock()
+    stale.cursor.return_value.execute.side_effect = pymssql.OperationalError("gone")
+    mocker.patch("etl.load.get_connection", side_effect=[stale, fresh])
+
+    assert etl.get_live_connection() is stale
+    assert etl.get_live_connection() is fresh
+    stale.close.assert_called_once()
+
+
+def test_lambda_handler_reports_cold_starts(mocker):
+    mocker.patch("etl.load.get_connection", return_value=MagicMock())
+    initialise_state = mocker.patch("etl.load.initialise_state")
+    mocker.patch("etl.extract.load_into_dataframe", return_value=pd.DataFrame())
+    mocker.patch("etl.transform.transform_dataframe", return_value=pd.DataFrame())
+    mocker.patch("etl.load.load_dataframe", return_value={"inserted": 3, "skipped": 1})
+
+    first = etl.lambda_handler({}, None)
+    second = etl.lambda_handler({"shard_index": 1, "shard_count": 2}, None)
+
+    assert first["statusCode"] == 200
+    assert first["report"]["cold_start"] is True
+    assert second["report"]["cold_start"] is False
+    assert "timings" not in second["report"]
+    assert second["report"]["metrics"]["stages"]["setup"]["calls"] == 1
+    assert second["report"]["inserted"] == 3
+    assert initialise_state.call_count == 2
+    etl.extract.load_into_dataframe.assert_called_with(shard_index=1, shard_count=2)
+
+
+def test_lambda_handler_returns_error(mocker):
+    mocker.patch("etl.load.get_connection", side_effect=pymssql.OperationalError("down"))
+    assert etl.lambda_handler({}, None)["statusCode"] == 500
+
+
+def test_run_pipeline_reports_stage_metrics(mocker):
+    connection = MagicMock()
+    connection.cursor.return_value.fetchall.return_value = []
+    mocker.patch("etl.load.get_connection", return_value=connection)
+    mocker.patch("etl.load.initialise_state")
+    mocker.patch("etl.extract.REGISTRY.plant_ids", return_value=[1, 2])
+    mocker.patch("etl.extract.fetch_plant_data_concurrently", return_value=[
+        {"plant_id": plant_id, "plant_name": "cactus", "soil_moisture": 50.0,
+         "temperature": 20.0, "recording_taken": "2024-11-25 12:00:00",
+         "last_watered": "Mon, 25 Nov 2024 09:00:00 GMT"} for plant_id in (1, 2)])
+
+    metrics = etl.run_pipeline()["metrics"]
+
+    assert set(metrics["stages"]) == {"setup", "extract", "transform", "load"}
+    assert metrics["stages"]["extract"]["rows_in"] == 2
+    assert metrics["stages"]["transform"]["rows_out"] == 2
+    assert metrics["stages"]["load"]["rows_in"] == 2
+    assert metrics["db_round_trips"] == 1
+    assert metrics["peak_rss_kb"] > 0
@@ -2,8 +2,11 @@
 import pytest
 from unittest.mock import patch, MagicMock
 from unittest import mock
+import time
+import requests
 import pandas as pd
 from extract import get_plant_data, extract_plant_data, load_into_dataframe, TOTAL_NUMBER_OF_PLANTS
+from extract import fetch_plant_data_concurrently, PlantAPIClient, DataFrameBuilder, initialise_dataframe
 
 
 @pytest.fixture
@@ -29,7 +32,7 @@ def mock_get_success(url, timeout=None):
 
 
 def test_get_plant_data_success():
-    with mock.patch("requests.get", side_effect=mock_get_success):
+    with mock.patch("requests.Session.get", side_effect=mock_get_success):
         response = get_plant_data(1)
         assert response == {
             "name": "Epipremnum Aureum"}, "Expected successful API response"
@@ -93,3 +96,114 @@ def test_extract_plant_data_missing_botanist():
         "plant_id": None
     }
     assert result == expected
+
+
+def fake_fetch(plant_id, timeout=None):
+    """Finishes in reverse order and reports plant 3 as missing"""
+    time.sleep(0.01 * (5 - plant_id))
+    if plant_id == 3:
+        return None
+    return {"plant_id": plant_id}
+
+
+def test_fetch_plant_data_concurrently_keeps_plant_order():
+    with mock.patch("extract.fetch_and_extract_plant_data", side_effect=fake_fetch):
+        result = fetch_plant_data_concurrently(range(5), max_workers=5)
+    assert [plant["plant_id"] for plant in result] == [0, 1, 2, 4]
+
+
+def test_fetch_plant_data_concurrently_single_worker_is_serial():
+    calls = []
+
+    def record_fetch(plant_id, timeout=None):
+        calls.append(plant_id)
+        return fake_fetch(plant_id)
+
+    with mock.patch("extract.fetch_and_extract_plant_data", side_effect=record_fetch):
+        result = fetch_plant_data_concurrently(range(5), max_workers=1)
+    assert calls == [0, 1, 2, 3, 4]
+    assert [plant["plant_id"] for plant in result] == [0, 1, 2, 4]
+
+
+def test_fetch_plant_data_concurrently_drops_plants_past_deadline():
+    def slow_fetch(plant_id, timeout=None):
+        if plant_id == 1:
+            time.sleep(0.5)
+        return {"plant_id": plant_id}
+
+    with mock.patch("extract.fetch_and_extract_plant_data", side_effect=slow_fetch):
+        result = fetch_plant_data_concurrently(
+            range(3), max_workers=3, run_deadline=0.1)
+    assert [plant["plant_id"] for plant in result] == [0, 2]
+
+
+def test_single_worker_keeps_to_the_deadline_and_skips_failed_requests():
+    def fetch(plant_id, timeout=None):
+        if plant_id == 0:
+            raise requests.ConnectionError("reset")
+        if plant_id == 2:
+            time.sleep(0.5)
+        return {"plant_id": plant_id}
+
+    with mock.patch("extract.fetch_and_extract_plant_data", side_effect=fetch):
+        result = fetch_plant_data_concurrently(range(4), max_workers=1, run_deadline=0.1)
+    assert [plant["plant_id"] for plant in result] == [1]
+
+
+def test_client_retries_retryable_status_codes():
+    responses = [mock.Mock(status_code=503), mock.Mock(status_code=502),
+                 mock.Mock(status_code=200, json=lambda: {"plant_id": 1})]
+    client = PlantAPIClient()
+    with mock.patch.object(client.session, "get", side_effect=responses), \
+            mock.patch("extract.time.sleep") as mock_sleep:
+        assert client.get_plant_data(1) == {"plant_id": 1}
+    assert mock_sleep.call_count == 2
+    assert client.stats[1]["retries"] == 2
+    assert client.report()["requests"] == 3
+
+
+def test_client_does_not_retry_missing_plants():
+    client = PlantAPIClient()
+    with mock.patch.object(client.session, "get", return_value=mock.Mock(status_code=404)) as mock_get:
+        assert client.get_plant_data(7)["error"] == 404
+    assert mock_get.call_count == 1
+    assert client.stats[7]["status_code"] == 404
+
+
+def test_client_stops_when_budget_is_used_up():
+    client = PlantAPIClient(request_budget=2)
+    client.start_run()
+    with mock.patch.object(client.session, "get", side_effect=mock_get_success):
+        client.get_plant_data(0)
+        client.get_plant_data(1)
+        assert client.get_plant_data(2)["error"] == "budget"
+    client.start_run()
+    assert client.report()["requests"] == 0
+
+
+def test_client_only_keeps_to_the_deadline_during_a_run():
+    client = PlantAPIClient(run_deadline=0)
+    with mock.patch.object(client.session, "get", side_effect=mock_get_success):
+        assert "error" not in client.get_plant_data(0)
+        client.start_run()
+        assert client.get_plant_data(1)["error"] == "deadline"
+        client.end_run()
+        assert "error" not in client.get_plant_data(2)
+
+
+def test_dataframe_builder_matches_initial_dtypes():
+    builder = DataFrameBuilder(capacity=1)
+    builder.append({"plant_id": 1, "plant_name": "cactus", "soil_moisture": 20.5})
+    builder.append({"plant_id": 2, "plant_name": None, "soil_moisture": None})
+    result = builder.build()
+
+    assert result.dtypes.equals(initialise_dataframe().dtypes)
+    assert result["plant_id"].tolist() == [1, 2]
+    assert result["plant_name"].iloc[0] == "cactus"
+    assert pd.isna(result["soil_moisture"].iloc[1])
+
+
+def test_dataframe_builder_empty():
+    result = DataFrameBuilder().build()
+    assert result.empty
+    assert result.dtypes.equals(initialise_dataframe().dtypes)
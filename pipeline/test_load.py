@@ -1,8 +1,10 @@
 # pylint: skip-file
 import pytest
 import pandas as pd
+from datetime import datetime
 from unittest.mock import MagicMock
 from load import get_foreign_key, get_all_plant_foreign_keys, insert_into_recording_table
+from load import bulk_insert_into_recording_table, upsert_recordings, load_high_water_marks, HIGH_WATER_MARKS
 
 
 @pytest.fixture
@@ -119,3 +121,148 @@ def test_insert_into_recording_table(mock_db_cursor, mock_connection):
 
     assert mock_db_cursor.commit.call_count == len(
         df), f"Expected {len(df)} commits"
+
+
+def test_bulk_insert_into_recording_table_chunks(mock_db_cursor, mock_connection):
+    df = pd.DataFrame({
+        'plant_id': [1, 2, 3],
+        'recording_taken': ['2024-11-01', '2024-11-02', '2024-11-03'],
+        'last_watered': ['2024-11-01', None, '2024-11-03'],
+        'soil_moisture': [30, float('nan'), 50],
+        'temperature': [22.5, 25.0, 27.5],
+    })
+
+    inserted = bulk_insert_into_recording_table(
+        mock_connection, mock_db_cursor, df, chunk_size=2)
+
+    assert inserted == 3
+    assert mock_db_cursor.execute.call_count == 2
+    first_query, first_args = mock_db_cursor.execute.call_args_list[0][0]
+    assert first_query.count("(%s, %s, %s, %s, %s)") == 2
+    assert first_args == (1, '2024-11-01', '2024-11-01', 30.0, 22.5,
+                          2, '2024-11-02', None, None, 25.0)
+    second_query, second_args = mock_db_cursor.execute.call_args_list[1][0]
+    assert second_query.count("(%s, %s, %s, %s, %s)") == 1
+    assert second_args == (3, '2024-11-03', '2024-11-03', 50.0, 27.5)
+    mock_connection.commit.assert_called_once()
+
+
+def test_bulk_insert_into_recording_table_rolls_back(mock_db_cursor, mock_connection):
+    df = pd.DataFrame({
+        'plant_id': [1, 2],
+        'recording_taken': ['2024-11-01', '2024-11-02'],
+        'last_watered': ['2024-11-01', '2024-11-02'],
+        'soil_moisture': [30, 40],
+        'temperature': [22.5, 25.0],
+    })
+    mock_db_cursor.execute.side_effect = [None, RuntimeError("connection lost")]
+
+    with pytest.raises(RuntimeError):
+        bulk_insert_into_recording_table(mock_connection, mock_db_cursor, df, chunk_size=1)
+
+    mock_connection.rollback.assert_called_once()
+    mock_connection.commit.assert_not_called()
+
+
+def test_bulk_insert_into_recording_table_invalid_chunk_size(mock_db_cursor, mock_connection):
+    with pytest.raises(ValueError):
+        bulk_insert_into_recording_table(
+            mock_connection, mock_db_cursor, pd.DataFrame(), chunk_size=1001)
+
+
+@pytest.fixture
+def high_water_marks():
+    HIGH_WATER_MARKS.clear()
+    yield HIGH_WATER_MARKS
+    HIGH_WATER_MARKS.clear()
+
+
+def make_recordings(plant_ids, times):
+    return pd.DataFrame({
+        'plant_id': plant_ids,
+        'recording_taken': pd.to_datetime(times, utc=True),
+        'last_watered': pd.to_datetime(times, utc=True),
+        'soil_moisture': [30.0] * len(plant_ids),
+        'temperature': [20.0] * len(plant_ids),
+    })
+
+
+def test_upsert_recordings_merges_against_table(mock_db_cursor, mock_connection, high_water_marks):
+    df = make_recordings([1, 1, 2], ['2024-11-01 10:00', '2024-11-01 10:00', '2024-11-01 10:00'])
+    mock_db_cursor.fetchall.return_value = [
+        (2, datetime(2024, 11, 1, 10), datetime(2024, 11, 1, 10), 30.0, 20.0)]
+
+    counts = upsert_recordings(mock_connection, mock_db_cursor, df)
+
+    assert counts == {"inserted": 1, "skipped": 2}
+    query, args = mock_db_cursor.execute.call_args_list[0][0]
+    assert "WHERE NOT EXISTS" in query
+    assert "OUTPUT inserted.plant_id, inserted.recording_taken" in query
+    assert len(args) == 10
+    mock_connection.commit.assert_called_once()
+    assert high_water_marks[1] == pd.Timestamp('2024-11-01 10:00', tz='UTC')
+
+
+def test_upsert_recordings_skips_below_high_water_mark(mock_db_cursor, mock_connection, high_water_marks):
+    high_water_marks[1] = pd.Timestamp('2024-11-01 10:00', tz='UTC')
+    df = make_recordings([1, 2], ['2024-11-01 10:00', '2024-11-01 10:00'])
+    mock_db_cursor.fetchall.return_value = [
+        (2, datetime(2024, 11, 1, 10), datetime(2024, 11, 1, 10), 30.0, 20.0)]
+
+    counts = upsert_recordings(mock_connection, mock_db_cursor, df)
+
+    assert counts == {"inserted": 1, "skipped": 1}
+    assert mock_db_cursor.execute.call_args_list[0][0][1][0] == 2
+
+
+def test_upsert_recordings_updates_rollups(mock_db_cursor, mock_connection, high_water_marks):
+    df = make_recordings([2], ['2024-11-01 10:00'])
+    mock_db_cursor.fetchall.return_value = [
+        (2, datetime(2024, 11, 1, 10), datetime(2024, 11, 1, 10), 30.0, 20.0)]
+
+    upsert_recordings(mock_connection, mock_db_cursor, df)
+
+    merges = [call[0][0] for call in mock_db_cursor.execute.call_args_list[1:]]
+    assert len(merges) == 2
+    assert "MERGE recording_rollup_minute" in merges[0]
+    assert "MERGE recording_rollup_hour" in merges[1]
+    mock_connection.commit.assert_called_once()
+
+
+def test_upsert_recordings_no_rollups_when_nothing_inserted(mock_db_cursor, mock_connection,
+                                                            high_water_marks):
+    df = make_recordings([2], ['2024-11-01 10:00'])
+    mock_db_cursor.fetchall.return_value = []
+
+    upsert_recordings(mock_connection, mock_db_cursor, df)
+
+    assert mock_db_cursor.execute.call_count == 1
+
+
+def test_upsert_recordings_nothing_new(mock_db_cursor, mock_connection, high_water_marks):
+    high_water_marks[1] = pd.Timestamp('2024-11-01 10:01', tz='UTC')
+    df = make_recordings([1], ['2024-11-01 10:00'])
+
+    counts = upsert_recordings(mock_connection, mock_db_cursor, df)
+
+    assert counts == {"inserted": 0, "skipped": 1}
+    mock_db_cursor.execute.assert_not_called()
+
+
+def test_upsert_recordings_rolls_back(mock_db_cursor, mock_connection, high_water_marks):
+    df = make_recordings([1], ['2024-11-01 10:00'])
+    mock_db_cursor.execute.side_effect = RuntimeError("deadlock")
+
+    with pytest.raises(RuntimeError):
+        upsert_recordings(mock_connection, mock_db_cursor, df)
+
+    mock_connection.rollback.assert_called_once()
+    assert high_water_marks == {}
+
+
+def test_load_high_water_marks(mock_db_cursor, high_water_marks):
+    mock_db_cursor.fetchall.return_value = [(3, datetime(2024, 11, 1, 9, 30))]
+
+    load_high_water_marks(mock_db_cursor)
+
+    assert high_water_marks == {3: pd.Timestamp('2024-11-01 09:30', tz='UTC')}
@@ -0,0 +1,73 @@
+# pylint: skip-file
+import json
+import pytest
+from unittest.mock import MagicMock
+from metrics import Metrics, LATENCY_BUCKETS
+
+
+@pytest.fixture
+def logged():
+    return []
+
+
+@pytest.fixture
+def metrics(logged):
+    return Metrics(log=logged.append)
+
+
+def test_stage_records_time_and_rows(metrics, logged):
+    for rows in (3, 5):
+        with metrics.stage("extract") as stage:
+            stage.count_rows(rows, rows - 1)
+
+    totals = metrics.summary()["stages"]["extract"]
+    assert totals["calls"] == 2
+    assert totals["rows_in"] == 8
+    assert totals["rows_out"] == 6
+    assert totals["seconds"] >= 0
+    assert [json.loads(line)["rows_in"] for line in logged] == [3, 5]
+
+
+def test_failed_stage_is_recorded_and_raised(metrics, logged):
+    with pytest.raises(ValueError):
+        with metrics.stage("load"):
+            raise ValueError("down")
+
+    assert metrics.summary()["stages"]["load"]["failures"] == 1
+    assert json.loads(logged[0]) == {"event": "stage", "stage": "load",
+                                     "seconds": json.loads(logged[0])["seconds"],
+                                     "rows_in": 0, "rows_out": 0, "failed": True}
+
+
+def test_latencies_fill_histogram_buckets(metrics):
+    for seconds in (0.01, 0.07, 0.09, 30):
+        metrics.record_latency(4, seconds)
+
+    latency = metrics.summary()["http_latency"]
+    assert latency["buckets"] == list(LATENCY_BUCKETS)
+    assert latency["per_plant"][4] == [1, 2, 0, 0, 0, 0, 0, 0, 1]
+
+
+def test_wrapped_cursor_counts_statements(metrics):
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [(1,)]
+    wrapped = metrics.wrap_cursor(cursor)
+
+    wrapped.execute("SELECT 1")
+    wrapped.executemany("INSERT", [(1,), (2,)])
+
+    assert wrapped.fetchall() == [(1,)]
+    assert metrics.summary()["db_round_trips"] == 2
+
+
+def test_reset_clears_the_run(metrics, logged):
+    metrics.record_latency(1, 0.2)
+    metrics.count_round_trips(3)
+    metrics.reset()
+
+    summary = metrics.log_summary("pipeline_run")
+
+    assert summary["stages"] == {}
+    assert summary["db_round_trips"] == 0
+    assert summary["peak_rss_kb"] > 0
+    assert json.loads(logged[-1])["event"] == "pipeline_run"
@@ -0,0 +1,48 @@
+# pylint: skip-file
+import pytest
+from unittest.mock import MagicMock
+from registry import PlantRegistry, shard_plant_ids
+
+
+def test_shard_plant_ids_are_disjoint_and_complete():
+    shards = [shard_plant_ids(range(51), index, 4) for index in range(4)]
+    all_ids = [plant_id for shard in shards for plant_id in shard]
+    assert sorted(all_ids) == list(range(51))
+    assert len(set(all_ids)) == 51
+
+
+def test_shard_plant_ids_invalid_shard():
+    with pytest.raises(ValueError):
+        shard_plant_ids(range(10), 2, 2)
+
+
+def test_missing_ids_only_probed_every_interval():
+    registry = PlantRegistry(max_plant_id=10, probe_interval=3)
+    first_run = registry.plant_ids()
+    assert 7 in first_run and 15 in first_run
+
+    registry.record_results(found_ids=[i for i in range(11) if i != 7],
+                            missing_ids=[7, 11, 12, 13, 14, 15])
+    assert registry.plant_ids() == [0, 1, 2, 3, 4, 5, 6, 8, 9, 10]
+    assert 7 not in registry.plant_ids()
+    assert 7 in registry.plant_ids()
+
+
+def test_found_id_is_no_longer_missing():
+    registry = PlantRegistry(max_plant_id=5, probe_interval=100)
+    registry.plant_ids()
+    registry.record_results(found_ids=[], missing_ids=[3])
+    registry.record_results(found_ids=[3], missing_ids=[])
+    assert 3 in registry.plant_ids()
+
+
+def test_seed_from_database_learns_higher_ids():
+    registry = PlantRegistry(max_plant_id=5, probe_interval=100)
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [(0,), (1,), (60,)]
+    registry.seed_from_database(cursor)
+    registry.plant_ids()
+
+    assert registry.seeded
+    assert registry.plant_ids()[-1] == 60
+    assert registry.plant_ids(shard_index=1, shard_count=2) == list(range(1, 61, 2))
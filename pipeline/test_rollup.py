@@ -0,0 +1,83 @@
+# pylint: skip-file
+import pytest
+import pandas as pd
+from datetime import datetime
+from unittest.mock import MagicMock
+from rollup import compute_rollups, get_merge_query, merge_rollups, update_rollups, ROLLUP_COLUMNS
+
+
+def make_inserted(rows):
+    return pd.DataFrame(rows, columns=["plant_id", "recording_taken", "last_watered",
+                                       "soil_moisture", "temperature"])
+
+
+def test_compute_rollups_minute_buckets():
+    inserted = make_inserted([
+        (1, pd.Timestamp("2024-11-01 10:00:10"), pd.Timestamp("2024-11-01 08:00"), 30.0, 20.0),
+        (1, pd.Timestamp("2024-11-01 10:00:50"), pd.Timestamp("2024-11-01 09:00"), 40.0, None),
+        (1, pd.Timestamp("2024-11-01 10:01:10"), pd.Timestamp("2024-11-01 09:00"), 50.0, 22.0),
+        (2, pd.Timestamp("2024-11-01 10:00:30"), None, None, None),
+    ])
+
+    rollups = compute_rollups(inserted, "1min")
+
+    assert rollups == [
+        (1, pd.Timestamp("2024-11-01 10:00"), 2, 2, 70.0, 30.0, 40.0, 1, 20.0, 20.0, 20.0,
+         pd.Timestamp("2024-11-01 09:00")),
+        (1, pd.Timestamp("2024-11-01 10:01"), 1, 1, 50.0, 50.0, 50.0, 1, 22.0, 22.0, 22.0,
+         pd.Timestamp("2024-11-01 09:00")),
+        (2, pd.Timestamp("2024-11-01 10:00"), 1, 0, 0.0, None, None, 0, 0.0, None, None, None),
+    ]
+
+
+def test_compute_rollups_hour_buckets():
+    inserted = make_inserted([
+        (1, pd.Timestamp("2024-11-01 10:00"), None, 30.0, 20.0),
+        (1, pd.Timestamp("2024-11-01 10:59"), None, 40.0, 24.0),
+    ])
+
+    rollups = compute_rollups(inserted, "1h")
+
+    assert len(rollups) == 1
+    assert rollups[0][:5] == (1, pd.Timestamp("2024-11-01 10:00"), 2, 2, 70.0)
+
+
+def test_get_merge_query_adds_onto_stored_buckets():
+    query = get_merge_query("recording_rollup_hour", 2)
+
+    assert "MERGE recording_rollup_hour WITH (HOLDLOCK)" in query
+    assert query.count("%s") == 2 * len(ROLLUP_COLUMNS)
+    assert "recording_count = r.recording_count + v.recording_count" in query
+    assert "soil_moisture_sum = r.soil_moisture_sum + v.soil_moisture_sum" in query
+    assert "WHEN NOT MATCHED THEN INSERT" in query
+
+
+def test_merge_rollups_chunks():
+    cursor = MagicMock()
+    rows = [tuple(range(len(ROLLUP_COLUMNS)))] * 5
+
+    merge_rollups(cursor, "recording_rollup_minute", rows, chunk_size=2)
+
+    assert cursor.execute.call_count == 3
+    assert len(cursor.execute.call_args_list[0][0][1]) == 2 * len(ROLLUP_COLUMNS)
+    assert len(cursor.execute.call_args_list[2][0][1]) == len(ROLLUP_COLUMNS)
+
+
+def test_update_rollups_merges_every_table():
+    cursor = MagicMock()
+
+    update_rollups(cursor, [(1, datetime(2024, 11, 1, 10, 0, 30), None, 30.0, 20.0)])
+
+    queries = [call[0][0] for call in cursor.execute.call_args_list]
+    assert len(queries) == 2
+    assert "recording_rollup_minute" in queries[0]
+    assert "recording_rollup_hour" in queries[1]
+    assert cursor.execute.call_args_list[1][0][1][1] == pd.Timestamp("2024-11-01 10:00")
+
+
+def test_update_rollups_nothing_inserted():
+    cursor = MagicMock()
+
+    update_rollups(cursor, [])
+
+    cursor.execute.assert_not_called()
@@ -0,0 +1,113 @@
+# pylint: skip-file
+import queue
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock
+import stream
+
+
+def make_record(plant_id):
+    return {"plant_id": plant_id, "plant_name": "cactus", "soil_moisture": 50.0,
+            "temperature": 20.0, "recording_taken": "2024-11-25 12:00:00",
+            "last_watered": "2024-11-25 09:00:00"}
+
+
+def fake_iter_plant_data(plant_ids, max_workers=None):
+    for plant_id in plant_ids:
+        time.sleep(0.01)
+        yield plant_id, None if plant_id == 3 else make_record(plant_id)
+
+
+@pytest.fixture
+def pipeline(mocker):
+    mocker.patch("stream.etl.get_live_connection", return_value=MagicMock())
+    mocker.patch("stream.load.initialise_state")
+    mocker.patch("stream.extract.get_client", return_value=MagicMock())
+    mocker.patch("stream.extract.record_run_results")
+    mocker.patch("stream.extract.REGISTRY.plant_ids", return_value=list(range(10)))
+    mocker.patch("stream.extract.iter_plant_data", side_effect=fake_iter_plant_data)
+    loaded = []
+
+    def load_dataframe(connection, cursor, dataframe):
+        loaded.append(list(dataframe["plant_id"]))
+        return {"inserted": len(dataframe), "skipped": 0}
+
+    mocker.patch("stream.load.load_dataframe", side_effect=load_dataframe)
+    return loaded
+
+
+def test_run_stream_loads_micro_batches(pipeline):
+    report = stream.run_stream(batch_size=4, batch_wait=5, queue_size=1)
+
+    assert pipeline == [[0, 1, 2, 4], [5, 6, 7, 8], [9]]
+    assert report["batches"] == 3
+    assert report["inserted"] == 9
+    assert report["timings"]["first_load"] < report["timings"]["total"]
+    stream.extract.record_run_results.assert_called_once()
+    assert report["metrics"]["stages"]["extract"]["rows_in"] == 10
+    assert report["metrics"]["stages"]["extract"]["rows_out"] == 9
+
+
+def test_partial_batch_is_sent_after_batch_wait():
+    records, batches, stop = queue.Queue(), queue.Queue(), threading.Event()
+    thread = threading.Thread(target=stream.transform_stage,
+                              args=(records, batches, stop, 10, 0.05))
+    thread.start()
+    records.put(make_record(1))
+    records.put(make_record(2))
+
+    batch = batches.get(timeout=1)
+    records.put(stream.DONE)
+    thread.join(timeout=1)
+
+    assert list(batch["plant_id"]) == [1, 2]
+    assert batches.get(timeout=1) is stream.DONE
+
+
+def test_full_queue_holds_back_the_extract_stage(mocker):
+    mocker.patch("stream.extract.get_client", return_value=MagicMock())
+    mocker.patch("stream.extract.record_run_results")
+    mocker.patch("stream.extract.iter_plant_data", side_effect=fake_iter_plant_data)
+    records, stop = queue.Queue(maxsize=2), threading.Event()
+    thread = threading.Thread(target=stream.extract_stage,
+                              args=([0, 1, 2, 4, 5], records, stop))
+    thread.start()
+
+    time.sleep(0.2)
+    assert records.qsize() == 2
+    assert thread.is_alive()
+    stop.set()
+    thread.join(timeout=1)
+    assert not thread.is_alive()
+
+
+def test_load_error_stops_every_stage(pipeline, mocker):
+    mocker.patch("stream.load.load_dataframe", side_effect=RuntimeError("deadlock"))
+    threads = threading.active_count()
+
+    with pytest.raises(RuntimeError, match="deadlock"):
+        stream.run_stream(batch_size=2, batch_wait=5, queue_size=1)
+
+    assert threading.active_count() <= threads
+
+
+def test_transform_error_is_raised(pipeline, mocker):
+    mocker.patch("stream.transform.transform_dataframe", side_effect=ValueError("bad row"))
+
+    with pytest.raises(ValueError, match="bad row"):
+        stream.run_stream(batch_size=2, batch_wait=5, queue_size=1)
+
+    assert pipeline == []
+
+
+def test_worker_keeps_polling_after_a_failed_run(mocker):
+    run_stream = mocker.patch("stream.run_stream",
+                              side_effect=[RuntimeError("down"), {}, {}])
+    sleep = mocker.patch("stream.time.sleep")
+
+    stream.run_worker(cadence=30, max_runs=3)
+
+    assert run_stream.call_count == 3
+    assert sleep.call_count == 2
+    assert 29 < sleep.call_args[0][0] <= 30
@@ -1,8 +1,11 @@
 # pylint: skip-file
+import random
+import string
 import pytest
+import numpy as np
 import pandas as pd
-from pandas.testing import assert_frame_equal
-from transform import convert_columns_to_datetime, clean_name
+from pandas.testing import assert_frame_equal, assert_series_equal
+from transform import convert_columns_to_datetime, clean_name, clean_names, apply_column_schema
 
 
 def test_convert_columns_to_datetime():
@@ -48,3 +51,48 @@ def test_convert_columns_to_datetime():
 )
 def test_clean_name(input_name, expected_output):
     assert clean_name(input_name) == expected_output
+
+
+def test_apply_column_schema_reports_failures():
+    dataframe = pd.DataFrame({
+        "recording_taken": ["2024-11-25 15:30:00", "2024-11-25T16:30:00+01:00", "invalid_date", None],
+        "last_watered": ["Mon, 25 Nov 2024 14:03:04 GMT", None, "2024-11-25 12:00:00", "never"],
+        "soil_moisture": ["20.5", 30, "wet", None],
+    })
+
+    report = apply_column_schema(dataframe)
+
+    assert report == {
+        "recording_taken": {"failures": 1, "null_violations": 1},
+        "last_watered": {"failures": 1, "null_violations": 0},
+        "soil_moisture": {"failures": 1, "null_violations": 0},
+    }
+    assert dataframe["recording_taken"].tolist()[:2] == [
+        pd.Timestamp("2024-11-25 15:30:00", tz="UTC"),
+        pd.Timestamp("2024-11-25 15:30:00", tz="UTC")]
+    assert dataframe["last_watered"].iloc[0] == pd.Timestamp("2024-11-25 14:03:04", tz="UTC")
+    assert dataframe["last_watered"].iloc[2] == pd.Timestamp("2024-11-25 12:00:00", tz="UTC")
+    assert dataframe["soil_moisture"].tolist()[:2] == [20.5, 30.0]
+
+
+def random_names(seed, size):
+    """Random corpus of messy names, with repeats and missing values"""
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + " !@#-'\t"
+    distinct = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+                for _ in range(rng.randint(1, 10))]
+    return [rng.choice(distinct + [None, np.nan]) for _ in range(size)]
+
+
+@pytest.mark.parametrize("seed", range(25))
+@pytest.mark.parametrize("dtype", [object, str])
+def test_clean_names_matches_clean_name(seed, dtype):
+    names = pd.Series(random_names(seed, seed * 4), dtype=dtype,
+                      name="plant_name", index=range(3, 3 + seed * 4))
+    assert_series_equal(clean_names(names), names.apply(clean_name))
+
+
+@pytest.mark.parametrize("values", [[], [None, None], ["Cactus", 12], [1.5, None]])
+def test_clean_names_matches_clean_name_edge_cases(values):
+    names = pd.Series(values, dtype=object)
+    assert_series_equal(clean_names(names), names.apply(clean_name))
@@ -1,30 +1,72 @@
 """Script that will ensure the data follows the database schema."""
 import re
+import numpy as np
 import pandas as pd
 from extract import load_into_dataframe
+from metrics import METRICS
+
+
+COLUMN_SCHEMA = {
+    "recording_taken": {"dtype": "datetime", "format": "%Y-%m-%d %H:%M:%S",
+                        "timezone": "UTC", "nullable": False},
+    "last_watered": {"dtype": "datetime", "format": "%a, %d %b %Y %H:%M:%S %Z",
+                     "timezone": "UTC", "nullable": True},
+    "soil_moisture": {"dtype": "float", "nullable": True},
+    "temperature": {"dtype": "float", "nullable": True},
+}
+DATETIME_COLUMNS = ("recording_taken", "last_watered")
+
+
+def coerce_datetime_column(values: pd.Series, column_schema: dict) -> pd.Series:
+    """Parses a column to datetimes in the schema's timezone.
+       Tries the schema's format first, and only falls back to generic
+       parsing for the values that did not match it."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        parsed = pd.to_datetime(values, utc=True)
+    else:
+        parsed = pd.to_datetime(values, format=column_schema.get("format"),
+                                errors='coerce', utc=True)
+        unmatched = parsed.isna() & values.notna()
+        if unmatched.any():
+            parsed.loc[unmatched] = pd.to_datetime(values[unmatched], format='mixed',
+                                                   errors='coerce', utc=True)
+    return parsed.dt.tz_convert(column_schema["timezone"])
+
+
+def coerce_column(values: pd.Series, column_schema: dict) -> pd.Series:
+    """Coerces a column to the dtype given in its schema."""
+    if column_schema["dtype"] == "datetime":
+        return coerce_datetime_column(values, column_schema)
+    if column_schema["dtype"] == "float":
+        return pd.to_numeric(values, errors='coerce').astype(float)
+    raise ValueError(f"Unsupported dtype {column_schema['dtype']}")
+
+
+def apply_column_schema(dataframe: pd.DataFrame, schema: dict = None) -> dict:
+    """Coerces each column in the schema once, in place.
+       Returns the number of values per column that could not be coerced,
+       and the number of nulls in columns that are not nullable."""
+    report = {}
+    for column, column_schema in (schema or COLUMN_SCHEMA).items():
+        if column not in dataframe:
+            continue
+        values = dataframe[column]
+        coerced = coerce_column(values, column_schema)
+        failures = int((coerced.isna() & values.notna()).sum())
+        null_violations = 0 if column_schema["nullable"] else int(values.isna().sum())
+        dataframe[column] = coerced
+        report[column] = {"failures": failures, "null_violations": null_violations}
+        if failures or null_violations:
+            print(f"Column {column}: {failures} values could not be coerced to "
+                  f"{column_schema['dtype']}, {null_violations} unexpected nulls")
+    return report
 
 
 def convert_columns_to_datetime(dataframe: pd.DataFrame) -> pd.DataFrame:
     """Converts recording_taken and last_watered
        To type datetime."""
-    dataframe['recording_taken'] = pd.to_datetime(
-        dataframe['recording_taken'], errors='coerce')
-    if dataframe['recording_taken'].dt.tz is None:
-        dataframe['recording_taken'] = dataframe['recording_taken'].dt.tz_localize(
-            'UTC')
-    else:
-        dataframe['recording_taken'] = dataframe['recording_taken'].dt.tz_convert(
-            'UTC')
-
-    dataframe['last_watered'] = pd.to_datetime(
-        dataframe['last_watered'], errors='coerce')
-    if dataframe['last_watered'].dt.tz is None:
-        dataframe['last_watered'] = dataframe['last_watered'].dt.tz_localize(
-            'UTC')
-    else:
-        dataframe['last_watered'] = dataframe['last_watered'].dt.tz_convert(
-            'UTC')
-
+    apply_column_schema(dataframe, {column: COLUMN_SCHEMA[column]
+                                    for column in DATETIME_COLUMNS})
     return dataframe
 
 
@@ -37,18 +79,39 @@ def clean_name(name: str) -> str:
     return name
 
 
+def clean_names(names: pd.Series) -> pd.Series:
+    """Gives the same result as names.apply(clean_name), but only cleans
+       each distinct name once and maps the results back onto the rows."""
+    if names.empty:
+        return names.copy()
+    codes, unique_names = pd.factorize(names)
+    cleaned_names = np.array([clean_name(name) for name in unique_names], dtype=object)
+    values = names.to_numpy(dtype=object, copy=True)
+    has_name = codes >= 0
+    values[has_name] = cleaned_names[codes[has_name]]
+    return pd.Series(values, index=names.index, name=names.name, dtype=object).infer_objects()
+
+
 def clean_plant_names(dataframe: pd.DataFrame) -> pd.DataFrame:
     """Cleans the name of all values within the plant_name column."""
-    dataframe["plant_name"] = dataframe['plant_name'].apply(clean_name)
+    dataframe["plant_name"] = clean_names(dataframe['plant_name'])
     return dataframe
 
 
-def main() -> pd.DataFrame:
+def transform_dataframe(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """Coerces the schema columns and cleans the plant names of extracted data."""
+    with METRICS.stage("transform") as stage:
+        rows_in = len(dataframe)
+        apply_column_schema(dataframe)
+        dataframe = clean_plant_names(dataframe)
+        stage.count_rows(rows_in, len(dataframe))
+        return dataframe
+
+
+def main(shard_index: int = 0, shard_count: int = 1) -> pd.DataFrame:
     """Calls all of the above functions"""
-    dataframe = load_into_dataframe()
-    convert_columns_to_datetime(dataframe)
-    dataframe = clean_plant_names(dataframe)
-    return dataframe
+    dataframe = load_into_dataframe(shard_index=shard_index, shard_count=shard_count)
+    return transform_dataframe(dataframe)
 
 
 if __name__ == "__main__":
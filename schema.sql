@@ -4,6 +4,8 @@ GO
 
 SET DATEFORMAT dmy;
 
+IF OBJECT_ID('beta.recording_rollup_minute', 'U') IS NOT NULL DROP TABLE beta.recording_rollup_minute;
+IF OBJECT_ID('beta.recording_rollup_hour', 'U') IS NOT NULL DROP TABLE beta.recording_rollup_hour;
 IF OBJECT_ID('beta.recording', 'U') IS NOT NULL DROP TABLE beta.recording;
 IF OBJECT_ID('beta.plant', 'U') IS NOT NULL DROP TABLE beta.plant;
 IF OBJECT_ID('beta.country', 'U') IS NOT NULL DROP TABLE beta.country;
@@ -50,6 +52,42 @@ CREATE TABLE beta.recording (
     CONSTRAINT FK_recording_plant FOREIGN KEY (plant_id) REFERENCES beta.plant(plant_id)
 );
 
+CREATE INDEX IX_recording_plant_taken ON beta.recording (plant_id, recording_taken);
+
+CREATE TABLE beta.recording_rollup_minute (
+    plant_id SMALLINT NOT NULL,
+    bucket_start DATETIME NOT NULL,
+    recording_count INT NOT NULL,
+    soil_moisture_count INT NOT NULL,
+    soil_moisture_sum FLOAT NOT NULL,
+    soil_moisture_min FLOAT,
+    soil_moisture_max FLOAT,
+    temperature_count INT NOT NULL,
+    temperature_sum FLOAT NOT NULL,
+    temperature_min FLOAT,
+    temperature_max FLOAT,
+    last_watered DATETIME,
+    CONSTRAINT PK_recording_rollup_minute PRIMARY KEY (plant_id, bucket_start),
+    CONSTRAINT FK_recording_rollup_minute_plant FOREIGN KEY (plant_id) REFERENCES beta.plant(plant_id)
+);
+
+CREATE TABLE beta.recording_rollup_hour (
+    plant_id SMALLINT NOT NULL,
+    bucket_start DATETIME NOT NULL,
+    recording_count INT NOT NULL,
+    soil_moisture_count INT NOT NULL,
+    soil_moisture_sum FLOAT NOT NULL,
+    soil_moisture_min FLOAT,
+    soil_moisture_max FLOAT,
+    temperature_count INT NOT NULL,
+    temperature_sum FLOAT NOT NULL,
+    temperature_min FLOAT,
+    temperature_max FLOAT,
+    last_watered DATETIME,
+    CONSTRAINT PK_recording_rollup_hour PRIMARY KEY (plant_id, bucket_start),
+    CONSTRAINT FK_recording_rollup_hour_plant FOREIGN KEY (plant_id) REFERENCES beta.plant(plant_id)
+);
+
 
 INSERT INTO beta.species 
     (plant_name)